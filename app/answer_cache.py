@@ -0,0 +1,172 @@
+"""
+Semantic answer cache in front of the Fireworks call.
+Near-identical questions ("what is CSRD" / "explain CSRD") are matched by cosine similarity of
+their embeddings. Entries are bounded (LRU), expire after a TTL, persist in SQLite across
+restarts and are dropped when the vector store is rebuilt (its build_id changes).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from app.metrics import counter, gauge
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "cache/answer_cache.sqlite")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "168")) * 3600
+
+CACHE_LOOKUPS = counter("answer_cache_lookups_total", "Semantic answer cache lookups by result (hit/miss)")
+CACHE_SAVED_SECONDS = counter("answer_cache_saved_seconds_total", "LLM latency avoided by answer cache hits")
+CACHE_EVICTIONS = counter("answer_cache_evictions_total", "Answer cache entries evicted by reason (lru/ttl/version)")
+CACHE_ENTRIES = gauge("answer_cache_entries", "Answers currently cached")
+
+
+class SemanticAnswerCache:
+    """embed_fn: question -> vector (the retriever's embedding model)"""
+
+    def __init__(self, embed_fn, version="", path=ANSWER_CACHE_PATH, threshold=ANSWER_CACHE_THRESHOLD,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_s=ANSWER_CACHE_TTL_S):
+        self.embed_fn = embed_fn
+        self.version = version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL,
+            question TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            answer TEXT NOT NULL,
+            index_version TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            latency_s REAL NOT NULL
+        )
+        """)
+
+        # Answers grounded in an older index are stale, as are expired ones
+        stale = self.db.execute("DELETE FROM answers WHERE index_version != ?", (version,)).rowcount
+        expired = self.db.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - ttl_s,)).rowcount
+        self.db.commit()
+        CACHE_EVICTIONS.inc(stale, reason="version")
+        CACHE_EVICTIONS.inc(expired, reason="ttl")
+
+        rows = self.db.execute(
+            "SELECT id, scope, question, embedding, answer, created_at, last_used, latency_s "
+            "FROM answers ORDER BY last_used DESC"
+        ).fetchall()
+        self._entries = {}
+        for row in rows[:max_entries]:
+            self._entries[row[0]] = {"scope": row[1], "question": row[2], "answer": row[4],
+                                     "created_at": row[5], "last_used": row[6], "latency_s": row[7]}
+        if len(rows) > max_entries:
+            self.db.executemany("DELETE FROM answers WHERE id = ?", [(row[0],) for row in rows[max_entries:]])
+            self.db.commit()
+        self._ids = list(self._entries)
+        self._matrix = (np.stack([np.frombuffer(row[3], dtype="float32") for row in rows[:max_entries]])
+                        if self._ids else None)
+        CACHE_ENTRIES.set(len(self._ids))
+        print(f"♻️ Answer cache: {len(self._ids)} entries loaded ({stale} invalidated by index version, {expired} expired)")
+
+    @staticmethod
+    def _normalise(vector):
+        vector = np.asarray(vector, dtype="float32")
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remove(self, entry_id):
+        position = self._ids.index(entry_id)
+        self._ids.pop(position)
+        self._matrix = np.delete(self._matrix, position, axis=0) if self._ids else None
+        del self._entries[entry_id]
+        self.db.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+
+    def get(self, question, scope=""):
+        """Cached answer for a semantically equivalent question in the same scope, else None"""
+        vector = self._normalise(self.embed_fn(question))
+        now = time.time()
+        with self._lock:
+            if self._matrix is None:
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            similarities = self._matrix @ vector
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.threshold:
+                    break
+                entry_id = self._ids[position]
+                entry = self._entries[entry_id]
+                if entry["scope"] != scope:
+                    continue
+                if now - entry["created_at"] > self.ttl_s:
+                    self._remove(entry_id)
+                    CACHE_EVICTIONS.inc(reason="ttl")
+                    CACHE_ENTRIES.set(len(self._ids))
+                    break
+                entry["last_used"] = now
+                self.db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, entry_id))
+                self.db.commit()
+                CACHE_LOOKUPS.inc(result="hit")
+                CACHE_SAVED_SECONDS.inc(entry["latency_s"])
+                print(f"♻️ Answer cache hit (similarity {similarities[position]:.3f} to \"{entry['question'][:60]}\")")
+                return entry["answer"]
+        CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def put(self, question, answer, scope="", latency_s=0.0):
+        vector = self._normalise(self.embed_fn(question))
+        now = time.time()
+        with self._lock:
+            while len(self._ids) >= self.max_entries:
+                oldest = min(self._ids, key=lambda entry_id: self._entries[entry_id]["last_used"])
+                self._remove(oldest)
+                CACHE_EVICTIONS.inc(reason="lru")
+
+            cursor = self.db.execute(
+                "INSERT INTO answers (scope, question, embedding, answer, index_version, created_at, last_used, latency_s) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, question, vector.tobytes(), answer, self.version, now, now, latency_s),
+            )
+            self.db.commit()
+            self._entries[cursor.lastrowid] = {"scope": scope, "question": question, "answer": answer,
+                                               "created_at": now, "last_used": now, "latency_s": latency_s}
+            self._ids.append(cursor.lastrowid)
+            row = vector.reshape(1, -1)
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+            CACHE_ENTRIES.set(len(self._ids))
+
+    def stats(self):
+        hits, misses = CACHE_LOOKUPS.value(result="hit"), CACHE_LOOKUPS.value(result="miss")
+        return {
+            "entries": len(self._ids),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "saved_s": CACHE_SAVED_SECONDS.value(),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Process-wide cache on the retriever's embedding model (None if disabled or there is no index)"""
+    global _cache
+    if _cache is None and ANSWER_CACHE_ENABLED:
+        with _cache_lock:
+            if _cache is None:
+                from app.retriever import get_retriever
+
+                retriever = get_retriever()
+                if retriever.available:
+                    _cache = SemanticAnswerCache(retriever.embed_query, version=retriever.store.version)
+    return _cache
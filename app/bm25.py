@@ -0,0 +1,226 @@
+"""
+On-disk BM25 index over the vector store's chunk IDs.
+Exact identifiers ("ESRS E1-6", "GRI 305", article numbers, country names) are often missed by
+the MiniLM embedding; this lexical leg is fused with vector search in app/retriever.py.
+
+Layout (inside the vector store directory):
+    store.sqlite / bm25_terms     term -> sorted int64 chunk ids + uint16 term frequencies (packed blobs)
+    store.sqlite / bm25_segments  (term, segment) -> postings of one flush, not yet merged
+    bm25_doclens.u32              token count per chunk, row i = chunk id i (memory-mapped)
+
+New chunks are buffered; each flush writes its postings as a new segment (no existing blob is read),
+and finalize() merges every term's segments into its blob once. Deleted chunks are masked at query
+time (their document frequencies stay counted until the next full rebuild, as in Lucene segments).
+"""
+
+import math
+import os
+import re
+import time
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+DOCLEN_FILE = "bm25_doclens.u32"
+BM25_K1 = 1.2
+BM25_B = 0.75
+FLUSH_POSTINGS = 1_000_000  # buffered (term, chunk) pairs before merging into SQLite
+
+# Unicode words, keeping identifiers like e1-6, 2022/2464 or 8.2 together
+TOKEN_RE = re.compile(r"[^\W_]+(?:[-./][^\W_]+)*")
+PART_RE = re.compile(r"[-./]")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the their this to was were
+which will with shall may must not no any all such other than these those into under
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased terms; compound identifiers also index their parts (e1-6 -> e1-6, e1, 6)"""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():  # compound identifier (cheaper than another regex pass)
+            tokens.extend(part for part in PART_RE.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """Lexical index sharing the vector store's SQLite connection, ids and store_info"""
+
+    def __init__(self, path, db, info, lock):
+        self.path = path
+        self.db = db
+        self.info = info
+        self.lock = lock
+        self._pending = defaultdict(lambda: (array("q"), array("H")))
+        self._pending_count = 0
+        self._doclens = None
+        self.stats = {"chunks": 0, "index_s": 0.0}
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS bm25_terms (
+            term TEXT PRIMARY KEY,
+            ids BLOB NOT NULL,
+            tfs BLOB NOT NULL
+        ) WITHOUT ROWID
+        """)
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS bm25_segments (
+            term TEXT NOT NULL,
+            segment INTEGER NOT NULL,
+            ids BLOB NOT NULL,
+            tfs BLOB NOT NULL,
+            PRIMARY KEY (term, segment)
+        ) WITHOUT ROWID
+        """)
+        self._segment = None
+
+    @property
+    def available(self):
+        return "bm25_avgdl" in self.info
+
+    # ------------------------------------------------------------------ write side
+
+    def add(self, ids, texts):
+        start = time.perf_counter()
+        lengths = array("I")
+        for vector_id, text in zip(ids, texts):
+            tokens = tokenize(text)
+            lengths.append(min(len(tokens), 2 ** 32 - 1))
+            for term, tf in Counter(tokens).items():
+                term_ids, term_tfs = self._pending[term]
+                term_ids.append(int(vector_id))
+                term_tfs.append(min(tf, 65535))
+            self._pending_count += len(tokens)
+
+        # Like vectors.f32, row i is chunk i; ids of one add() call are consecutive
+        doclen_path = os.path.join(self.path, DOCLEN_FILE)
+        with open(doclen_path, "r+b" if os.path.exists(doclen_path) else "wb") as f:
+            for vector_id, length in zip(ids, lengths):
+                f.seek(int(vector_id) * 4)
+                f.write(length.to_bytes(4, "little"))
+        self._doclens = None
+
+        self.stats["chunks"] += len(lengths)
+        if self._pending_count >= FLUSH_POSTINGS:
+            self.flush()
+        self.stats["index_s"] += time.perf_counter() - start
+
+    def flush(self):
+        """Write buffered postings as a new segment; writes are proportional to the buffer, not the index"""
+        if not self._pending:
+            return
+        start = time.perf_counter()
+        if self._segment is None:
+            self._segment = self.db.execute("SELECT COALESCE(MAX(segment), -1) + 1 FROM bm25_segments").fetchone()[0]
+        self.db.executemany(
+            "INSERT INTO bm25_segments (term, segment, ids, tfs) VALUES (?, ?, ?, ?)",
+            ((term, self._segment, term_ids.tobytes(), term_tfs.tobytes())
+             for term, (term_ids, term_tfs) in self._pending.items()),
+        )
+        self._segment += 1
+        self._pending.clear()
+        self._pending_count = 0
+        self.stats["index_s"] += time.perf_counter() - start
+
+    def _merge_segments(self, batch=10_000):
+        """
+        Append each term's segments (in flush order) to its blob, so every blob is rewritten once.
+        Works through the terms in ranges, dropping a range's segments before writing its blobs so
+        SQLite reuses the freed pages instead of growing the file by the size of all segments.
+        """
+        last = ""
+        while True:
+            terms = [row[0] for row in self.db.execute(
+                "SELECT DISTINCT term FROM bm25_segments WHERE term > ? ORDER BY term LIMIT ?", (last, batch))]
+            if not terms:
+                break
+            first, last = terms[0], terms[-1]
+            parts = defaultdict(list)
+            for term, ids_blob, tfs_blob in self.db.execute(
+                    "SELECT term, ids, tfs FROM bm25_segments WHERE term BETWEEN ? AND ? ORDER BY term, segment",
+                    (first, last)):
+                parts[term].append((ids_blob, tfs_blob))
+            old = dict((row[0], row[1:]) for row in self.db.execute(
+                "SELECT term, ids, tfs FROM bm25_terms WHERE term BETWEEN ? AND ?", (first, last)))
+            self.db.execute("DELETE FROM bm25_segments WHERE term BETWEEN ? AND ?", (first, last))
+
+            rows = []
+            for term, term_parts in parts.items():
+                if term in old:
+                    term_parts.insert(0, old[term])
+                ids = np.concatenate([np.frombuffer(part[0], dtype="int64") for part in term_parts])
+                tfs = np.concatenate([np.frombuffer(part[1], dtype="uint16") for part in term_parts])
+                # New ids are always larger, so this only sorts after re-added ids
+                if np.any(np.diff(ids) < 0):
+                    order = np.argsort(ids, kind="stable")
+                    ids, tfs = ids[order], tfs[order]
+                rows.append((term, ids.tobytes(), tfs.tobytes()))
+            self.db.executemany("INSERT OR REPLACE INTO bm25_terms (term, ids, tfs) VALUES (?, ?, ?)", rows)
+        self._segment = 0
+
+    def finalize(self, live_ids):
+        """Flush, merge the segments and record corpus statistics (chunk count, average length) for scoring"""
+        start = time.perf_counter()
+        self.flush()
+        self._merge_segments()
+        self.stats["index_s"] += time.perf_counter() - start
+        lengths = self.doclens()[live_ids] if len(live_ids) else np.zeros(1)
+        self.info["bm25_docs"] = str(len(live_ids))
+        self.info["bm25_avgdl"] = str(float(max(lengths.mean(), 1.0)))
+
+    # ------------------------------------------------------------------ read side
+
+    def doclens(self):
+        if self._doclens is None:
+            self._doclens = np.memmap(os.path.join(self.path, DOCLEN_FILE), dtype="uint32", mode="r")
+        return self._doclens
+
+    def search(self, query, k=20, candidates=None, deleted=None):
+        """Top-k (chunk id, BM25 score); candidates / deleted are sorted id arrays to keep / drop"""
+        terms = sorted(set(tokenize(query)))
+        if not terms or not self.available:
+            return []
+        n_docs = int(self.info["bm25_docs"])
+        avgdl = float(self.info["bm25_avgdl"])
+
+        with self.lock:
+            # Segments are only left unmerged by an interrupted build; their postings still count
+            placeholders = ",".join("?" * len(terms))
+            rows = self.db.execute(
+                f"SELECT ids, tfs FROM bm25_terms WHERE term IN ({placeholders}) "
+                f"UNION ALL SELECT ids, tfs FROM bm25_segments WHERE term IN ({placeholders})", terms + terms
+            ).fetchall()
+        if not rows:
+            return []
+
+        doclens = self.doclens()
+        all_ids, all_scores = [], []
+        for ids_blob, tfs_blob in rows:
+            ids = np.frombuffer(ids_blob, dtype="int64")
+            tfs = np.frombuffer(tfs_blob, dtype="uint16").astype("float32")
+            # df may still count deleted chunks, so clamp rather than go negative
+            idf = math.log(1 + (max(n_docs - len(ids), 0) + 0.5) / (len(ids) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doclens[ids] / avgdl)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores)
+        keep = np.ones(len(ids), dtype=bool)
+        if candidates is not None:
+            keep &= np.isin(ids, candidates)
+        if deleted is not None and len(deleted):
+            keep &= ~np.isin(ids, deleted)
+        ids, scores = ids[keep], scores[keep]
+        if not len(ids):
+            return []
+
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        top = np.argpartition(-totals, min(k, len(totals)) - 1)[:k]
+        top = top[np.argsort(-totals[top])]
+        return [(int(unique_ids[i]), float(totals[i])) for i in top]
@@ -0,0 +1,48 @@
+"""
+PROCESS-LEVEL CHAIN REGISTRY
+The heavy objects (FAISS index, embedding model, LLM clients) are built once per process,
+pre-warmed at ASGI startup and shared by every Chainlit session. Per-session state such as
+chat history lives in cl.user_session and never on these objects.
+"""
+
+import threading
+import time
+
+from app.perf import rss_mb
+from app.rag_chain import load_rag_chain, load_gap_analysis_chain
+
+_chains = {}
+_lock = threading.Lock()
+
+
+def _get_or_build(name, factory):
+    chain = _chains.get(name)
+    if chain is None:
+        with _lock:
+            chain = _chains.get(name)
+            if chain is None:
+                chain = factory()
+                _chains[name] = chain
+    return chain
+
+
+def get_rag_chain():
+    """Shared Q&A chain (stateless per call, safe for concurrent sessions)"""
+    return _get_or_build("rag", lambda: load_rag_chain(use_ai=True))
+
+
+def get_gap_chain():
+    """Shared gap-analysis chain"""
+    return _get_or_build("gap", lambda: load_gap_analysis_chain(use_ai=True))
+
+
+def warm_up():
+    """Build every shared chain up front so no user session pays for it"""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    get_rag_chain()
+    get_gap_chain()
+    print(
+        f"🔥 Chain registry warmed in {time.perf_counter() - start:.2f}s "
+        f"(RSS {rss_mb():.0f}MB, +{rss_mb() - rss_before:.0f}MB)"
+    )
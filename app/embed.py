@@ -1,25 +1,38 @@
 import os
 from dotenv import load_dotenv
 import fitz  # PyMuPDF
-from sentence_transformers import SentenceTransformer
-from langchain.vectorstores import FAISS
 from langchain.docstore.document import Document
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.chat_models import ChatOpenAI
-from app.file_analysis import extract_text_by_page
-from app.utils import chunk_text
+from app.extraction import (
+    extract_and_chunk,
+    extract_text_by_page,
+    extract_text_from_docx,
+    extract_text_from_md,
+    get_meaningful_excerpt,
+    is_ingestable,
+)
+from app.index_writer import EMBED_BATCH_SIZE, StreamingIndexWriter
+from app.manifest import IndexManifest
+from app.vector_store import FAISS_INDEX_SPEC, LEGACY_INDEX_FILE, VectorStore
+from app.metadata_classifier import METADATA_CONCURRENCY, MetadataClassifier
+from app.perf import StageMeter
+from app.utils import iter_chunks
 from app.ingest import get_all_files
 import json
 import datetime
-
-from tqdm import tqdm
-
-from docx import Document as DocxDocument
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 load_dotenv()
 
+# Parallel ingest: processes used for extraction/chunking, and how many files may be
+# in flight ahead of the (single) embedding + index writer. 0 = 4 x workers.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "0"))
+
 RUN_LOG_DIR = "metadata_logs"
 os.makedirs(RUN_LOG_DIR, exist_ok=True)
 
@@ -77,52 +90,12 @@ Return your response as **valid JSON** with the fields:
 
 metadata_chain = LLMChain(llm=llm, prompt=metadata_prompt)
 
-# Load previously saved metadata logs (across all files)
-def load_previous_metadata(log_dir):
-    previous = {}
-    for fname in os.listdir(log_dir):
-        if fname.endswith(".jsonl"):
-            with open(os.path.join(log_dir, fname), "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        item = json.loads(line)
-                        if "source" in item and "llm_document_type" in item:
-                            previous[item["source"]] = item
-                    except:
-                        continue
-    return previous
-
-cached_metadata_by_path = load_previous_metadata(RUN_LOG_DIR)
-print(f"[CACHE LOAD] Found {len(cached_metadata_by_path)} cached metadata records.")
-
 def clean_metadata(metadata: dict) -> dict:
     return {
         k: v for k, v in metadata.items()
         if v not in ("unspecified", "unknown", "", None, [], {})
     }
 
-def extract_text_from_docx(path):
-    doc = DocxDocument(path)
-    return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-
-
-def extract_text_from_md(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
-    
-def get_meaningful_excerpt(pages, max_chars=3000):
-    filtered_pages = []
-    for num, text in pages[:5]:
-        if (
-            len(text) > 200 and
-            not ("table of contents" in text.lower() or "contents" in text.lower()) and
-            text.count('.') / max(len(text), 1) < 0.05  # crude filter for dotted TOCs
-        ):
-            filtered_pages.append(text)
-        if sum(len(p) for p in filtered_pages) >= max_chars:
-            break
-    return "\n".join(filtered_pages)[:max_chars]
-
 def infer_metadata_from_path(filepath: str) -> dict:
     path_parts = filepath.lower().split(os.sep)
 
@@ -217,130 +190,172 @@ def infer_metadata_from_path(filepath: str) -> dict:
 
 
 
-def embed_documents(data_path="data/raw_docs", index_path="vector_store/faiss_index"):
+def build_chunk_documents(filepath, chunks, llm_metadata, folder_metadata):
+    """One LangChain Document per chunk, carrying file, chunk, LLM and folder metadata"""
+    docs = []
+    for i, chunk in enumerate(chunks):
+        # Additional metadata from file/chunk
+        chunk_meta = {
+            "file_name": os.path.basename(filepath),
+            "file_extension": os.path.splitext(filepath)[1][1:].lower(),
+            "chunk_id": f"{os.path.basename(filepath)}_chunk_{i}",
+            "word_count": len(chunk.split())
+        }
+
+        combined_metadata = {
+            "source": filepath,
+            "chunk": i,
+            **chunk_meta,
+            **llm_metadata,
+            **folder_metadata
+        }
+
+        docs.append(Document(page_content=chunk, metadata=combined_metadata))
+    return docs
+
+
+def iter_extracted(filepaths, workers=INGEST_WORKERS, queue_depth=INGEST_QUEUE_DEPTH, max_tokens=512):
+    """
+    Yield extract_and_chunk() results. With workers > 1 a process pool parses files in
+    parallel, running at most queue_depth files ahead of the consumer (completion order).
+    """
+    if workers <= 1:
+        for filepath in filepaths:
+            yield extract_and_chunk(filepath, max_tokens)
+        return
+
+    queue_depth = queue_depth or workers * 4
+    files = iter(filepaths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(extract_and_chunk, fp, max_tokens) for fp in itertools.islice(files, queue_depth)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                next_file = next(files, None)
+                if next_file is not None:
+                    pending.add(pool.submit(extract_and_chunk, next_file, max_tokens))
+                yield future.result()
+
+
+def iter_windows(iterable, size):
+    """Consecutive lists of up to `size` items"""
+    iterator = iter(iterable)
+    while True:
+        window = list(itertools.islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+
+def embed_documents(data_path="data/raw_docs", index_path="vector_store/faiss_index",
+                    workers=INGEST_WORKERS, queue_depth=INGEST_QUEUE_DEPTH, batch_size=EMBED_BATCH_SIZE,
+                    full_rebuild=False, metadata_concurrency=METADATA_CONCURRENCY, index_spec=None):
     counter = 0
     print("Starting")
     print(datetime.datetime.now())
+    meter = StageMeter()
+
+    filepaths = []
+    for filepath in get_all_files(data_path):
+        if is_ingestable(filepath):
+            filepaths.append(filepath)
+        else:
+            print("\n%s\n%s\n%s" % ("*" * 100, f" Skipping {filepath} ".center(100), "*" * 100))
+
+    # Incremental: only added/changed files are extracted and embedded
+    manifest = IndexManifest(index_path)
+    index_exists = VectorStore.exists(index_path)
+    if full_rebuild or not index_exists:
+        if not index_exists and os.path.exists(os.path.join(index_path, LEGACY_INDEX_FILE)):
+            print(f"ℹ️ Found a pickled LangChain index in {index_path}. Convert it instead of re-embedding:")
+            print(f"   python -m app.vector_store --convert {index_path}")
+        manifest.reset()
+    with meter.measure("scan", files=len(filepaths)):
+        to_index, unchanged, deleted = manifest.diff(filepaths)
+    print(f"🗂️ Manifest: {len(to_index)} new/changed, {len(unchanged)} unchanged, {len(deleted)} deleted")
+
+    # An explicit index spec may change the index type, which is rebuilt from the stored vectors on save
+    if not to_index and not deleted and not index_spec:
+        print("✅ Index is up to date - nothing to do.")
+        manifest.save()
+        meter.report("Ingest")
+        return
+
+    print(f"⚙️ Extraction workers: {workers}, queue depth: {queue_depth or workers * 4}, embed batch: {batch_size}")
     model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    docs = []
+    writer = StreamingIndexWriter(model, index_path, batch_size=batch_size, append=bool(manifest.files),
+                                  index_spec=index_spec)
+
+    # Vectors of changed files are replaced, those of deleted files dropped
+    stale_ids = manifest.ids_for(to_index + deleted)
+    writer.delete(stale_ids)
+    for filepath in deleted:
+        manifest.forget(filepath)
+    if stale_ids:
+        print(f"🧹 Removed {len(stale_ids)} stale vectors")
+
+    # Extracted files are classified a window at a time so LLM calls overlap
+    classifier = MetadataClassifier(metadata_chain, concurrency=metadata_concurrency)
 
     with open(log_path, "w", encoding="utf-8") as metadata_log:
-        for filepath in get_all_files(data_path):
-            if filepath.endswith(".pdf") and not os.path.basename(filepath).startswith("~$"):
+        for window in iter_windows(iter_extracted(to_index, workers, queue_depth), metadata_concurrency * 2):
+            extracted = []
+            for result in window:
                 counter = counter + 1
-                print(f"{counter}. Processing {filepath}")
-                print(datetime.datetime.now())
-                try:
-                    with fitz.open(filepath) as pdf:
-                        text = "\n".join([page.get_text() for page in pdf])
-                except Exception as e:
-                    print(f"[ERROR] Skipping PDF {filepath}: {e}")
+                filepath = result["filepath"]
+                if "error" in result:
+                    print(f"[ERROR] Skipping {filepath}: {result['error']}")
                     print(datetime.datetime.now())
+                    manifest.forget(filepath)
                     continue
-            elif filepath.endswith(".docx") and not os.path.basename(filepath).startswith("~$"):
-                counter = counter + 1
-                print(f"{counter}. Processing {filepath}")
-                print(datetime.datetime.now())
-                try:
-                    text = extract_text_from_docx(filepath)
-                except Exception as e:
-                    print(f"[ERROR] Skipping DOCX {filepath}: {e}")
-                    print(datetime.datetime.now())
-                    continue
-            else:
-                counter = counter + 1
-                print("\n%s\n%s\n%s", "*" * 100, f" Skipping {filepath} ".center(100), "*" * 100)
-                print(datetime.datetime.now())
-                continue  # skip non-supported files
-
-            folder_metadata = infer_metadata_from_path(filepath)
-            # print("------------------- folder_metadata -------------------")
-            # folder_metadata = clean_metadata(folder_metadata)
-            # print(folder_metadata)
-
-            if filepath in cached_metadata_by_path:
-                metadata_fields = {
-                    "jurisdiction": cached_metadata_by_path[filepath].get("llm_jurisdiction", "unknown"),
-                    "document_type": cached_metadata_by_path[filepath].get("llm_document_type", "unspecified"),
-                    "themes": cached_metadata_by_path[filepath].get("llm_themes", ""),
-                }
-                print("[CACHE HIT] Using previous LLM metadata.")
-            else:
-                pages = extract_text_by_page(filepath)
-                intro = get_meaningful_excerpt(pages)
-                # print("------------------- intro -------------------")
-                # print(intro)
-                
-                response = metadata_chain.run(document_excerpt=intro, folder_document_type=folder_metadata.get("document_type", "unspecified"))
-                # print("------------------- response -------------------")
-                # print(response)
-
-                try:
-                    metadata_fields = json.loads(response)
-                    # metadata_fields = clean_metadata(metadata_fields)
-                except Exception:
-                    print(f"[WARNING] LLM returned invalid JSON for {filepath}")
-                    metadata_fields = {"jurisdiction": "unknown", "document_type": "unspecified", "themes": ""}
-                # print("------------------- metadata_fields -------------------")
-                # print(metadata_fields)
-
-            chunks = chunk_text(text, max_tokens=512)
-    # Clean and prefix LLM metadata
-            llm_metadata = {f"llm_{k}": v for k, v in metadata_fields.items()}
-            llm_metadata = clean_metadata(llm_metadata)
-
-            # Clean and prefix folder metadata
-            folder_metadata = {f"folder_{k}": v for k, v in folder_metadata.items()}
-            folder_metadata = clean_metadata(folder_metadata)
-
-            for i, chunk in enumerate(chunks):
-                # Additional metadata from file/chunk
-                chunk_meta = {
-                    "file_name": os.path.basename(filepath),
-                    "file_extension": os.path.splitext(filepath)[1][1:].lower(),
-                    "chunk_id": f"{os.path.basename(filepath)}_chunk_{i}",
-                    "word_count": len(chunk.split())
-                }
-
-                # Optional: add language detection if needed
-                # from langdetect import detect
-                # try:
-                #     chunk_meta["language"] = detect(chunk)
-                # except Exception:
-                #     chunk_meta["language"] = "unknown"
-
-                combined_metadata = {
-                    "source": filepath,
-                    "chunk": i,
-                    **chunk_meta,
-                    **llm_metadata,
-                    **folder_metadata
-                }
-
-                # print("------------------- combined_metadata -------------------")
-                # print(combined_metadata)
-
-
-                docs.append(Document(page_content=chunk, metadata=combined_metadata))
-
-                metadata_log.write(json.dumps(combined_metadata, ensure_ascii=False) + "\n")
-                
-            # if counter > 30:
-            #     break
 
+                meter.add("extract", result["seconds"], files=1, pages=result["pages"], chunks=len(result["chunks"]))
+                print(f"{counter}. Processing {filepath} ({result['pages']} pages, {len(result['chunks'])} chunks, {result['seconds']:.1f}s)")
+                extracted.append((result, infer_metadata_from_path(filepath)))
+            print(datetime.datetime.now())
+
+            with meter.measure("metadata", files=len(extracted)):
+                metadata_results = classifier.classify_many([
+                    (result["filepath"], result["excerpt"], folder_metadata.get("document_type", "unspecified"))
+                    for result, folder_metadata in extracted
+                ])
+
+            for (result, folder_metadata), metadata_fields in zip(extracted, metadata_results):
+                filepath = result["filepath"]
+
+                # Clean and prefix LLM metadata
+                llm_metadata = {f"llm_{k}": v for k, v in metadata_fields.items()}
+                llm_metadata = clean_metadata(llm_metadata)
+
+                # Clean and prefix folder metadata
+                folder_metadata = {f"folder_{k}": v for k, v in folder_metadata.items()}
+                folder_metadata = clean_metadata(folder_metadata)
+
+                # Embedded batch by batch as chunks arrive - no corpus-wide Document list
+                file_docs = build_chunk_documents(filepath, result["chunks"], llm_metadata, folder_metadata)
+                with meter.measure("embed", chunks=len(file_docs)):
+                    manifest.record(filepath, writer.add_documents(file_docs))
+                for doc in file_docs:
+                    metadata_log.write(json.dumps(doc.metadata, ensure_ascii=False) + "\n")
+
+    classifier.close()
+    with meter.measure("embed"):
+        saved = writer.save()
     print("Embeddings Generated")
     print(datetime.datetime.now())
-    db = FAISS.from_documents(docs, model)
-    db.save_local(index_path)
-    print("Saved")
+    if saved:
+        manifest.save()
+        print("Saved")
     print(datetime.datetime.now())
+    writer.report()
+    classifier.report()
+    meter.report("Ingest")
     print("Exit")
 
 
 def add_single_document_to_faiss(filepath: str, index_path="vector_store/faiss_index"):
-    # Load FAISS index
+    # Embedding model (the vector store itself is opened by the writer)
     model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    db = FAISS.load_local(index_path, model, allow_dangerous_deserialization=True)
 
     # Extract text
     try:
@@ -366,19 +381,11 @@ def add_single_document_to_faiss(filepath: str, index_path="vector_store/faiss_i
         pages = extract_text_by_page(filepath)
 
     intro = get_meaningful_excerpt(pages)
-    try:
-        response = metadata_chain.run(
-            document_excerpt=intro,
-            folder_document_type=folder_metadata.get("document_type", "unspecified")
-        )
-        metadata_fields = json.loads(response)
-    except Exception as e:
-        print(f"[WARNING] LLM metadata failed: {e}")
-        metadata_fields = {
-            "jurisdiction": "unknown",
-            "document_type": "unspecified",
-            "themes": ""
-        }
+    classifier = MetadataClassifier(metadata_chain)
+    metadata_fields = classifier.classify_many([
+        (filepath, intro, folder_metadata.get("document_type", "unspecified"))
+    ])[0]
+    classifier.close()
 
     # Clean metadata
     llm_metadata = {f"llm_{k}": v for k, v in metadata_fields.items()}
@@ -387,29 +394,17 @@ def add_single_document_to_faiss(filepath: str, index_path="vector_store/faiss_i
     folder_metadata = clean_metadata(folder_metadata)
 
     # Chunk and embed
-    chunks = chunk_text(text, max_tokens=512)
-    docs = []
-    for i, chunk in enumerate(chunks):
-        chunk_meta = {
-            "file_name": os.path.basename(filepath),
-            "file_extension": os.path.splitext(filepath)[1][1:].lower(),
-            "chunk_id": f"{os.path.basename(filepath)}_chunk_{i}",
-            "word_count": len(chunk.split())
-        }
-
-        combined_metadata = {
-            "source": filepath,
-            "chunk": i,
-            **chunk_meta,
-            **llm_metadata,
-            **folder_metadata
-        }
-
-        docs.append(Document(page_content=chunk, metadata=combined_metadata))
-
-    # Add to vector store and save
-    db.add_documents(docs)
-    db.save_local(index_path)
+    chunks = iter_chunks(text, max_tokens=512)
+    docs = build_chunk_documents(filepath, chunks, llm_metadata, folder_metadata)
+
+    # Add to vector store and save; a re-added file replaces its old vectors
+    writer = StreamingIndexWriter(model, index_path, append=VectorStore.exists(index_path))
+    manifest = IndexManifest(index_path)
+    writer.delete(manifest.ids_for([filepath]))
+    manifest.record(filepath, writer.add_documents(docs))
+    if writer.save():
+        # Recorded so the next incremental embed_documents run neither re-indexes nor orphans it
+        manifest.save()
     print(f"[DONE] Successfully added {len(docs)} chunks from {filepath} to FAISS index.")
 
     # Optional: log metadata
@@ -419,3 +414,24 @@ def add_single_document_to_faiss(filepath: str, index_path="vector_store/faiss_i
     with open(log_file, "w", encoding="utf-8") as f:
         for doc in docs:
             f.write(json.dumps(doc.metadata, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the FAISS index from data/raw_docs")
+    parser.add_argument("--data-path", default="data/raw_docs")
+    parser.add_argument("--index-path", default="vector_store/faiss_index")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="extraction processes (1 = serial)")
+    parser.add_argument("--queue-depth", type=int, default=INGEST_QUEUE_DEPTH, help="files in flight ahead of the writer")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks embedded per batch (caps memory)")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-index everything")
+    parser.add_argument("--metadata-concurrency", type=int, default=METADATA_CONCURRENCY,
+                        help="parallel LLM metadata classification calls")
+    parser.add_argument("--index-spec", default=None,
+                        help=f"flat | hnsw:M=32,efSearch=64 | ivf:nlist=256,nprobe=16 | ivfpq:... (default {FAISS_INDEX_SPEC})")
+    args = parser.parse_args()
+
+    embed_documents(args.data_path, args.index_path, workers=args.workers, queue_depth=args.queue_depth,
+                    batch_size=args.batch_size, full_rebuild=args.full,
+                    metadata_concurrency=args.metadata_concurrency, index_spec=args.index_spec)
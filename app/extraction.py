@@ -0,0 +1,100 @@
+"""
+Text extraction + chunking for ingest.
+Kept free of import-time side effects (no LLM clients, no log files) so it can run
+inside process-pool workers.
+"""
+
+import os
+import time
+
+import fitz  # PyMuPDF
+from docx import Document as DocxDocument
+
+from app.utils import iter_chunks
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+
+def extract_text_by_page(filepath: str):
+    _, ext = os.path.splitext(filepath.lower())
+    if ext == ".pdf":
+        with fitz.open(filepath) as doc:
+            return [(i + 1, page.get_text()) for i, page in enumerate(doc)]
+    elif ext == ".docx":
+        doc = DocxDocument(filepath)
+        full_text = []
+        for para in doc.paragraphs:
+            if para.text.strip():
+                full_text.append(para.text.strip())
+
+        # Simulate "pages" in docx by splitting every N lines
+        simulated_pages = []
+        lines_per_page = 30  # You can adjust this to better simulate page breaks
+        for i in range(0, len(full_text), lines_per_page):
+            page_text = "\n".join(full_text[i:i + lines_per_page])
+            simulated_pages.append((i // lines_per_page + 1, page_text))
+
+        return simulated_pages
+
+    else:
+        raise ValueError("Unsupported file format. Only PDF and DOCX are supported.")
+
+
+def extract_text_from_docx(path):
+    doc = DocxDocument(path)
+    return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
+
+
+def extract_text_from_md(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def get_meaningful_excerpt(pages, max_chars=3000):
+    filtered_pages = []
+    for num, text in pages[:5]:
+        if (
+            len(text) > 200 and
+            not ("table of contents" in text.lower() or "contents" in text.lower()) and
+            text.count('.') / max(len(text), 1) < 0.05  # crude filter for dotted TOCs
+        ):
+            filtered_pages.append(text)
+        if sum(len(p) for p in filtered_pages) >= max_chars:
+            break
+    return "\n".join(filtered_pages)[:max_chars]
+
+
+def is_ingestable(filepath: str) -> bool:
+    """Supported type and not an Office lock file (~$report.docx)"""
+    return filepath.endswith(SUPPORTED_EXTENSIONS) and not os.path.basename(filepath).startswith("~$")
+
+
+def extract_and_chunk(filepath: str, max_tokens=512):
+    """
+    Process-pool worker: parse one file, chunk it and pick the excerpt used for LLM
+    metadata classification. Returns a plain (picklable) dict; errors are returned, not raised.
+    """
+    start = time.perf_counter()
+    try:
+        if filepath.endswith(".pdf"):
+            # One parse serves both the full text and the per-page excerpt
+            pages = extract_text_by_page(filepath)
+            text = "\n".join(page_text for _, page_text in pages)
+        elif filepath.endswith(".docx"):
+            text = extract_text_from_docx(filepath)
+            pages = extract_text_by_page(filepath)
+        elif filepath.endswith(".md"):
+            text = extract_text_from_md(filepath)
+            pages = [(0, text)]
+        else:
+            raise ValueError("Unsupported file type")
+
+        return {
+            "filepath": filepath,
+            "chunks": list(iter_chunks(text, max_tokens=max_tokens)),
+            "pages": len(pages),
+            "excerpt": get_meaningful_excerpt(pages),
+            "seconds": time.perf_counter() - start,
+        }
+    except Exception as e:
+        return {"filepath": filepath, "error": str(e), "seconds": time.perf_counter() - start}
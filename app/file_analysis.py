@@ -1,16 +1,23 @@
 import asyncio
+import bisect
+import os
 import re
+import time
 from typing import List
 
-import fitz  # PyMuPDF for PDF handling
 import tiktoken
-from docx import Document as DocxDocument  # for DOCX support
-import os
 
 from langchain.text_splitter import TokenTextSplitter
 from langchain.prompts import PromptTemplate
 from langchain_community.chat_models import ChatOpenAI
 
+from app.extraction import extract_text_by_page
+from app.gap_cache import GAP_CACHE_UPLOAD_HIT_RATIO, file_hash, get_gap_cache, section_key
+from app.gap_scheduler import get_gap_scheduler
+from app.llm_usage import record_response_usage
+from app.metrics import counter, histogram
+from app.utils import iter_anchored_windows, iter_token_windows
+
 def clean_output(report_text: str) -> str:
     # Remove 'Standards Referenced' section if it says 'No specific standards referenced.'
     pattern = r"\*\*Standards Referenced:\*\*\s*[-–•]\s*No specific standards referenced\.?\s*"
@@ -24,36 +31,25 @@ def extract_page_number(text):
     match = re.search(r"\[Page (\d+)\]", text)
     return int(match.group(1)) if match else float("inf")  # or 0 if you want such entries first
 
-semaphore = asyncio.Semaphore(5)  # Limit to 5 concurrent API calls
-
 # Tunables
 CHUNK_SIZE = 1024
 OVERLAP = 50
 MAX_TOKENS = 12000  # limit for GPT-3.5-turbo context
-
-def extract_text_by_page(filepath: str):
-    _, ext = os.path.splitext(filepath.lower())
-    if ext == ".pdf":
-        doc = fitz.open(filepath)
-        return [(i + 1, page.get_text()) for i, page in enumerate(doc)]
-    elif ext == ".docx":
-        doc = DocxDocument(filepath)
-        full_text = []
-        for para in doc.paragraphs:
-            if para.text.strip():
-                full_text.append(para.text.strip())
-        
-        # Simulate "pages" in docx by splitting every N lines
-        simulated_pages = []
-        lines_per_page = 30  # You can adjust this to better simulate page breaks
-        for i in range(0, len(full_text), lines_per_page):
-            page_text = "\n".join(full_text[i:i + lines_per_page])
-            simulated_pages.append((i // lines_per_page + 1, page_text))
-
-        return simulated_pages
-
-    else:
-        raise ValueError("Unsupported file format. Only PDF and DOCX are supported.")
+PAGE_SEPARATOR = "\n\n"
+# Batch summaries running at once in each reduce level
+REDUCE_CONCURRENCY = int(os.getenv("GAP_REDUCE_CONCURRENCY", "4"))
+SUMMARY_MODEL = "gpt-3.5-turbo"
+# Part of every gap cache key: bump it when the section or report prompts (or their models) change
+GAP_PROMPT_VERSION = "1"
+
+GAP_STAGE_SECONDS = histogram("gap_stage_seconds", "Gap analysis time per stage (extract / chunk / sections / summaries / final)")
+GAP_SECTION_SECONDS = histogram("gap_section_seconds", "Gap analysis LLM time per document section by outcome")
+GAP_SECTIONS = counter("gap_sections_total", "Gap analysis sections evaluated by outcome")
+GAP_DOCUMENT_SECTIONS = histogram("gap_document_sections", "Sections per analysed document",
+                                  buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+GAP_REDUCE_LEVEL_SECONDS = histogram("gap_reduce_level_seconds", "Time per summary reduce level (level 1 = section analyses)")
+GAP_REDUCE_DEPTH = histogram("gap_reduce_depth", "Summary reduce levels needed before the final report",
+                             buckets=(0, 1, 2, 3, 4, 5, 6, 8))
 
 def chunk_document(text: str, chunk_size=CHUNK_SIZE, overlap=OVERLAP) -> List[str]:
     splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
@@ -63,7 +59,7 @@ def batch_texts(texts: List[str], max_tokens: int, tokenizer) -> List[List[str]]
     batches, current_batch, current_tokens = [], [], 0
     for text in texts:
         tokens = len(tokenizer.encode(text))
-        if current_tokens + tokens > max_tokens:
+        if current_batch and current_tokens + tokens > max_tokens:
             batches.append(current_batch)
             current_batch, current_tokens = [], 0
         current_batch.append(text)
@@ -72,31 +68,58 @@ def batch_texts(texts: List[str], max_tokens: int, tokenizer) -> List[List[str]]
         batches.append(current_batch)
     return batches
 
-def chunk_with_page_tracking(pages, chunk_size=1024, overlap=50):
-    splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
-    page_chunks = [{"page": page_num, "text": text} for page_num, text in pages]
-
-    full_text = "\n\n".join([p["text"] for p in page_chunks])
-    chunks = splitter.split_text(full_text)
+def chunk_with_page_tracking(pages, chunk_size=1024, overlap=50, anchored=True):
+    """
+    Token chunks of the joined pages, each with the exact pages it spans.
+    Page boundaries are offsets into the joined text and the splitter reports each chunk's offsets,
+    so a chunk maps to its start and end page with two bisects (linear overall).
+    anchored: content-defined boundaries (utils.iter_anchored_windows), so a revised document keeps
+    the chunks - and the cached analyses - of its unchanged passages; False gives TokenTextSplitter's
+    fixed overlapping windows.
+    """
+    texts = [text.encode("utf-8") for _, text in pages]
+    separator = PAGE_SEPARATOR.encode("utf-8")
+    full_text = separator.join(texts)
+    page_starts, offset = [], 0
+    for text in texts:
+        page_starts.append(offset)
+        offset += len(text) + len(separator)
 
     chunk_metadata = []
-    for chunk in chunks:
-        matched_page = None
-        for page_data in page_chunks:
-            if chunk[:20] in page_data["text"]:
-                matched_page = page_data["page"]
-                break
+    windows = iter_anchored_windows if anchored else iter_token_windows
+    options = {} if anchored else {"overlap": overlap}
+    for chunk, start, end in windows(full_text.decode("utf-8"), chunk_size, **options):
+        if not chunk.strip():
+            continue
+        # Whitespace at the edges (page separators) does not count as being on a page
+        while start < end and full_text[start:start + 1].isspace():
+            start += 1
+        while end > start and full_text[end - 1:end].isspace():
+            end -= 1
+        if start == end:
+            start_page = end_page = "?"
+        else:
+            start_page = pages[bisect.bisect_right(page_starts, start) - 1][0]
+            end_page = pages[bisect.bisect_right(page_starts, end - 1) - 1][0]
 
         chunk_metadata.append({
             "chunk": chunk,
-            "page": matched_page if matched_page is not None else "?",
-            "section_title": f"Section for Page {matched_page if matched_page is not None else '?'}"
+            "page": start_page,
+            "start_page": start_page,
+            "end_page": end_page,
+            "section_title": f"Section for Page {start_page}" if start_page == end_page
+            else f"Section for Pages {start_page}-{end_page}",
         })
 
     return chunk_metadata
 
-async def run_gap(chunk: str, i: int, gap_chain, semaphore, page, section_title=None):
-    async with semaphore:
+def _record_summary_usage(message, prompt_text):
+    metadata = getattr(message, "response_metadata", None) or {}
+    record_response_usage(SUMMARY_MODEL, {"usage": metadata.get("token_usage")}, prompt_text, message.content)
+
+async def run_gap(chunk: str, i: int, gap_chain, slot, page, section_title=None):
+    """slot: async context manager held for the call (GapScheduler.slot for uploads)"""
+    async with slot:
         query = f"""
 This is a section from a company policy or ESG report:
 
@@ -136,10 +159,18 @@ Return a professional and structured assessment in full sentences.
 
         loop = asyncio.get_event_loop()
         for attempt in range(1):  # try 3 times
+            start = time.perf_counter()
             try:
-                result = await loop.run_in_executor(None, gap_chain.invoke, query)
+                if hasattr(gap_chain, "ainvoke"):
+                    result = await gap_chain.ainvoke(query)
+                else:
+                    result = await loop.run_in_executor(get_gap_scheduler().executor, gap_chain.invoke, query)
+                GAP_SECTION_SECONDS.observe(time.perf_counter() - start, outcome="ok")
+                GAP_SECTIONS.inc(outcome="ok")
                 return i, result, page, section_title
             except Exception as e:
+                GAP_SECTION_SECONDS.observe(time.perf_counter() - start, outcome="error")
+                GAP_SECTIONS.inc(outcome="error")
                 if "429" in str(e) or "Rate limit" in str(e):
                     wait_time = 2 ** attempt
                     print(f"Rate limit hit. Retrying in {wait_time}s...")
@@ -147,25 +178,150 @@ Return a professional and structured assessment in full sentences.
                 else:
                     raise  # unexpected error
 
-async def analyze_document_for_compliance(filepath: str, gap_chain) -> str:
-    text = extract_text_by_page(filepath)
-    chunks = chunk_with_page_tracking(text)
+async def reduce_summaries(texts, summarizer, tokenizer, max_tokens=MAX_TOKENS, concurrency=REDUCE_CONCURRENCY):
+    """
+    Tree reduce: while the texts do not fit one max_tokens window, summarize them in batches
+    (concurrently, at most `concurrency` calls at once) and repeat on the summaries.
+    Returns (texts that fit one window, [{"level", "inputs", "batches", "seconds"} per level]).
+    """
+    limit = asyncio.Semaphore(concurrency)
+    levels = []
 
-    # Step 1: Parallel chunk evaluation
+    async def summarize(batch):
+        text = "\n\n".join(batch)
+        async with limit:
+            summary = await summarizer.ainvoke({"input": text})
+        _record_summary_usage(summary, text)
+        return summary.content.strip()
+
+    batches = batch_texts(texts, max_tokens, tokenizer)
+    while len(batches) > 1:
+        start = time.perf_counter()
+        summaries = await asyncio.gather(*(summarize(batch) for batch in batches))
+        seconds = time.perf_counter() - start
+        level = len(levels) + 1
+        levels.append({"level": level, "inputs": len(texts), "batches": len(batches), "seconds": seconds})
+        GAP_REDUCE_LEVEL_SECONDS.observe(seconds, level=str(level))
+        print(f"🌳 Reduce level {level}: {len(texts)} texts -> {len(batches)} summaries in {seconds:.1f}s")
+        next_batches = batch_texts(summaries, max_tokens, tokenizer)
+        texts = summaries
+        if len(next_batches) >= len(batches):
+            # Summaries as long as their inputs would never converge: let the final call take them as they are
+            print(f"⚠️ Reduce level {level} did not shrink the input - stopping the reduce here")
+            break
+        batches = next_batches
+    GAP_REDUCE_DEPTH.observe(len(levels))
+    return texts, levels
+
+async def _timed_gap(chunk_data, i, gap_chain, slot):
+    start = time.perf_counter()
+    result = await run_gap(chunk_data["chunk"], i, gap_chain, slot, chunk_data["page"], chunk_data["section_title"])
+    return result, time.perf_counter() - start
+
+async def evaluate_sections(chunks, gap_chain, on_section=None, cache=None, user="", document=""):
+    """
+    Run every section concurrently and collect the analyses that have supporting sources.
+    on_section(finding, done, total) is awaited as each section completes (completion order), with
+    finding = {"index", "page", "section_title", "analysis", "cached"} - analysis is None when the
+    section produced no sourced finding.
+    With a cache (app/gap_cache.py), sections analysed before (same text and prompt version) are
+    reported first without an LLM call; complete new analyses are stored together once the sections
+    finish (or fail). Cache reads and writes run in worker threads, off the event loop.
+    Returns (chunk_analyses, {"sections", "reused", "degraded"}); degraded counts sourced answers that
+    are not complete analyses (provider down, local fallback) and are therefore not cached.
+    Sections queue for LLM slots under (user, document), see app/gap_scheduler.py.
+    """
+    def add(page, section_title, analysis):
+        chunk_analyses.append(
+            f"[Page {page}] {section_title or ''}:\n{analysis}\n(Supporting context from Page {page}, {section_title})"
+        )
+
+    keys = [section_key(chunk_data["chunk"], GAP_PROMPT_VERSION) for chunk_data in chunks]
+    cached = await asyncio.to_thread(cache.get_sections, keys) if cache else {}
+    chunk_analyses = []
+    stats = {"sections": len(chunks), "reused": 0, "degraded": 0}
+    done = 0
+    for i, chunk_data in enumerate(chunks):
+        analysis = cached.get(keys[i])
+        if analysis is None:
+            continue
+        stats["reused"] += 1
+        done += 1
+        add(chunk_data["page"], chunk_data["section_title"], analysis)
+        if on_section:
+            await on_section({"index": i, "page": chunk_data["page"], "section_title": chunk_data["section_title"],
+                              "analysis": analysis, "cached": True}, done, len(chunks))
+
+    scheduler = get_gap_scheduler()
     tasks = [
-        run_gap(chunk_data["chunk"], i, gap_chain, semaphore, chunk_data["page"], chunk_data["section_title"])
-        for i, chunk_data in enumerate(chunks)
+        asyncio.ensure_future(_timed_gap(chunk_data, i, gap_chain, scheduler.slot(user, document)))
+        for i, chunk_data in enumerate(chunks) if keys[i] not in cached
     ]
-    results = await asyncio.gather(*tasks)
+    fresh = []
+    try:
+        for task in asyncio.as_completed(tasks):
+            (i, response, page, section_title), seconds = await task
+            done += 1
+            answer = response["result"]
+            sources = response.get("source_documents", [])
+            analysis = None
+            if sources and len(sources) >= 1:
+                analysis = answer.strip()
+                add(page, section_title, analysis)
+                # Fallback and local-only answers carry no confidence level; they must not stick
+                if extract_confidence(analysis) == "Unknown":
+                    stats["degraded"] += 1
+                elif cache:
+                    fresh.append((keys[i], analysis, seconds))
+            if on_section:
+                await on_section({"index": i, "page": page, "section_title": section_title, "analysis": analysis,
+                                  "cached": False}, done, len(chunks))
+    finally:
+        # A failed section (or a cancelled upload) must not leave the others running
+        for task in tasks:
+            task.cancel()
+        # Sections that did complete are kept even when the upload fails or is cancelled
+        if fresh:
+            await asyncio.to_thread(cache.put_sections, fresh)
+    return chunk_analyses, stats
+
+async def analyze_document_for_compliance(filepath: str, gap_chain, on_section=None, on_stage=None, user="") -> str:
+    """
+    Gap analysis report for the document. Progressive callers pass on_section (see evaluate_sections)
+    to show findings as they complete, and on_stage(stage, sections) to follow the summary stages
+    ("cached" when the report of an identical earlier upload is returned as is).
+    user: who uploaded it, so their sections get a fair share of the LLM slots next to other users'.
+    """
+    # Opening the cache, hashing the upload and SQLite all block: keep them off the event loop
+    cache = await asyncio.to_thread(get_gap_cache)
+    report_key = None
+    if cache:
+        report_key = f"{GAP_PROMPT_VERSION}:{await asyncio.to_thread(file_hash, filepath)}"
+        report = await asyncio.to_thread(cache.get_report, report_key)
+        if report is not None:
+            print(f"♻️ Gap cache: identical upload, report reused ({report_key[:14]}...)")
+            GAP_CACHE_UPLOAD_HIT_RATIO.observe(1)
+            if on_stage:
+                await on_stage("cached", 0)
+            return report
+
+    # Parsing the PDF and tokenizing it take seconds on a large upload: keep chat sessions responsive
+    with GAP_STAGE_SECONDS.time(stage="extract"):
+        text = await asyncio.to_thread(extract_text_by_page, filepath)
+    with GAP_STAGE_SECONDS.time(stage="chunk"):
+        chunks = await asyncio.to_thread(chunk_with_page_tracking, text)
+    GAP_DOCUMENT_SECTIONS.observe(len(chunks))
 
-    chunk_analyses = []
-    for i, response, page, section_title in results:
-        answer = response["result"]
-        sources = response.get("source_documents", [])
-        if sources and len(sources) >= 1:
-            chunk_analyses.append(
-                f"[Page {page}] {section_title or ''}:\n{answer.strip()}\n(Supporting context from Page {page}, {section_title})"
-            )
+    # Step 1: Parallel chunk evaluation
+    with GAP_STAGE_SECONDS.time(stage="sections"):
+        chunk_analyses, section_stats = await evaluate_sections(chunks, gap_chain, on_section, cache, user, filepath)
+    if cache:
+        ratio = section_stats["reused"] / max(section_stats["sections"], 1)
+        GAP_CACHE_UPLOAD_HIT_RATIO.observe(ratio)
+        print(f"♻️ Gap cache: {section_stats['reused']}/{section_stats['sections']} sections reused ({ratio:.0%}), "
+              f"{section_stats['sections'] - section_stats['reused']} analysed")
+    if on_stage:
+        await on_stage("summaries", len(chunk_analyses))
 
     chunk_analyses.sort(key=extract_page_number)
 
@@ -177,8 +333,8 @@ async def analyze_document_for_compliance(filepath: str, gap_chain) -> str:
     print("------------------------------------------------------------------------")
 
     # Step 2: Intermediate summaries
-    tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.3)
+    tokenizer = tiktoken.encoding_for_model(SUMMARY_MODEL)
+    llm = ChatOpenAI(model=SUMMARY_MODEL, temperature=0.3)
 
     batch_prompt = PromptTemplate.from_template("""
 You are an ESG compliance auditor.
@@ -193,12 +349,11 @@ Do not invent or generalize page numbers.
 """)
     summarizer = batch_prompt | llm
 
-    batches = batch_texts(chunk_analyses, MAX_TOKENS, tokenizer)
-    intermediate_summaries = []
-    for batch in batches:
-        text = "\n\n".join(batch)
-        summary = await asyncio.get_event_loop().run_in_executor(None, summarizer.invoke, {"input": text})
-        intermediate_summaries.append(summary.content.strip())
+    # Batches are summarized concurrently, level by level, until everything fits the final call
+    with GAP_STAGE_SECONDS.time(stage="summaries"):
+        intermediate_summaries, levels = await reduce_summaries(chunk_analyses, summarizer, tokenizer)
+    print(f"🌳 Reduce depth {len(levels)}: " + (", ".join(
+        f"L{level['level']} {level['batches']} batches {level['seconds']:.1f}s" for level in levels) or "fits one call"))
 
     # Step 3: Final summary
     final_summary_prompt = PromptTemplate.from_template("""
@@ -246,9 +401,16 @@ Evaluations:
 
 
     final_summarizer = final_summary_prompt | llm
+    if on_stage:
+        await on_stage("final", len(chunk_analyses))
     final_input = "\n\n".join(intermediate_summaries)
-    final_report = await asyncio.get_event_loop().run_in_executor(None, final_summarizer.invoke, {"input": final_input})
+    with GAP_STAGE_SECONDS.time(stage="final"):
+        final_report = await final_summarizer.ainvoke({"input": final_input})
+    _record_summary_usage(final_report, final_input)
 
     final_report_cleaned = clean_output(final_report.content.strip())
+    # A report built on fallback answers is not the one a healthy provider would give
+    if report_key and not section_stats["degraded"]:
+        await asyncio.to_thread(cache.put_report, report_key, final_report_cleaned)
 
     return final_report_cleaned
@@ -0,0 +1,173 @@
+"""
+Persistent cache of gap-analysis results.
+Section analyses are keyed by the prompt version and the section text (whitespace-normalised, page
+number excluded), so a revised document only re-analyses the sections whose text changed, even when
+its pages shift. Whole reports are keyed by the prompt version and the SHA-256 of the uploaded file,
+so an identical upload is answered without any LLM call. Entries expire after a TTL and are bounded (LRU).
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from app.metrics import counter, gauge, histogram
+
+GAP_CACHE_ENABLED = os.getenv("GAP_CACHE", "1") == "1"
+GAP_CACHE_PATH = os.getenv("GAP_CACHE_PATH", "cache/gap_cache.sqlite")
+GAP_CACHE_MAX_ENTRIES = int(os.getenv("GAP_CACHE_MAX_ENTRIES", "50000"))
+GAP_CACHE_TTL_S = float(os.getenv("GAP_CACHE_TTL_DAYS", "30")) * 86400
+
+GAP_CACHE_LOOKUPS = counter("gap_cache_lookups_total", "Gap analysis cache lookups by kind (section/report) and result (hit/miss)")
+GAP_CACHE_SAVED_SECONDS = counter("gap_cache_saved_seconds_total", "Section LLM time avoided by gap cache hits")
+GAP_CACHE_EVICTIONS = counter("gap_cache_evictions_total", "Gap cache entries evicted by reason (lru/ttl)")
+GAP_CACHE_ENTRIES = gauge("gap_cache_entries", "Section analyses currently cached")
+GAP_CACHE_UPLOAD_HIT_RATIO = histogram("gap_cache_upload_hit_ratio", "Share of an upload's sections served from the gap cache",
+                                       buckets=(0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1))
+
+# SQLite's default limit on host parameters per statement is 999
+_BATCH = 500
+
+
+def section_key(chunk, prompt_version):
+    return hashlib.sha256(f"{prompt_version}\n{' '.join(chunk.split())}".encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class GapAnalysisCache:
+    def __init__(self, path=GAP_CACHE_PATH, max_entries=GAP_CACHE_MAX_ENTRIES, ttl_s=GAP_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS sections (
+            key TEXT PRIMARY KEY,
+            analysis TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            latency_s REAL NOT NULL
+        )
+        """)
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS reports (
+            key TEXT PRIMARY KEY,
+            report TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS sections_last_used ON sections (last_used)")
+
+        cutoff = time.time() - ttl_s
+        expired = self.db.execute("DELETE FROM sections WHERE created_at < ?", (cutoff,)).rowcount
+        expired += self.db.execute("DELETE FROM reports WHERE created_at < ?", (cutoff,)).rowcount
+        self.db.commit()
+        GAP_CACHE_EVICTIONS.inc(expired, reason="ttl")
+        self._entries = self.db.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+        self._evict()
+        print(f"♻️ Gap cache: {self._entries} section analyses loaded ({expired} expired)")
+
+    def _evict(self):
+        """Least recently used sections beyond max_entries (caller holds the lock or is __init__)"""
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            self.db.execute("DELETE FROM sections WHERE key IN "
+                            "(SELECT key FROM sections ORDER BY last_used LIMIT ?)", (excess,))
+            self.db.commit()
+            self._entries -= excess
+            GAP_CACHE_EVICTIONS.inc(excess, reason="lru")
+        GAP_CACHE_ENTRIES.set(self._entries)
+
+    def get_sections(self, keys):
+        """{key: analysis} for the cached keys, in one query per 500 keys"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for i in range(0, len(unique), _BATCH):
+                batch = unique[i:i + _BATCH]
+                rows = self.db.execute(
+                    f"SELECT key, analysis, created_at, latency_s FROM sections WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, analysis, created_at, latency_s in rows:
+                    if now - created_at <= self.ttl_s:
+                        found[key] = analysis
+                        GAP_CACHE_SAVED_SECONDS.inc(latency_s)
+            if found:
+                self.db.executemany("UPDATE sections SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self.db.commit()
+        hits = sum(key in found for key in keys)
+        GAP_CACHE_LOOKUPS.inc(hits, kind="section", result="hit")
+        GAP_CACHE_LOOKUPS.inc(len(keys) - hits, kind="section", result="miss")
+        return found
+
+    def put_sections(self, items):
+        """Store (key, analysis, latency_s) items in one transaction"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            keys = list(dict.fromkeys(key for key, _, _ in items))
+            existing = 0
+            for i in range(0, len(keys), _BATCH):
+                batch = keys[i:i + _BATCH]
+                existing += self.db.execute(
+                    f"SELECT COUNT(*) FROM sections WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchone()[0]
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sections (key, analysis, created_at, last_used, latency_s) VALUES (?, ?, ?, ?, ?)",
+                [(key, analysis, now, now, latency_s) for key, analysis, latency_s in items],
+            )
+            self.db.commit()
+            self._entries += len(keys) - existing
+            self._evict()
+
+    def get_report(self, key):
+        with self._lock:
+            row = self.db.execute("SELECT report, created_at FROM reports WHERE key = ?", (key,)).fetchone()
+        hit = row is not None and time.time() - row[1] <= self.ttl_s
+        GAP_CACHE_LOOKUPS.inc(kind="report", result="hit" if hit else "miss")
+        return row[0] if hit else None
+
+    def put_report(self, key, report):
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO reports (key, report, created_at) VALUES (?, ?, ?)",
+                            (key, report, time.time()))
+            self.db.commit()
+
+    def stats(self):
+        hits = GAP_CACHE_LOOKUPS.value(kind="section", result="hit")
+        misses = GAP_CACHE_LOOKUPS.value(kind="section", result="miss")
+        return {
+            "entries": self._entries,
+            "section_hits": hits,
+            "section_misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "report_hits": GAP_CACHE_LOOKUPS.value(kind="report", result="hit"),
+            "saved_s": GAP_CACHE_SAVED_SECONDS.value(),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_gap_cache():
+    """Process-wide gap analysis cache (None if disabled)"""
+    global _cache
+    if _cache is None and GAP_CACHE_ENABLED:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GapAnalysisCache()
+    return _cache
@@ -0,0 +1,166 @@
+"""
+Fair scheduling of gap-analysis section calls.
+At most GAP_CONCURRENCY sections run at once across the process (below LLM_MAX_CONNECTIONS, so chat
+keeps connections of its own). When every slot is busy, waiting sections queue per user and per
+document and slots are handed out round-robin: users in turn, each user's documents in turn,
+sections of one document in order. A 300-page upload therefore cannot hold every slot while another
+user's two-page policy waits. Section retrieval (and chains without `ainvoke`) run on a dedicated,
+sized thread pool instead of the event loop's default executor that chat uses.
+Queue depth, running sections and per-user queue wait are exported through app/metrics.py.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from app.metrics import gauge, histogram
+
+GAP_CONCURRENCY = int(os.getenv("GAP_CONCURRENCY", "5"))
+GAP_WORKERS = int(os.getenv("GAP_WORKERS", str(GAP_CONCURRENCY)))
+
+GAP_QUEUE_DEPTH = gauge("gap_queue_depth", "Gap analysis sections waiting for a slot")
+GAP_ACTIVE = gauge("gap_active_sections", "Gap analysis sections holding a slot")
+GAP_QUEUE_WAIT = histogram("gap_queue_wait_seconds", "Time a section waited for a slot, by user (hashed)")
+
+
+def user_label(user):
+    """Metrics label for a user: /metrics is not authenticated, so e-mail addresses are hashed"""
+    return hashlib.sha256(user.encode("utf-8")).hexdigest()[:10] if user else "anonymous"
+
+
+class _Waiter:
+    __slots__ = ("loop", "future")
+
+    def __init__(self, loop, future):
+        self.loop = loop
+        self.future = future
+
+
+class GapScheduler:
+    def __init__(self, concurrency=GAP_CONCURRENCY, workers=GAP_WORKERS):
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gap-analysis")
+        self._active = 0
+        self._waiting = 0
+        # user -> OrderedDict(document -> deque of waiters); _users is the round-robin order
+        self._queues = {}
+        self._users = deque()
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def slot(self, user="", document=""):
+        """Hold one of the `concurrency` slots, queued fairly behind other users' sections"""
+        await self._acquire(user, document)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, user, document):
+        start = time.perf_counter()
+        with self._lock:
+            if self._active < self.concurrency and not self._waiting:
+                self._active += 1
+                GAP_ACTIVE.set(self._active)
+                GAP_QUEUE_WAIT.observe(0.0, user=user_label(user))
+                return
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(loop, loop.create_future())
+            if user not in self._queues:
+                self._queues[user] = OrderedDict()
+                self._users.append(user)
+            self._queues[user].setdefault(document, deque()).append(waiter)
+            self._waiting += 1
+            GAP_QUEUE_DEPTH.set(self._waiting)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = self._remove(user, document, waiter)
+            # Granted just as it was cancelled: the slot was handed over, pass it on
+            if not queued and waiter.future.done() and not waiter.future.cancelled():
+                self._release()
+            raise
+        GAP_QUEUE_WAIT.observe(time.perf_counter() - start, user=user_label(user))
+
+    def _remove(self, user, document, waiter):
+        """Drop a waiter still in its queue (caller holds the lock); False if it was already handed a slot"""
+        waiters = self._queues.get(user, {}).get(document)
+        if not waiters or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        self._drop_empty(user, document)
+        self._waiting -= 1
+        GAP_QUEUE_DEPTH.set(self._waiting)
+        return True
+
+    def _drop_empty(self, user, document):
+        documents = self._queues[user]
+        if not documents[document]:
+            del documents[document]
+        if not documents:
+            del self._queues[user]
+            self._users.remove(user)
+
+    def _next(self):
+        """Next waiter round-robin: the user after the last one served, that user's next document"""
+        if not self._users:
+            return None
+        user = self._users[0]
+        self._users.rotate(-1)
+        documents = self._queues[user]
+        document, waiters = next(iter(documents.items()))
+        documents.move_to_end(document)
+        waiter = waiters.popleft()
+        self._drop_empty(user, document)
+        self._waiting -= 1
+        GAP_QUEUE_DEPTH.set(self._waiting)
+        return waiter
+
+    def _release(self):
+        with self._lock:
+            waiter = self._next()
+            if waiter is None:
+                self._active -= 1
+                GAP_ACTIVE.set(self._active)
+                return
+        # The slot goes straight to the waiter (active count unchanged), on the waiter's own loop
+        try:
+            waiter.loop.call_soon_threadsafe(self._grant, waiter)
+        except RuntimeError:
+            # Its loop is closed: nobody will take the slot
+            self._release()
+
+    def _grant(self, waiter):
+        if waiter.future.cancelled():
+            self._release()
+        else:
+            waiter.future.set_result(None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "waiting": self._waiting,
+                "waiting_by_user": {user_label(user): sum(map(len, documents.values()))
+                                    for user, documents in self._queues.items()},
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_gap_scheduler():
+    """Process-wide scheduler, created on first use (not bound to the event loop running at import)"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GapScheduler()
+    return _scheduler
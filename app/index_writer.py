@@ -0,0 +1,89 @@
+"""
+Streaming index writer.
+Chunks are embedded in fixed-size batches as they arrive and appended to the on-disk vector
+store, so the embedding working set is capped by the batch size instead of growing with the corpus.
+"""
+
+import os
+import time
+
+from app.perf import peak_rss_mb
+from app.vector_store import INDEX_FILE, VectorStore
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+
+class StreamingIndexWriter:
+    """Buffers LangChain Documents and embeds + indexes them every batch_size chunks"""
+
+    def __init__(self, embeddings, index_path, batch_size=EMBED_BATCH_SIZE, append=False, index_spec=None):
+        self.embeddings = embeddings
+        self.index_path = index_path
+        self.batch_size = batch_size
+        self.store = VectorStore(index_path, mode="a" if append else "w", index_spec=index_spec)
+        self.buffer = []
+        self.buffer_ids = []
+        self.stats = {"chunks": 0, "batches": 0, "embed_s": 0.0, "index_s": 0.0}
+
+    def add(self, doc):
+        """Queue a chunk; returns the vector ID it will be stored under"""
+        vector_id = self.store.allocate_ids(1)[0]
+        self.buffer.append(doc)
+        self.buffer_ids.append(vector_id)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return vector_id
+
+    def add_documents(self, docs):
+        return [self.add(doc) for doc in docs]
+
+    def delete(self, ids):
+        """Drop previously indexed vectors (e.g. of changed or deleted source files)"""
+        self.store.delete(ids)
+
+    def flush(self):
+        """Embed the buffered chunks and append them to the store"""
+        if not self.buffer:
+            return
+
+        texts = [doc.page_content for doc in self.buffer]
+        metadatas = [doc.metadata for doc in self.buffer]
+
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self.stats["embed_s"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.store.add(vectors, texts, metadatas, ids=self.buffer_ids)
+        self.stats["index_s"] += time.perf_counter() - start
+
+        self.stats["chunks"] += len(texts)
+        self.stats["batches"] += 1
+        self.buffer = []
+        self.buffer_ids = []
+
+    def save(self):
+        """Flush the tail batch and persist the store; returns False if nothing was indexed"""
+        self.flush()
+        saved = self.store.save()
+        self.store.close()
+        if not saved:
+            print("⚠️ No chunks were indexed - nothing saved.")
+        elif "build_s" in self.store.stats:
+            size_mb = os.path.getsize(os.path.join(self.index_path, INDEX_FILE)) / 1e6
+            print(f"🏗️ Built {self.store.index_spec} index over {self.store.ntotal} vectors in "
+                  f"{self.store.stats['build_s']:.1f}s ({size_mb:.1f}MB on disk)")
+        elif "update_s" in self.store.stats:
+            added, removed = self.store.stats["updated"]
+            print(f"🏗️ Updated the {self.store.index_spec} index in place: +{added} / -{removed} vectors in "
+                  f"{self.store.stats['update_s']:.2f}s ({self.store.ntotal} total)")
+        return saved
+
+    def report(self):
+        s = self.stats
+        rate = s["chunks"] / s["embed_s"] if s["embed_s"] else 0.0
+        print(
+            f"🧮 Embedded {s['chunks']} chunks in {s['batches']} batches of ≤{self.batch_size} | "
+            f"{rate:,.1f} embeddings/s (embed {s['embed_s']:.1f}s, index add {s['index_s']:.1f}s, "
+            f"BM25 {self.store.lexical.stats['index_s']:.1f}s) | peak RSS {peak_rss_mb():.0f}MB"
+        )
@@ -0,0 +1,75 @@
+"""
+Pooled HTTP clients for the LLM provider.
+Calls reuse keep-alive connections from one pool per process (sync callers, e.g. worker threads)
+and one pool per event loop (async handlers) instead of opening a new TLS connection each time.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+
+FIREWORKS_API_URL = os.getenv("FIREWORKS_API_URL", "https://api.fireworks.ai/inference/v1/chat/completions")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+LLM_KEEPALIVE_EXPIRY_S = float(os.getenv("LLM_KEEPALIVE_EXPIRY_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "10"))
+# Waiting for the response (or, when streaming, between two chunks)
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "90"))
+# Waiting for a free connection when the pool is exhausted
+LLM_POOL_TIMEOUT_S = float(os.getenv("LLM_POOL_TIMEOUT_S", "30"))
+
+
+def llm_timeout(read_s=LLM_TIMEOUT_S):
+    """Per-call timeout (connect / pool limits stay the configured ones)"""
+    return httpx.Timeout(read_s, connect=LLM_CONNECT_TIMEOUT_S, pool=LLM_POOL_TIMEOUT_S)
+
+
+def _client_options():
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_S,
+        ),
+        "timeout": llm_timeout(),
+    }
+
+
+_client = None
+_client_lock = threading.Lock()
+# An AsyncClient's connections belong to the loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_client():
+    """Process-wide pooled client for synchronous callers"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+def get_async_http_client():
+    """Pooled client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _async_clients[loop] = httpx.AsyncClient(**_client_options())
+    return client
+
+
+async def aclose_http_clients():
+    """Close the running loop's pool and the sync pool (app shutdown)"""
+    global _client
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,54 @@
+"""
+Token and cost accounting for LLM calls, exported through app/metrics.py.
+Counts come from the provider's `usage` block when there is one; streamed answers (no usage block)
+are estimated at ~4 characters per prompt token and one token per streamed chunk.
+"""
+
+import os
+
+from app.metrics import counter, histogram
+
+# USD per million (prompt, completion) tokens, matched on a substring of the model name
+MODEL_PRICES = {
+    "kimi-k2": (float(os.getenv("KIMI_K2_PROMPT_USD_PER_MTOK", "0.6")), float(os.getenv("KIMI_K2_COMPLETION_USD_PER_MTOK", "2.5"))),
+    "gpt-3.5-turbo": (float(os.getenv("GPT35_PROMPT_USD_PER_MTOK", "0.5")), float(os.getenv("GPT35_COMPLETION_USD_PER_MTOK", "1.5"))),
+}
+CHARS_PER_TOKEN = 4
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+LLM_TOKENS_PER_CALL = histogram("llm_tokens_per_call", "Prompt / completion tokens per LLM call", buckets=TOKEN_BUCKETS)
+LLM_TOKENS = counter("llm_tokens_total", "Prompt / completion tokens by model (source: usage or estimate)")
+LLM_COST = counter("llm_cost_usd_total", "Estimated LLM spend in USD by model")
+
+_prices = {}
+
+
+def _price(model):
+    if model not in _prices:
+        _prices[model] = next((price for name, price in MODEL_PRICES.items() if name in model), None)
+    return _prices[model]
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def record_usage(model, prompt_tokens, completion_tokens, source="usage"):
+    """Count one call's tokens and cost"""
+    model = model.rsplit("/", 1)[-1]
+    LLM_TOKENS_PER_CALL.observe(prompt_tokens, kind="prompt")
+    LLM_TOKENS_PER_CALL.observe(completion_tokens, kind="completion")
+    LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt", source=source)
+    LLM_TOKENS.inc(completion_tokens, model=model, kind="completion", source=source)
+    price = _price(model)
+    if price:
+        LLM_COST.inc((prompt_tokens * price[0] + completion_tokens * price[1]) / 1e6, model=model)
+
+
+def record_response_usage(model, result, prompt_text="", completion_text=""):
+    """record_usage from an OpenAI-style response body, estimated from the texts when it has no usage"""
+    usage = result.get("usage") or {}
+    if usage.get("prompt_tokens") is not None:
+        record_usage(model, usage["prompt_tokens"], usage.get("completion_tokens") or 0)
+    else:
+        record_usage(model, estimate_tokens(prompt_text), estimate_tokens(completion_text), source="estimate")
@@ -0,0 +1,82 @@
+"""
+Index manifest for incremental re-indexing.
+Records, per source file, its size, mtime, content hash and the vector IDs it produced,
+so a rebuild only re-processes added/changed files and drops the vectors of deleted ones.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """JSON manifest stored next to the index it describes"""
+
+    def __init__(self, index_path):
+        self.path = os.path.join(index_path, MANIFEST_NAME)
+        self.files = {}
+        self._hashes = {}  # hashes computed by diff() for files about to be (re)indexed
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+
+    def diff(self, filepaths):
+        """
+        Split the current file list into (to_index, unchanged, deleted).
+        size + mtime short-circuit the check; the content hash is only computed when they
+        moved, so a touched-but-identical file is not re-embedded.
+        """
+        to_index, unchanged = [], []
+        for filepath in filepaths:
+            st = os.stat(filepath)
+            entry = self.files.get(filepath)
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                unchanged.append(filepath)
+                continue
+
+            sha = file_sha256(filepath)
+            if entry and entry["sha256"] == sha:
+                entry["mtime"] = st.st_mtime
+                unchanged.append(filepath)
+            else:
+                self._hashes[filepath] = sha
+                to_index.append(filepath)
+
+        deleted = sorted(set(self.files) - set(filepaths))
+        return to_index, unchanged, deleted
+
+    def ids_for(self, filepaths):
+        """Vector IDs currently indexed for these files"""
+        return [vector_id for fp in filepaths for vector_id in self.files.get(fp, {}).get("ids", [])]
+
+    def record(self, filepath, ids):
+        st = os.stat(filepath)
+        sha = self._hashes.pop(filepath, None) or file_sha256(filepath)
+        self.files[filepath] = {"size": st.st_size, "mtime": st.st_mtime, "sha256": sha, "ids": list(ids)}
+
+    def forget(self, filepath):
+        self.files.pop(filepath, None)
+
+    def reset(self):
+        self.files = {}
+
+    def save(self):
+        """Atomic write so an interrupted run never leaves a half-written manifest"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,207 @@
+"""
+LLM metadata classification stage for ingest.
+- bounded-concurrency async calls to the classifier chain
+- persistent SQLite cache keyed by the hash of the document excerpt (moving or renaming a
+  file does not cost another LLM call)
+- retry when the model returns malformed JSON
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+METADATA_LOG_DIR = "metadata_logs"
+METADATA_CACHE_PATH = os.path.join(METADATA_LOG_DIR, "metadata_cache.sqlite")
+METADATA_CONCURRENCY = int(os.getenv("METADATA_CONCURRENCY", "8"))
+METADATA_MAX_ATTEMPTS = 3
+
+DEFAULT_METADATA = {"jurisdiction": "unknown", "document_type": "unspecified", "themes": ""}
+
+
+def excerpt_hash(excerpt: str, folder_document_type="") -> str:
+    # Empty excerpts (scanned PDFs) are only told apart by the folder hint the prompt gets
+    key = excerpt if excerpt.strip() else "\0" + folder_document_type
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def parse_metadata_json(response: str):
+    """Parse the classifier reply, tolerating ```json fences and chatter around the object"""
+    text = response.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+    if not text.startswith("{"):
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise ValueError("no JSON object in response")
+        text = text[start:end + 1]
+    fields = json.loads(text)
+    if not isinstance(fields, dict):
+        raise ValueError("JSON response is not an object")
+    return fields
+
+
+def load_previous_metadata(log_dir):
+    """Legacy path-keyed results from the per-run JSONL logs (used only on a cache miss)"""
+    previous = {}
+    if not os.path.isdir(log_dir):
+        return previous
+    for fname in os.listdir(log_dir):
+        if fname.endswith(".jsonl"):
+            with open(os.path.join(log_dir, fname), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                        if "source" in item and "llm_document_type" in item:
+                            previous[item["source"]] = item
+                    except:
+                        continue
+    return previous
+
+
+class MetadataClassifier:
+    """Classifies documents (jurisdiction / document type / themes) with caching and retries"""
+
+    def __init__(self, chain, cache_path=METADATA_CACHE_PATH, concurrency=METADATA_CONCURRENCY,
+                 max_attempts=METADATA_MAX_ATTEMPTS, legacy_log_dir=METADATA_LOG_DIR):
+        self.chain = chain
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.legacy_log_dir = legacy_log_dir
+        self._legacy = None
+        self._inflight = {}  # excerpt hash -> future, so duplicates in one batch share a call
+        self._loop = asyncio.new_event_loop()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(cache_path)
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS metadata_cache (
+            excerpt_hash TEXT PRIMARY KEY,
+            fields TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """)
+        self.db.commit()
+
+        self.stats = {"documents": 0, "cache_hits": 0, "legacy_hits": 0, "llm_calls": 0,
+                      "json_retries": 0, "failures": 0, "llm_s": 0.0}
+
+    def _cached(self, key):
+        row = self.db.execute("SELECT fields FROM metadata_cache WHERE excerpt_hash = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _store(self, key, fields):
+        self.db.execute(
+            "INSERT OR REPLACE INTO metadata_cache (excerpt_hash, fields, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(fields, ensure_ascii=False), time.time()),
+        )
+
+    def _legacy_lookup(self, filepath):
+        if self._legacy is None:
+            self._legacy = load_previous_metadata(self.legacy_log_dir)
+            print(f"[CACHE LOAD] Found {len(self._legacy)} legacy path-keyed metadata records.")
+        item = self._legacy.get(filepath)
+        if not item:
+            return None
+        return {
+            "jurisdiction": item.get("llm_jurisdiction", "unknown"),
+            "document_type": item.get("llm_document_type", "unspecified"),
+            "themes": item.get("llm_themes", ""),
+        }
+
+    async def _call_llm(self, semaphore, filepath, excerpt, folder_document_type):
+        async with semaphore:
+            for attempt in range(1, self.max_attempts + 1):
+                self.stats["llm_calls"] += 1
+                start = time.perf_counter()
+                try:
+                    response = await self.chain.arun(document_excerpt=excerpt,
+                                                     folder_document_type=folder_document_type)
+                finally:
+                    self.stats["llm_s"] += time.perf_counter() - start
+                try:
+                    return parse_metadata_json(response)
+                except Exception:
+                    if attempt < self.max_attempts:
+                        self.stats["json_retries"] += 1
+                        print(f"[WARNING] LLM returned invalid JSON for {filepath}, retrying ({attempt}/{self.max_attempts})")
+        return None
+
+    async def _classify(self, semaphore, filepath, excerpt, folder_document_type):
+        self.stats["documents"] += 1
+        key = excerpt_hash(excerpt, folder_document_type)
+
+        fields = self._cached(key)
+        if fields is not None:
+            self.stats["cache_hits"] += 1
+            return fields
+        if key in self._inflight:
+            self.stats["cache_hits"] += 1
+            return dict(await self._inflight[key])
+
+        future = self._loop.create_future()
+        self._inflight[key] = future
+        try:
+            fields = await self._classify_miss(semaphore, key, filepath, excerpt, folder_document_type)
+            future.set_result(fields)
+            return fields
+        except BaseException as e:
+            # Duplicates awaiting this excerpt get the failure instead of waiting forever
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Marked retrieved: no "exception was never retrieved" warning when nobody was waiting
+                future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _classify_miss(self, semaphore, key, filepath, excerpt, folder_document_type):
+        fields = self._legacy_lookup(filepath)
+        if fields is not None:
+            self.stats["legacy_hits"] += 1
+        else:
+            try:
+                fields = await self._call_llm(semaphore, filepath, excerpt, folder_document_type)
+            except Exception as e:
+                print(f"[WARNING] LLM metadata failed for {filepath}: {e}")
+                fields = None
+            if fields is None:
+                self.stats["failures"] += 1
+                # Not cached, so the next run tries again
+                return dict(DEFAULT_METADATA)
+
+        self._store(key, fields)
+        return fields
+
+    async def _classify_all(self, items):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._classify(semaphore, *item) for item in items))
+
+    def classify_many(self, items):
+        """items: (filepath, excerpt, folder_document_type) tuples -> list of metadata dicts"""
+        if not items:
+            return []
+        results = self._loop.run_until_complete(self._classify_all(items))
+        self.db.commit()
+        return results
+
+    def report(self):
+        s = self.stats
+        hits = s["cache_hits"] + s["legacy_hits"]
+        hit_rate = hits / s["documents"] * 100 if s["documents"] else 0.0
+        print(
+            f"🏷️ Metadata: {s['documents']} documents | cache hit rate {hit_rate:.1f}% "
+            f"({s['cache_hits']} hash, {s['legacy_hits']} legacy) | {s['llm_calls']} LLM calls "
+            f"({s['json_retries']} JSON retries, {s['failures']} failures, {s['llm_s']:.1f}s in LLM)"
+        )
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        self._loop.close()
@@ -0,0 +1,189 @@
+"""
+Lightweight in-process metrics (counters, gauges, histograms) with optional labels.
+Metrics are registered once by name and shared by every chain / session in the process.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond cache lookups up to long LLM generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def samples(self):
+        """{labels tuple: value} snapshot"""
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; per label set: bucket counts, sum and count"""
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        # One bucket per observation (cumulated when read), so the hot path is a bisect and two adds
+        i = bisect.bisect_left(self.buckets, value)
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _cumulative(state):
+        counts, total = [], 0
+        for count in state["buckets"][:-1]:
+            total += count
+            counts.append(total)
+        return counts
+
+    def samples(self):
+        """{labels tuple: {"buckets": cumulative counts per bound, "sum", "count"}} snapshot"""
+        with self._lock:
+            return {key: {"buckets": self._cumulative(state), "sum": state["sum"], "count": state["count"]}
+                    for key, state in self._values.items()}
+
+    def quantile(self, q, **labels):
+        """Upper bucket bound holding the q-quantile (None without observations)"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if not state or not state["count"]:
+                return None
+            rank = q * state["count"]
+            for bound, count in zip(self.buckets, self._cumulative(state)):
+                if count >= rank:
+                    return bound
+            return float("inf")
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name, help, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+        return metric
+
+
+def counter(name, help=""):
+    return _get_or_create(Counter, name, help)
+
+
+def gauge(name, help=""):
+    return _get_or_create(Gauge, name, help)
+
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    return _get_or_create(Histogram, name, help, buckets=buckets)
+
+
+def all_metrics():
+    with _registry_lock:
+        return sorted(_registry.values(), key=lambda metric: metric.name)
+
+
+def _escape(value, quotes=True):
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_prometheus():
+    """Every registered metric in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for metric in all_metrics():
+        if metric.help:
+            lines.append(f"# HELP {metric.name} {_escape(metric.help, quotes=False)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(metric.samples().items()):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_labels(key)} {_number(value)}")
+                continue
+            for bound, count in zip(metric.buckets, value["buckets"]):
+                lines.append(f"{metric.name}_bucket{_labels(key, [('le', _number(bound))])} {count}")
+            lines.append(f'{metric.name}_bucket{_labels(key, [("le", "+Inf")])} {value["count"]}')
+            lines.append(f"{metric.name}_sum{_labels(key)} {_number(value['sum'])}")
+            lines.append(f"{metric.name}_count{_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
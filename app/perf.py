@@ -0,0 +1,76 @@
+"""
+Small timing / memory helpers shared by startup and ingest reports
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import psutil
+
+try:
+    import resource  # Unix only
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (best effort per platform)"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS reports bytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    info = psutil.Process(os.getpid()).memory_info()
+    return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+
+
+@contextmanager
+def timed(stats: dict, key: str):
+    """Store the elapsed seconds of the block in stats[key]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[key] = time.perf_counter() - start
+
+
+class StageMeter:
+    """Per-stage busy time and item counts for a pipeline, reported as throughput"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {"seconds": 0.0, "counts": {}})
+
+    def add(self, name, seconds=0.0, **counts):
+        stage = self._stage(name)
+        stage["seconds"] += seconds
+        for key, value in counts.items():
+            stage["counts"][key] = stage["counts"].get(key, 0) + value
+
+    @contextmanager
+    def measure(self, name, **counts):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, **counts)
+
+    def report(self, title="Pipeline"):
+        wall = time.perf_counter() - self.started
+        print(f"📊 {title} throughput (wall {wall:.1f}s)")
+        for name, stage in self.stages.items():
+            busy = stage["seconds"]
+            rates = ", ".join(
+                f"{count} {key} ({count / busy if busy else 0:,.1f}/s busy, {count / wall if wall else 0:,.1f}/s wall)"
+                for key, count in stage["counts"].items()
+            )
+            print(f"   {name:<10} busy {busy:8.1f}s | {rates}")
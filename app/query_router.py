@@ -0,0 +1,80 @@
+"""
+Query-complexity routing: a cheap local classification (regexes + the topic router, no LLM call)
+into tiers, each with its own prompt style, token budget and optionally model.
+
+    greeting  - hi / thanks / who are you            -> short friendly reply, no retrieval
+    factual   - "what is CSRD?", "does X require Y?" -> concise answer
+    longform  - comparisons, how-to / implementation -> full structured answer (previous behaviour)
+"""
+
+import os
+import re
+
+from app.metrics import counter, histogram
+from app.topic_router import get_topic_router
+
+# Model per tier; empty = the assistant's default model
+TIERS = {
+    "greeting": {"max_tokens": int(os.getenv("TIER_GREETING_MAX_TOKENS", "256")), "temperature": 0.7,
+                 "model": os.getenv("TIER_GREETING_MODEL", "")},
+    "factual": {"max_tokens": int(os.getenv("TIER_FACTUAL_MAX_TOKENS", "1024")), "temperature": 0.4,
+                "model": os.getenv("TIER_FACTUAL_MODEL", "")},
+    "longform": {"max_tokens": int(os.getenv("TIER_LONGFORM_MAX_TOKENS", "4096")), "temperature": 0.6,
+                 "model": os.getenv("TIER_LONGFORM_MODEL", "")},
+}
+DEFAULT_TIER = "longform"
+# Anything longer than this is treated as long-form whatever it asks
+LONGFORM_MIN_WORDS = 40
+
+GREETING_PHRASE = (
+    r"(?:hi|hii+|hello|hey|hiya|yo|salam|assalam\w*|good\s+(?:morning|afternoon|evening|day)|greetings|"
+    r"thanks?|thank\s+you|thx|cheers|ok(?:ay)?|cool|great|bye|goodbye|see\s+you|"
+    r"who\s+are\s+you|what\s+can\s+you\s+do|how\s+are\s+you|what(?:'s|\s+is)\s+your\s+name|"
+    r"there|so\s+much|a\s+lot|again|all|everyone|bot)"
+)
+# The whole message must be greeting phrases: "thanks, what is double materiality?" is a question
+GREETING_RE = re.compile(rf"^\W*{GREETING_PHRASE}(?:\W+{GREETING_PHRASE})*\W*$", re.IGNORECASE)
+LONGFORM_RE = re.compile(
+    r"\b(?:compare|comparison|comparing|versus|vs\.?|differences?\s+between|differ|contrast|"
+    r"implement\w*|roadmap|step[\s\-]by[\s\-]step|steps|strategy|strategies|plan|checklist|"
+    r"in\s+detail|detailed|comprehensive|thorough|elaborate|"
+    r"how\s+(?:do|can|should|would)\s+(?:i|we|you|a|an|the|our|my|companies)|"
+    r"best\s+practices?|pros\s+and\s+cons|challenges|gap\s+analysis|evaluate|assess\w*|draft|write)\b",
+    re.IGNORECASE,
+)
+
+QUERY_TIERS = counter("query_tier_total", "Questions routed per tier")
+TIER_LATENCY = histogram("llm_latency_by_tier_seconds", "LLM answer latency per query tier")
+
+
+def classify_query(question):
+    """greeting / factual / longform for the question - a few regex scans, microseconds"""
+    words = len(question.split())
+    if words > LONGFORM_MIN_WORDS or LONGFORM_RE.search(question):
+        return "longform"
+    topics = get_topic_router().matches(question)
+    if len(topics) > 1:
+        # Several frameworks in one question ("CSRD and SFDR?") is a comparison in disguise
+        return "longform"
+    if not topics and words <= 8 and GREETING_RE.search(question):
+        return "greeting"
+    return "factual"
+
+
+def route_query(question):
+    """(tier, settings) for the question; the tier is counted in query_tier_total"""
+    tier = classify_query(question)
+    QUERY_TIERS.inc(tier=tier)
+    return tier, TIERS[tier]
+
+
+def tier_stats():
+    """{tier: {"questions", "llm_p50_s", "llm_p95_s"}} from the metrics registry"""
+    return {
+        tier: {
+            "questions": QUERY_TIERS.value(tier=tier),
+            "llm_p50_s": TIER_LATENCY.quantile(0.5, tier=tier),
+            "llm_p95_s": TIER_LATENCY.quantile(0.95, tier=tier),
+        }
+        for tier in TIERS
+    }
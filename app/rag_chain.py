@@ -1,68 +1,39 @@
 """
-RAG CHAIN WITH FIREWORKS AI - FULL RESPONSE VERSION
-No token limits - AI gives complete answers for all queries
+RAG CHAIN WITH FIREWORKS AI
+Prompt, token budget and model are chosen per query tier (app/query_router.py):
+greetings get a short reply, factual questions a concise one, long-form questions the full answer
 """
 
+import asyncio
 import os
-import requests
+import threading
+import time
 import json
+import httpx
 from dotenv import load_dotenv
 
+from app.answer_cache import get_answer_cache
+from app.gap_scheduler import get_gap_scheduler
+from app.llm_client import FIREWORKS_API_URL, LLM_TIMEOUT_S, get_async_http_client, get_http_client, llm_timeout
+from app.llm_usage import estimate_tokens, record_response_usage, record_usage
+from app.metrics import histogram
+from app.query_router import DEFAULT_TIER, TIER_LATENCY, TIERS, route_query
+from app.resilience import ProviderError, ProviderUnavailable, ResilientCaller, get_breaker
+from app.retriever import get_retriever, format_context
+from app.singleflight import flight_key, get_singleflight
+from app.topic_router import get_topic_router
+
 load_dotenv()
 
-class ESGKnowledgeBase:
-    """Local ESG knowledge base"""
-    
-    @staticmethod
-    def get_local_answer(question):
-        """Return basic ESG answers"""
-        question_lower = question.lower()
-        
-        if any(word in question_lower for word in ["esrs", "european sustainability"]):
-            return """**📊 ESRS (European Sustainability Reporting Standards)**
-
-**Key Requirements:**
-- Environmental disclosures (climate, pollution, water, biodiversity)
-- Social disclosures (workforce, supply chain, communities)
-- Governance disclosures (ethics, anti-corruption)
-- Digital reporting format (XHTML)
-- Limited assurance requirement
-- Applies to large EU companies from 2024"""
-        
-        elif any(word in question_lower for word in ["gri", "global reporting"]):
-            return """**🌍 GRI Standards**
-
-**Structure:**
-- Universal standards (GRI 101, 102, 103)
-- Topic standards (200: Economic, 300: Environmental, 400: Social)
-- Used by 15,000+ organizations globally
-- Stakeholder-focused reporting"""
-        
-        elif any(word in question_lower for word in ["csrd", "corporate sustainability"]):
-            return """**🇪🇺 CSRD (Corporate Sustainability Reporting Directive)**
-
-**Scope:**
-- Large EU companies (250+ employees, €40M+ turnover)
-- Listed SMEs
-- Non-EU companies with significant EU operations
-- Phased implementation 2024-2028"""
-        
-        elif any(word in question_lower for word in ["esg", "environmental social governance"]):
-            return """**📈 ESG Framework**
-
-**Components:**
-- Environmental: Climate, resources, pollution
-- Social: Labor, diversity, human rights
-- Governance: Ethics, transparency, risk management
-
-**Benefits:**
-- Risk mitigation
-- Cost savings
-- Investor attraction
-- Regulatory compliance"""
-        
-        else:
-            return """**🤖 ESG Compliance Assistant**
+# Stream answers token by token to the UI (STREAM_ANSWERS=0 waits for the full answer)
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "1") == "1"
+FALLBACK_MESSAGE = "I'm currently experiencing technical difficulties. Please try again or ask about specific ESG topics."
+NO_AI_MESSAGE = "I'm currently running without AI assistance. Please ask about ESRS, GRI, CSRD, or other ESG topics for detailed information."
+ENHANCED_HEADER = "\n\n---\n\n**🤖 AI-Enhanced Insights:**\n"
+
+RETRIEVAL_LATENCY = histogram("retrieval_seconds", "Corpus retrieval latency (query embedding + index search)")
+LLM_TTFT = histogram("llm_ttft_seconds", "Time to the first streamed LLM token per query tier")
+LOCAL_ONLY_MESSAGE = """**🤖 ESG Compliance Assistant**
 
 I can help with:
 - ESRS (European Sustainability Reporting Standards)
@@ -73,10 +44,93 @@ I can help with:
 
 Ask me anything about ESG!"""
 
+
+def _prompt_text(payload):
+    return "".join(message["content"] for message in payload["messages"])
+
+
+def _record_stream_usage(payload, chunks):
+    """Streamed responses carry no usage block: estimate prompt tokens, count a token per chunk"""
+    record_usage(payload["model"], estimate_tokens(_prompt_text(payload)), chunks, source="estimate")
+
+
+def _sse_delta(line):
+    """Content delta of one chat-completions SSE line ("" if it has none, None at the end of the stream)"""
+    if not line or not line.startswith("data:"):
+        return ""
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    choices = json.loads(data).get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class AnswerStream:
+    """
+    Answer text chunks, yielded as the provider streams them (`async for` in handlers, `for` elsewhere).
+    After iteration `answer` holds the final text; `fell_back` is True when the AI part failed mid-stream
+    and `answer` is the fallback that should replace whatever was shown. cancel() may be called from
+    another task or thread (e.g. when the user disconnects) and stops the stream at the next chunk.
+    """
+
+    def __init__(self, assistant=None, question="", local_answer=None, context_docs=None, cache_scope="",
+                 tier=DEFAULT_TIER, text=None):
+        self.assistant = assistant
+        self.question = question
+        self.local_answer = local_answer
+        self.context_docs = context_docs
+        self.cache_scope = cache_scope
+        self.tier = tier
+        self.text = text
+        self.answer = ""
+        self.fell_back = False
+        self.cancelled = False
+        self.ttft_s = None
+        self.total_s = None
+        # True when the stream followed an identical one already in flight instead of calling the provider
+        self.coalesced = False
+        self._cancel = threading.Event()
+
+    @classmethod
+    def from_text(cls, text):
+        """A stream of an answer that is already complete (local / cached / no AI)"""
+        return cls(text=text)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def __iter__(self):
+        if self.text is not None:
+            self.answer = self.text
+            yield self.text
+            return
+        yield from self.assistant._stream(self)
+
+    async def __aiter__(self):
+        if self.text is not None:
+            self.answer = self.text
+            yield self.text
+            return
+        async for token in self.assistant._astream(self):
+            yield token
+
+
+class ESGKnowledgeBase:
+    """Local ESG knowledge base (topics and answers in app/data/topics.json)"""
+    
+    @staticmethod
+    def get_local_answer(question):
+        """Return the stored answer for the topic the question is about, or None if no topic matches"""
+        topic = get_topic_router().match(question)
+        return topic.get("answer") if topic else None
+
 class FireworksAIAssistant:
     """Fireworks AI integration with Kimi K2 Instruct model"""
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, answer_cache=None):
+        self.answer_cache = answer_cache
         try:
             # Get API key from environment or parameter
             self.api_key = api_key or os.getenv("FIREWORKS_API_KEY")
@@ -89,7 +143,11 @@ class FireworksAIAssistant:
                 return
             
             # Fireworks AI configuration
-            self.url = "https://api.fireworks.ai/inference/v1/chat/completions"
+            self.url = FIREWORKS_API_URL
+            # Retry / circuit breaker / latency budget, shared by every chain calling Fireworks
+            self.resilience = ResilientCaller(get_breaker("fireworks"))
+            # Coalesces identical in-flight prompts across sessions (see app/singleflight.py)
+            self.flight = get_singleflight("fireworks")
             self.model = "accounts/fireworks/models/kimi-k2-instruct-0905"
             self.available = True
             print("✅ Fireworks AI (Kimi K2) Connected")
@@ -98,21 +156,55 @@ class FireworksAIAssistant:
             print(f"❌ Fireworks AI setup failed: {e}")
             self.available = False
     
-    def enhance_answer(self, question, local_answer=None):
-        """Get AI response (with or without local answer) - FULL LENGTH"""
-        if not self.available:
-            return local_answer or "I'm currently running without AI assistance. Please ask about ESRS, GRI, CSRD, or other ESG topics for detailed information."
+    def _model(self, tier):
+        return TIERS[tier]["model"] or self.model
+
+    def _cache_key(self, local_answer, cache_scope, tier=DEFAULT_TIER):
+        return f"{self._model(tier)}|{tier}|{'enhance' if local_answer else 'full'}|{cache_scope}"
+
+    def _payload(self, question, local_answer=None, context_docs=None, stream=False, tier=DEFAULT_TIER):
+        """Chat-completions request body for the question: prompt, token budget and model of its tier"""
+        settings = TIERS[tier]
+        max_tokens = settings["max_tokens"]
+        temperature = settings["temperature"]
+        model = self._model(tier)
+        print(f"🚀 Tier {tier}: max_tokens={max_tokens}, model={model.rsplit('/', 1)[-1]}")
+
+        # Retrieved regulation chunks are injected into whichever prompt is used
+        context_section = ""
+        if context_docs:
+            context_section = f"""
+
+Relevant legal content:
+{format_context(context_docs)}
+
+Use the legal content above where it is relevant and cite it by its [number] and document name."""
         
-        try:
-            # ✨ REMOVED OPTIMIZATION - Always use full token limit
-            max_tokens = 4096  # Full response for ALL queries
-            temperature = 0.6
-            print(f"🚀 Using full AI response (max_tokens={max_tokens})")
-            
-            # Prepare different prompts based on whether we have local answer
-            if local_answer:
-                # Enhance existing answer
-                prompt = f"""You are an ESG (Environmental, Social, Governance) compliance expert. 
+        # Prepare different prompts based on the tier and whether we have local answer
+        if tier == "greeting":
+            prompt = f"""You are a friendly ESG (Environmental, Social, Governance) compliance assistant.
+
+User's message: {question}
+
+Reply briefly and warmly in one to three sentences. Where it fits, mention that you can help with ESRS, GRI, CSRD, SASB and other ESG compliance questions, and review uploaded ESG documents."""
+        elif tier == "factual" and local_answer:
+            prompt = f"""You are an ESG (Environmental, Social, Governance) compliance expert.
+Add the most relevant details to the following answer.
+
+QUESTION: {question}
+
+CURRENT ANSWER: {local_answer}
+
+Add only what directly answers the question (key requirements, scope, dates, thresholds) in a few short paragraphs or bullet points. Do not repeat the current answer.{context_section}"""
+        elif tier == "factual":
+            prompt = f"""You are a knowledgeable ESG (Environmental, Social, Governance) compliance expert assistant.
+
+User's question: {question}
+
+Answer the question directly and accurately in a few short paragraphs or bullet points. Focus on the facts asked for (requirements, scope, dates, thresholds) and skip general background.{context_section}"""
+        elif local_answer:
+            # Enhance existing answer
+            prompt = f"""You are an ESG (Environmental, Social, Governance) compliance expert. 
 Enhance the following answer with more details and practical insights.
 
 QUESTION: {question}
@@ -127,10 +219,10 @@ Please add:
 5. Best practices from leading companies
 
 Keep the tone professional and focused on compliance requirements.
-Structure the answer clearly with headings and bullet points where helpful."""
-            else:
-                # Generate complete response for ANY question
-                prompt = f"""You are a friendly and knowledgeable ESG (Environmental, Social, Governance) compliance expert assistant.
+Structure the answer clearly with headings and bullet points where helpful.{context_section}"""
+        else:
+            # Generate complete response for ANY question
+            prompt = f"""You are a friendly and knowledgeable ESG (Environmental, Social, Governance) compliance expert assistant.
 
 User's question: {question}
 
@@ -143,87 +235,338 @@ You specialize in:
 - SASB (Sustainability Accounting Standards Board)
 - ESG compliance and implementation
 
-Respond in a helpful, conversational tone. Give a thorough, complete answer."""
-
-            # Prepare request payload - Fireworks AI format
-            payload = {
-                "model": self.model,
-                "max_tokens": max_tokens,
-                "top_p": 1,
-                "top_k": 40,
-                "presence_penalty": 0,
-                "frequency_penalty": 0,
-                "temperature": temperature,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            }
-            
-            headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            # Make API request with timeout
-            print(f"⏳ Calling Fireworks AI (timeout: 90s)...")
-            response = requests.request(
-                "POST",
-                self.url,
-                headers=headers,
-                data=json.dumps(payload),
-                timeout=90  # Increased timeout for longer responses
-            )
-            
-            # Check response
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result['choices'][0]['message']['content'].strip()
-                print(f"✅ AI response received ({len(ai_response)} chars)")
-                
-                # Return formatted response based on type
-                if local_answer:
-                    return f"""{local_answer}
-
----
-
-**🤖 AI-Enhanced Insights:**
-{ai_response}"""
-                else:
-                    return ai_response
-            else:
-                print(f"⚠️ Fireworks AI error {response.status_code}: {response.text}")
-                return local_answer or "I'm currently experiencing technical difficulties. Please try again or ask about specific ESG topics."
-            
-        except requests.exceptions.Timeout:
-            print("⚠️ AI request timeout (90s exceeded) - using local answer")
+Respond in a helpful, conversational tone. Give a thorough, complete answer.{context_section}"""
+
+        # Prepare request payload - Fireworks AI format
+        payload = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "top_p": 1,
+            "top_k": 40,
+            "presence_penalty": 0,
+            "frequency_penalty": 0,
+            "temperature": temperature,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _headers(self, stream=False):
+        return {
+            "Accept": "text/event-stream" if stream else "application/json",
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    def _cached(self, question, local_answer, cache_scope, tier):
+        """(answer or None, cache key) - the answer when no provider call is needed"""
+        if not self.available:
+            return local_answer or NO_AI_MESSAGE, None
+        # Near-identical earlier questions are answered from the semantic cache
+        scope = self._cache_key(local_answer, cache_scope, tier)
+        if self.answer_cache:
+            cached = self.answer_cache.get(question, scope)
+            if cached is not None:
+                return cached, scope
+        return None, scope
+
+    async def _acached(self, question, local_answer, cache_scope, tier):
+        """_cached for async handlers: the lookup embeds the question and reads SQLite, so it runs in a worker thread"""
+        if not self.answer_cache or not self.available:
+            return self._cached(question, local_answer, cache_scope, tier)
+        return await asyncio.to_thread(self._cached, question, local_answer, cache_scope, tier)
+
+    def _cache_put(self, question, answer, scope, latency_s):
+        if self.answer_cache:
+            self.answer_cache.put(question, answer, scope, latency_s=latency_s)
+
+    async def _acache_put(self, question, answer, scope, latency_s):
+        if self.answer_cache:
+            await asyncio.to_thread(self.answer_cache.put, question, answer, scope, latency_s=latency_s)
+
+    def _answer_from_response(self, response, payload, local_answer, start, tier):
+        """(answer, latency_s) from a chat-completions response"""
+        if response.status_code != 200:
+            raise ProviderError(f"Fireworks AI error {response.status_code}: {response.text}")
+        result = response.json()
+        ai_response = result['choices'][0]['message']['content'].strip()
+        latency_s = time.perf_counter() - start
+        TIER_LATENCY.observe(latency_s, tier=tier)
+        record_response_usage(payload["model"], result, _prompt_text(payload), ai_response)
+        print(f"✅ AI response received ({len(ai_response)} chars in {latency_s:.1f}s, tier {tier})")
+
+        # Return formatted response based on type
+        if local_answer:
+            answer = f"{local_answer}{ENHANCED_HEADER}{ai_response}"
+        else:
+            answer = ai_response
+        return answer, latency_s
+
+    @staticmethod
+    def _answer_from_error(error, local_answer):
+        if isinstance(error, ProviderUnavailable):
+            print(f"⚡ Fireworks AI unavailable ({error}) - using local answer")
+        elif isinstance(error, ProviderError):
+            print(f"⚠️ {error}")
+        elif isinstance(error, httpx.TimeoutException):
+            print(f"⚠️ AI request timeout ({LLM_TIMEOUT_S:.0f}s exceeded) - using local answer")
             print("   This might be a network issue. Try again or check your connection.")
-            return local_answer
-        except Exception as e:
-            print(f"⚠️ AI enhancement failed: {e}")
+        else:
+            print(f"⚠️ AI enhancement failed: {error}")
             import traceback
             traceback.print_exc()
-            return local_answer
+        return local_answer or FALLBACK_MESSAGE
+
+    def enhance_answer(self, question, local_answer=None, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """Get AI response (with or without local answer) for the query tier"""
+        answer, scope = self._cached(question, local_answer, cache_scope, tier)
+        if answer is not None:
+            return answer
+        try:
+            payload = self._payload(question, local_answer, context_docs, tier=tier)
+            client = get_http_client()
+
+            def call():
+                print(f"⏳ Calling Fireworks AI (timeout: {LLM_TIMEOUT_S:.0f}s)...")
+                start = time.perf_counter()
+                response = self.resilience.call(
+                    lambda timeout: client.post(self.url, headers=self._headers(), content=json.dumps(payload), timeout=timeout),
+                    llm_timeout(),
+                )
+                answer, latency_s = self._answer_from_response(response, payload, local_answer, start, tier)
+                self._cache_put(question, answer, scope, latency_s)
+                return answer
+
+            # Identical prompts already in flight (same question from many sessions) share one call
+            return self.flight.do(flight_key(payload), call)
+        except Exception as e:
+            return self._answer_from_error(e, local_answer)
+
+    async def aenhance_answer(self, question, local_answer=None, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """enhance_answer for async handlers - waits on the pooled async client without blocking the loop"""
+        answer, scope = await self._acached(question, local_answer, cache_scope, tier)
+        if answer is not None:
+            return answer
+        try:
+            payload = self._payload(question, local_answer, context_docs, tier=tier)
+            client = get_async_http_client()
+
+            async def call():
+                print(f"⏳ Calling Fireworks AI (timeout: {LLM_TIMEOUT_S:.0f}s)...")
+                start = time.perf_counter()
+                response = await self.resilience.acall(
+                    lambda timeout: client.post(self.url, headers=self._headers(), content=json.dumps(payload), timeout=timeout),
+                    llm_timeout(),
+                )
+                answer, latency_s = self._answer_from_response(response, payload, local_answer, start, tier)
+                await self._acache_put(question, answer, scope, latency_s)
+                return answer
+
+            return await self.flight.ado(flight_key(payload), call)
+        except Exception as e:
+            return self._answer_from_error(e, local_answer)
+
+    def stream_answer(self, question, local_answer=None, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """Like enhance_answer, but returns an AnswerStream that yields the answer as it is generated"""
+        answer, scope = self._cached(question, local_answer, cache_scope, tier)
+        if answer is not None:
+            return AnswerStream.from_text(answer)
+        return AnswerStream(self, question, local_answer, context_docs, scope, tier)
+
+    async def astream_answer(self, question, local_answer=None, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """stream_answer for async handlers (cache lookup off the event loop)"""
+        answer, scope = await self._acached(question, local_answer, cache_scope, tier)
+        if answer is not None:
+            return AnswerStream.from_text(answer)
+        return AnswerStream(self, question, local_answer, context_docs, scope, tier)
+
+    def _stream_payload(self, stream):
+        return self._payload(stream.question, stream.local_answer, stream.context_docs, stream=True, tier=stream.tier)
+
+    def _stream_request(self, payload):
+        print(f"⏳ Streaming from Fireworks AI (timeout: {LLM_TIMEOUT_S:.0f}s between chunks)...")
+        return {"method": "POST", "url": self.url, "headers": self._headers(stream=True), "content": json.dumps(payload)}
+
+    def _stream(self, stream):
+        """Generator behind AnswerStream (sync): SSE request and token relay"""
+        # The local answer is shown straight away; AI insights are appended as they arrive
+        prefix = f"{stream.local_answer}{ENHANCED_HEADER}" if stream.local_answer else ""
+        if prefix:
+            yield prefix
+        parts = []
+        start = time.perf_counter()
+        try:
+            client = get_http_client()
+            payload = self._stream_payload(stream)
+            request = self._stream_request(payload)
+            response = self.resilience.call(
+                lambda timeout: client.send(client.build_request(timeout=timeout, **request), stream=True),
+                llm_timeout(),
+            )
+            try:
+                if response.status_code != 200:
+                    response.read()
+                    raise ProviderError(f"Fireworks AI error {response.status_code}: {response.text}")
+                for line in response.iter_lines():
+                    if stream._cancel.is_set():
+                        break
+                    # After [DONE] (None) keep reading to the end so the connection goes back to the pool
+                    token = _sse_delta(line)
+                    if token:
+                        if stream.ttft_s is None:
+                            stream.ttft_s = time.perf_counter() - start
+                        parts.append(token)
+                        yield token
+            finally:
+                response.close()
+                if response.status_code == 200:
+                    _record_stream_usage(payload, len(parts))
+        except GeneratorExit:
+            stream.cancel()
+            self._finish_stream(stream, prefix, parts, start)
+            raise
+        except Exception as e:
+            self._stream_failed(stream, parts, e)
+        if self._finish_stream(stream, prefix, parts, start):
+            self._cache_put(stream.question, stream.answer, stream.cache_scope, stream.total_s)
+
+    async def _aupstream(self, payload):
+        """Tokens of one SSE response - run once per flight and shared by every coalesced stream"""
+        client = get_async_http_client()
+        request = self._stream_request(payload)
+        response = await self.resilience.acall(
+            lambda timeout: client.send(client.build_request(timeout=timeout, **request), stream=True),
+            llm_timeout(),
+        )
+        chunks = 0
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise ProviderError(f"Fireworks AI error {response.status_code}: {response.text}")
+            async for line in response.aiter_lines():
+                token = _sse_delta(line)
+                if token:
+                    chunks += 1
+                    yield token
+        finally:
+            await response.aclose()
+            if response.status_code == 200:
+                _record_stream_usage(payload, chunks)
+
+    async def _astream(self, stream):
+        """Generator behind AnswerStream (async): same as _stream, with identical in-flight streams coalesced"""
+        prefix = f"{stream.local_answer}{ENHANCED_HEADER}" if stream.local_answer else ""
+        if prefix:
+            yield prefix
+        parts = []
+        start = time.perf_counter()
+        try:
+            payload = self._stream_payload(stream)
+            key = flight_key(payload)
+            stream.coalesced = self.flight.streaming(key)
+            # A caller joining late replays the tokens streamed so far, then follows live
+            tokens = self.flight.astream(key, lambda: self._aupstream(payload))
+            try:
+                async for token in tokens:
+                    if stream._cancel.is_set():
+                        break
+                    if stream.ttft_s is None:
+                        stream.ttft_s = time.perf_counter() - start
+                    parts.append(token)
+                    yield token
+            finally:
+                # Leaving the flight; the upstream stream is closed once nobody follows it
+                await tokens.aclose()
+        except (asyncio.CancelledError, GeneratorExit):
+            # Task cancelled (stop / disconnect) or the consumer closed the stream
+            stream.cancel()
+            self._finish_stream(stream, prefix, parts, start)
+            raise
+        except Exception as e:
+            self._stream_failed(stream, parts, e)
+        if self._finish_stream(stream, prefix, parts, start):
+            await self._acache_put(stream.question, stream.answer, stream.cache_scope, stream.total_s)
+
+    @staticmethod
+    def _stream_failed(stream, parts, error):
+        if not stream._cancel.is_set():
+            print(f"⚠️ AI stream failed after {sum(map(len, parts))} chars: {error} - using local answer")
+            stream.fell_back = True
+
+    def _finish_stream(self, stream, prefix, parts, start):
+        """Final answer, fallback and TTFT / latency logging; True when the answer should be cached"""
+        stream.total_s = time.perf_counter() - start
+        ai_response = "".join(parts).strip()
+        ttft = f"{stream.ttft_s * 1000:.0f}ms" if stream.ttft_s is not None else "n/a"
+        if stream.ttft_s is not None:
+            LLM_TTFT.observe(stream.ttft_s, tier=stream.tier)
+
+        if stream._cancel.is_set():
+            stream.cancelled = True
+            stream.answer = prefix + ai_response
+            print(f"🛑 AI stream cancelled after {len(ai_response)} chars (TTFT {ttft}, {stream.total_s:.1f}s)")
+        elif stream.fell_back:
+            if stream.local_answer:
+                stream.answer = stream.local_answer
+            elif ai_response:
+                stream.answer = f"{ai_response}\n\n⚠️ *The response was interrupted. Please try again for the full answer.*"
+            else:
+                stream.answer = FALLBACK_MESSAGE
+        else:
+            stream.answer = prefix + ai_response
+            TIER_LATENCY.observe(stream.total_s, tier=stream.tier)
+            print(f"✅ AI response streamed ({len(ai_response)} chars, TTFT {ttft}, total {stream.total_s:.1f}s, tier {stream.tier})")
+            # Coalesced streams leave caching to the stream that made the call
+            return bool(ai_response) and not stream.coalesced
+        return False
 
 
 class AIEnhancedRAGChain:
     """Hybrid RAG chain with local knowledge + Fireworks AI enhancement"""
     
-    def __init__(self, use_ai=True):
+    def __init__(self, use_ai=True, use_retrieval=True, use_cache=True, executor=None):
         self.local_kb = ESGKnowledgeBase()
         self.use_ai = use_ai
+        # Pool for aretrieve (None = the event loop's default executor)
+        self.executor = executor
+        # Shared per process - loading the index per chain would cost seconds and hundreds of MB
+        self.retriever = get_retriever() if use_retrieval else None
+        # The cache embeds questions with the retriever's model and is tied to its index version
+        self.answer_cache = get_answer_cache() if use_retrieval and use_cache else None
         
         if use_ai:
-            self.ai_assistant = FireworksAIAssistant()
+            self.ai_assistant = FireworksAIAssistant(answer_cache=self.answer_cache)
         else:
             self.ai_assistant = None
             print("ℹ️ Running in local-only mode")
     
-    def get_answer(self, question):
-        """Get enhanced answer - ALWAYS use AI with FULL responses"""
+    def retrieve(self, question, filters=None):
+        """Top-k corpus chunks for the question (empty when no index is available)"""
+        if not self.retriever:
+            return []
+        try:
+            start = time.perf_counter()
+            docs = self.retriever.search(question, filters=filters)
+            elapsed = time.perf_counter() - start
+            RETRIEVAL_LATENCY.observe(elapsed)
+            print(f"📚 Retrieved {len(docs)} chunks in {elapsed * 1000:.1f}ms")
+            return docs
+        except Exception as e:
+            print(f"⚠️ Retrieval failed: {e}")
+            return []
+
+    async def aretrieve(self, question, filters=None):
+        """retrieve() off the event loop (query embedding and index search are CPU-bound)"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.retrieve, question, filters)
+
+    def get_answer(self, question, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """Get enhanced answer - ALWAYS use AI, with the prompt and budget of the query tier"""
         # Get local answer first (may be None for casual questions)
         local_answer = self.local_kb.get_local_answer(question)
         
@@ -240,69 +583,146 @@ class AIEnhancedRAGChain:
             else:
                 print(f"🤖 Using AI to enhance answer...")
             
-            # Get FULL AI response (no optimization)
-            return self.ai_assistant.enhance_answer(question, local_answer)
+            return self.ai_assistant.enhance_answer(question, local_answer, context_docs, cache_scope, tier)
         
         # Fallback to local answer or default message
-        return local_answer or """**🤖 ESG Compliance Assistant**
+        return local_answer or LOCAL_ONLY_MESSAGE
 
-I can help with:
-- ESRS (European Sustainability Reporting Standards)
-- GRI (Global Reporting Initiative)
-- CSRD (Corporate Sustainability Reporting Directive)
-- SASB (Sustainability Accounting Standards Board)
-- General ESG compliance
+    async def aget_answer(self, question, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """get_answer for async handlers"""
+        local_answer = self.local_kb.get_local_answer(question)
+        if self.use_ai and self.ai_assistant and self.ai_assistant.available:
+            print(f"🤖 Using AI {'to enhance answer' if local_answer else 'for complete response'}...")
+            return await self.ai_assistant.aenhance_answer(question, local_answer, context_docs, cache_scope, tier)
+        return local_answer or LOCAL_ONLY_MESSAGE
 
-Ask me anything about ESG!"""
+    def stream_answer(self, question, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """Like get_answer, but returns an AnswerStream"""
+        local_answer = self.local_kb.get_local_answer(question)
+        if self.use_ai and self.ai_assistant and self.ai_assistant.available:
+            print(f"🤖 Streaming AI {'enhancement' if local_answer else 'response'}...")
+            return self.ai_assistant.stream_answer(question, local_answer, context_docs, cache_scope, tier)
+        return AnswerStream.from_text(local_answer or LOCAL_ONLY_MESSAGE)
+
+    async def astream_answer(self, question, context_docs=None, cache_scope="", tier=DEFAULT_TIER):
+        """stream_answer for async handlers"""
+        local_answer = self.local_kb.get_local_answer(question)
+        if self.use_ai and self.ai_assistant and self.ai_assistant.available:
+            print(f"🤖 Streaming AI {'enhancement' if local_answer else 'response'}...")
+            return await self.ai_assistant.astream_answer(question, local_answer, context_docs, cache_scope, tier)
+        return AnswerStream.from_text(local_answer or LOCAL_ONLY_MESSAGE)
 
 
 class RAGChainWrapper:
     """Wrapper for Chainlit compatibility"""
     
-    def __init__(self, use_ai=True):
-        self.chain = AIEnhancedRAGChain(use_ai=use_ai)
-        print("✅ Fireworks AI-Enhanced RAG Chain Ready (Full Response Mode)")
+    def __init__(self, use_ai=True, use_retrieval=True, use_cache=True, executor=None):
+        self.chain = AIEnhancedRAGChain(use_ai=use_ai, use_retrieval=use_retrieval, use_cache=use_cache,
+                                        executor=executor)
+        print("✅ Fireworks AI-Enhanced RAG Chain Ready (tiered responses)")
     
-    def invoke(self, inputs):
-        """Handle all input types"""
-        # Extract question
+    @staticmethod
+    def _parse_inputs(inputs):
+        """(question, filters) from a string or a {"query"/"question", "filters"} dict"""
+        # Optional metadata filters, e.g. {"jurisdiction": "EU"}
+        filters = None
         if isinstance(inputs, str):
             question = inputs
         elif isinstance(inputs, dict):
             question = inputs.get("query") or inputs.get("question") or str(inputs)
+            filters = inputs.get("filters")
         else:
             question = str(inputs)
-        
+        return question, filters
+
+    @staticmethod
+    def _route(question):
+        tier, settings = route_query(question)
+        print(f"🧭 Query tier: {tier} (max_tokens={settings['max_tokens']})")
+        return tier
+
+    def invoke(self, inputs):
+        """Handle all input types"""
+        question, filters = self._parse_inputs(inputs)
         print(f"🔍 Processing: {question[:50]}...")
+        tier = self._route(question)
         
-        # Get answer
-        answer = self.chain.get_answer(question)
+        # Retrieve supporting chunks, then answer with them in the prompt (greetings need none)
+        source_documents = self.chain.retrieve(question, filters) if tier != "greeting" else []
+        # Answers retrieved under different filters must not be served for each other
+        cache_scope = json.dumps(filters, sort_keys=True) if filters else ""
+        answer = self.chain.get_answer(question, source_documents, cache_scope, tier)
         
         # Return in expected format
         return {
             "query": question,
             "result": answer,
-            "source_documents": []
+            "source_documents": source_documents
         }
     
+    def stream(self, inputs):
+        """Like invoke, but "result" is an AnswerStream to iterate for the answer text"""
+        question, filters = self._parse_inputs(inputs)
+        print(f"🔍 Processing (streaming): {question[:50]}...")
+        tier = self._route(question)
+        source_documents = self.chain.retrieve(question, filters) if tier != "greeting" else []
+        cache_scope = json.dumps(filters, sort_keys=True) if filters else ""
+        return {
+            "query": question,
+            "result": self.chain.stream_answer(question, source_documents, cache_scope, tier),
+            "source_documents": source_documents
+        }
+
+    async def ainvoke(self, inputs):
+        """invoke for async handlers: retrieval runs in a worker thread, the LLM call on the pooled async client"""
+        question, filters = self._parse_inputs(inputs)
+        print(f"🔍 Processing: {question[:50]}...")
+        tier = self._route(question)
+        source_documents = await self.chain.aretrieve(question, filters) if tier != "greeting" else []
+        cache_scope = json.dumps(filters, sort_keys=True) if filters else ""
+        return {
+            "query": question,
+            "result": await self.chain.aget_answer(question, source_documents, cache_scope, tier),
+            "source_documents": source_documents
+        }
+
+    async def astream(self, inputs):
+        """stream for async handlers - iterate "result" with `async for`"""
+        question, filters = self._parse_inputs(inputs)
+        print(f"🔍 Processing (streaming): {question[:50]}...")
+        tier = self._route(question)
+        source_documents = await self.chain.aretrieve(question, filters) if tier != "greeting" else []
+        cache_scope = json.dumps(filters, sort_keys=True) if filters else ""
+        return {
+            "query": question,
+            "result": await self.chain.astream_answer(question, source_documents, cache_scope, tier),
+            "source_documents": source_documents
+        }
+
     def __call__(self, inputs):
         return self.invoke(inputs)
 
 
-def load_rag_chain(use_ai=True):
+def load_rag_chain(use_ai=True, use_retrieval=True, use_cache=True, executor=None):
     """Load the RAG chain with optional Fireworks AI enhancement"""
-    print(f"🚀 Loading {'Fireworks AI-Enhanced ' if use_ai else ''}RAG Chain (Full Response Mode)...")
-    return RAGChainWrapper(use_ai=use_ai)
+    print(f"🚀 Loading {'Fireworks AI-Enhanced ' if use_ai else ''}RAG Chain (tiered responses)...")
+    return RAGChainWrapper(use_ai=use_ai, use_retrieval=use_retrieval, use_cache=use_cache, executor=executor)
 
 
-def load_gap_analysis_chain(use_ai=True):
-    """Load gap analysis chain"""
-    return load_rag_chain(use_ai=use_ai)
+def load_gap_analysis_chain(use_ai=True, use_retrieval=True):
+    """
+    Load gap analysis chain. It has no semantic answer cache: the embedder truncates long section
+    prompts, so a revised (or another company's) section would match an old analysis. Sections are
+    cached by exact text in app/gap_cache.py instead.
+    Section retrieval runs on the gap scheduler's sized pool, apart from chat's.
+    """
+    return load_rag_chain(use_ai=use_ai, use_retrieval=use_retrieval, use_cache=False,
+                          executor=get_gap_scheduler().executor)
 
 
 # Test function
 if __name__ == "__main__":
-    print("🧪 Testing Fireworks AI-Enhanced RAG Chain (Full Response Mode)...")
+    print("🧪 Testing Fireworks AI-Enhanced RAG Chain (tiered responses)...")
     print("=" * 60)
     
     # Test with Fireworks AI
@@ -337,4 +757,9 @@ if __name__ == "__main__":
     print("1. Get API key: https://fireworks.ai/")
     print("2. Add to .env file: FIREWORKS_API_KEY=your_key_here")
     print("3. Restart the app")
-    print("\n🔥 AI now gives FULL, complete responses for ALL queries!")
\ No newline at end of file
+    print("\n📊 Questions and LLM latency per tier:")
+    from app.query_router import tier_stats
+    for tier, stats in tier_stats().items():
+        print(f"   {tier:<9} {stats}")
+    from app.singleflight import get_singleflight
+    print(f"🔗 Coalesced LLM calls: {get_singleflight('fireworks').stats()}")
\ No newline at end of file
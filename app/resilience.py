@@ -0,0 +1,195 @@
+"""
+Resilience for LLM provider calls: jittered exponential retry on 429 / 5xx / connection errors,
+a circuit breaker that short-circuits to the local answer while the provider is down, and an
+overall latency budget per request (all attempts and back-off included).
+Breaker state, transitions, retries and short-circuits are exported through app/metrics.py.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from app.metrics import counter, gauge
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_S = float(os.getenv("LLM_RETRY_BASE_S", "0.5"))
+LLM_RETRY_MAX_S = float(os.getenv("LLM_RETRY_MAX_S", "8"))
+# Per request, all attempts included; for streams it covers the wait for the response to start
+LLM_LATENCY_BUDGET_S = float(os.getenv("LLM_LATENCY_BUDGET_S", "60"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+BREAKER_STATE = gauge("llm_breaker_state", "Circuit breaker state per provider (0 closed, 1 half-open, 2 open)")
+BREAKER_TRANSITIONS = counter("llm_breaker_transitions_total", "Circuit breaker state transitions per provider")
+LLM_RETRIES = counter("llm_retries_total", "Retried provider calls by reason (status code / error)")
+LLM_SHORT_CIRCUITS = counter("llm_short_circuits_total", "Calls answered locally because the breaker was open")
+LLM_BUDGET_EXHAUSTED = counter("llm_budget_exhausted_total", "Calls abandoned because the latency budget ran out")
+
+
+class ProviderUnavailable(Exception):
+    """The provider is not called (breaker open) or gave up (budget / retries exhausted)"""
+
+
+class ProviderError(Exception):
+    """The provider answered with a non-retryable error response"""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failures; open -> half_open after `cooldown_s`,
+    letting one probe call through; the probe closes the breaker on success and reopens it on failure.
+    """
+
+    def __init__(self, name, failures=LLM_BREAKER_FAILURES, cooldown_s=LLM_BREAKER_COOLDOWN_S):
+        self.name = name
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(BREAKER_STATES["closed"], provider=name)
+
+    def _transition(self, state):
+        if state != self.state:
+            print(f"🔌 Circuit breaker {self.name}: {self.state} -> {state}")
+            BREAKER_TRANSITIONS.inc(provider=self.name, **{"from": self.state, "to": state})
+            BREAKER_STATE.set(BREAKER_STATES[state], provider=self.name)
+            self.state = state
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self._transition("half_open")
+            if self.state == "closed":
+                return True
+            # A probe that never reported back (e.g. cancelled) frees its slot after a cooldown
+            if self.state == "half_open" and (not self._probing or time.monotonic() - self._probe_started >= self.cooldown_s):
+                self._probing = True
+                self._probe_started = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._probing = False
+            self._transition("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+                self._transition("open")
+
+
+class ResilientCaller:
+    """
+    Runs send(timeout) -> httpx.Response with retry, breaker and budget.
+    Returns the first non-retryable response (the caller checks and closes it); raises
+    ProviderUnavailable when the breaker is open or retries / budget are exhausted.
+    """
+
+    def __init__(self, breaker, max_retries=LLM_MAX_RETRIES, budget_s=LLM_LATENCY_BUDGET_S,
+                 base_s=LLM_RETRY_BASE_S, max_backoff_s=LLM_RETRY_MAX_S):
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.budget_s = budget_s
+        self.base_s = base_s
+        self.max_backoff_s = max_backoff_s
+
+    def _backoff(self, attempt, response):
+        """Full-jitter exponential back-off; a Retry-After header is honoured up to the cap"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff_s)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff_s, self.base_s * 2 ** attempt))
+
+    def _start(self):
+        if not self.breaker.allow():
+            LLM_SHORT_CIRCUITS.inc(provider=self.breaker.name)
+            raise ProviderUnavailable(f"circuit breaker for {self.breaker.name} is open")
+        return time.monotonic() + self.budget_s
+
+    def _outcome(self, attempt, deadline, response=None, error=None):
+        """None to return the response, else the back-off before the next attempt (raises when giving up)"""
+        if error is None and response.status_code not in RETRYABLE_STATUS:
+            # 4xx other than 429 are request problems, not provider failures
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        reason = str(response.status_code) if error is None else type(error).__name__
+        detail = f"HTTP {response.status_code}" if error is None else f"{type(error).__name__}: {error}"
+        if attempt >= self.max_retries or self.breaker.state == "open":
+            raise ProviderUnavailable(f"{detail} after {attempt + 1} attempt(s)")
+        delay = self._backoff(attempt, response)
+        if time.monotonic() + delay >= deadline:
+            LLM_BUDGET_EXHAUSTED.inc(provider=self.breaker.name)
+            raise ProviderUnavailable(f"{detail}; latency budget ({self.budget_s:.0f}s) exhausted")
+        LLM_RETRIES.inc(provider=self.breaker.name, reason=reason)
+        print(f"🔁 {detail} - retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        return delay
+
+    def _timeout(self, deadline, timeout):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            LLM_BUDGET_EXHAUSTED.inc(provider=self.breaker.name)
+            raise ProviderUnavailable(f"latency budget ({self.budget_s:.0f}s) exhausted")
+        return httpx.Timeout(min(timeout.read, remaining), connect=min(timeout.connect, remaining),
+                             write=min(timeout.write, remaining), pool=min(timeout.pool, remaining))
+
+    def call(self, send, timeout):
+        deadline = self._start()
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = send(self._timeout(deadline, timeout))
+            except httpx.TransportError as e:
+                delay = self._outcome(attempt, deadline, error=e)
+            else:
+                delay = self._outcome(attempt, deadline, response)
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+
+    async def acall(self, send, timeout):
+        deadline = self._start()
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await send(self._timeout(deadline, timeout))
+            except httpx.TransportError as e:
+                delay = self._outcome(attempt, deadline, error=e)
+            else:
+                delay = self._outcome(attempt, deadline, response)
+                if delay is None:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(delay)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Process-wide breaker per provider, shared by every chain calling it"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
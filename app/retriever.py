@@ -0,0 +1,187 @@
+"""
+FAISS RETRIEVAL STAGE
+Loads the vector store built by app/embed.py and the embedding model ONCE per process
+and serves top-k similarity search to every chain / session. The index is memory-mapped and
+chunk text / metadata are only read for the top-k hits (see app/vector_store.py).
+Vector hits are fused with a BM25 leg (app/bm25.py) by reciprocal rank fusion, so exact
+identifiers such as "ESRS E1-6" or "GRI 305" are found even when the embedding misses them.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from dotenv import load_dotenv
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.documents import Document
+
+from app.perf import rss_mb
+from app.vector_store import LEGACY_INDEX_FILE, VectorStore
+
+load_dotenv()
+
+INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "vector_store/faiss_index")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+HYBRID_SEARCH = os.getenv("RAG_HYBRID", "1") == "1"
+HYBRID_FETCH = int(os.getenv("RAG_HYBRID_FETCH", "20"))  # candidates taken from each leg before fusion
+RRF_K = 60
+LEXICAL_BUDGET_MS = float(os.getenv("RAG_LEXICAL_BUDGET_MS", "50"))  # BM25 leg is dropped if slower
+
+# The BM25 leg runs here while the query is embedded and searched on the calling thread
+_lexical_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=RRF_K):
+    """Fuse ranked [(id, score), ...] lists: each id scores sum(1 / (rrf_k + rank))"""
+    fused = {}
+    for results in result_lists:
+        for rank, (vector_id, _) in enumerate(results, 1):
+            fused[vector_id] = fused.get(vector_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class ESGRetriever:
+    """Top-k FAISS search over the ESG regulation corpus"""
+
+    def __init__(self, index_path=INDEX_PATH, model_name=EMBEDDING_MODEL, top_k=TOP_K, hybrid=HYBRID_SEARCH):
+        self.index_path = index_path
+        self.top_k = top_k
+        self.hybrid = hybrid
+        self.available = False
+        self.stats = {"lexical_timeouts": 0, "lexical_errors": 0}
+        # Sentence-transformers models are not guaranteed to be re-entrant, FAISS reads are
+        self._embed_lock = threading.Lock()
+        # Recent query vectors, so the answer cache and the search share one embedding per question
+        self._query_vectors = OrderedDict()
+
+        if not VectorStore.exists(index_path):
+            print(f"⚠️ Vector store not found at {index_path}. Answers will not cite the corpus.")
+            if os.path.exists(os.path.join(index_path, LEGACY_INDEX_FILE)):
+                print(f"   A pickled LangChain index is there - convert it: python -m app.vector_store --convert {index_path}")
+            else:
+                print("   Build it with: python -m app.embed")
+            return
+
+        try:
+            rss_before = rss_mb()
+            start = time.perf_counter()
+            self.embeddings = HuggingFaceEmbeddings(model_name=model_name)
+            self.stats["model_load_s"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self.store = VectorStore(index_path, mode="r")
+            self.stats["index_load_s"] = time.perf_counter() - start
+
+            self.stats["vectors"] = self.store.ntotal
+            if self.hybrid and not self.store.lexical.available:
+                print(f"ℹ️ No BM25 index in {index_path} - vector search only. Add it with: "
+                      f"python -m app.vector_store --rebuild {index_path}")
+                self.hybrid = False
+            self.stats["rss_mb"] = rss_mb()
+            self.stats["rss_delta_mb"] = self.stats["rss_mb"] - rss_before
+            self.available = True
+
+            # Warm-up query so the first user does not pay for lazy initialisation
+            start = time.perf_counter()
+            self.search("ESG disclosure requirements")
+            self.stats["warmup_query_ms"] = (time.perf_counter() - start) * 1000
+            self.report()
+        except Exception as e:
+            print(f"❌ FAISS retriever setup failed: {e}")
+            self.available = False
+
+    def report(self):
+        """Print load time, query latency and memory of the retrieval stage"""
+        s = self.stats
+        print(
+            f"📚 Retriever ready: {s['vectors']} vectors ({'hybrid BM25 + vector' if self.hybrid else 'vector only'}) | "
+            f"model {s['model_load_s']:.2f}s, index {s['index_load_s']:.2f}s | "
+            f"warm-up query {s.get('warmup_query_ms', 0):.1f}ms | "
+            f"RSS {s['rss_mb']:.0f}MB (+{s['rss_delta_mb']:.0f}MB)"
+        )
+
+    def embed_query(self, question):
+        with self._embed_lock:
+            vector = self._query_vectors.get(question)
+            if vector is None:
+                vector = self._query_vectors[question] = self.embeddings.embed_query(question)
+                if len(self._query_vectors) > 256:
+                    self._query_vectors.popitem(last=False)
+            else:
+                self._query_vectors.move_to_end(question)
+            return vector
+
+    def search(self, question, k=None, filters=None):
+        """
+        Return the top-k chunks for a question as LangChain Documents.
+        filters restricts the candidates before ranking, e.g. {"jurisdiction": "EU", "framework": "ESRS"}
+        (see app.vector_store.FILTER_FIELDS).
+        """
+        if not self.available:
+            return []
+
+        k = k or self.top_k
+        start = time.perf_counter()
+        if self.hybrid:
+            lexical_future = _lexical_pool.submit(self.store.search_lexical, question, max(HYBRID_FETCH, k), filters)
+
+        query_vector = self.embed_query(question)
+        vector_hits = self.store.search(query_vector, k=max(HYBRID_FETCH, k) if self.hybrid else k, filters=filters)
+        self.stats["last_vector_ms"] = (time.perf_counter() - start) * 1000
+
+        if self.hybrid:
+            try:
+                remaining = max(LEXICAL_BUDGET_MS - (time.perf_counter() - start) * 1000, 1.0)
+                lexical_hits = lexical_future.result(timeout=remaining / 1000)
+            except FutureTimeout:
+                self.stats["lexical_timeouts"] += 1
+                print(f"⚠️ BM25 leg missed the {LEXICAL_BUDGET_MS:.0f}ms budget - using vector hits only")
+                lexical_hits = []
+            except Exception as e:
+                # The vector hits are already here: a failing lexical leg must not cost the answer its context
+                self.stats["lexical_errors"] += 1
+                print(f"⚠️ BM25 leg failed ({type(e).__name__}: {e}) - using vector hits only")
+                lexical_hits = []
+            hits = reciprocal_rank_fusion([vector_hits, lexical_hits], k)
+            vector_scores, lexical_scores = dict(vector_hits), dict(lexical_hits)
+        else:
+            hits = vector_hits
+
+        # Text and metadata are read for the hits only
+        rows = self.store.get([vector_id for vector_id, _ in hits])
+        docs = []
+        for (vector_id, score), (text, metadata) in zip(hits, rows):
+            metadata = {**metadata, "vector_id": vector_id, "score": score}
+            if self.hybrid:
+                metadata["vector_score"] = vector_scores.get(vector_id)
+                metadata["bm25_score"] = lexical_scores.get(vector_id)
+            docs.append(Document(page_content=text, metadata=metadata))
+        self.stats["last_query_ms"] = (time.perf_counter() - start) * 1000
+        return docs
+
+
+def format_context(docs, max_chars_per_doc=2000):
+    """Render retrieved chunks as a numbered, source-labelled context block for the prompt"""
+    blocks = []
+    for i, doc in enumerate(docs, 1):
+        meta = doc.metadata
+        label = meta.get("file_name") or os.path.basename(meta.get("source", "unknown"))
+        blocks.append(f"[{i}] {label} (chunk {meta.get('chunk', '?')})\n{doc.page_content[:max_chars_per_doc]}")
+    return "\n\n".join(blocks)
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever():
+    """Process-wide retriever; the index and model are loaded on first use only"""
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = ESGRetriever()
+    return _retriever
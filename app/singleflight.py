@@ -0,0 +1,202 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+The first caller for a key runs the call; callers arriving with the same key while it is in flight
+wait for the same result instead of making their own upstream call. Works for plain calls
+(sync `do`, async `ado`) and for token streams (`astream`: late joiners replay what has been
+streamed so far, then follow live).
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+from app.metrics import counter
+
+SINGLEFLIGHT_CALLS = counter("singleflight_calls_total", "Coalescable calls by flight and role (leader = upstream call, follower = coalesced)")
+
+
+class _LeaderGone(Exception):
+    """The leader was cancelled before finishing; followers retry on their own"""
+
+
+def flight_key(payload):
+    """Key of a request payload: JSON with whitespace in the messages collapsed and case folded"""
+    normalised = dict(payload)
+    normalised["messages"] = [
+        {**message, "content": " ".join(str(message.get("content", "")).split()).lower()}
+        for message in payload.get("messages", [])
+    ]
+    return hashlib.sha256(json.dumps(normalised, sort_keys=True).encode()).hexdigest()
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class _Broadcast:
+    """Chunks of one upstream stream, shared by every subscriber on the event loop"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.pump = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        """(future, is_leader) for the key"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                SINGLEFLIGHT_CALLS.inc(flight=self.name, role="follower")
+                return future, False
+            future = self._calls[key] = Future()
+            # Running futures cannot be cancelled by a follower giving up
+            future.set_running_or_notify_cancel()
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def do(self, key, fn):
+        """fn() once for all concurrent callers with this key"""
+        if _on_event_loop():
+            # Blocking on another caller's future could wait on a leader running on this very loop
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+            return fn()
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return future.result()
+                except _LeaderGone:
+                    continue
+            try:
+                result = fn()
+            except Exception as e:
+                self._finish(key, future, error=e)
+                raise
+            except BaseException:
+                self._finish(key, future, error=_LeaderGone())
+                raise
+            self._finish(key, future, result)
+            return result
+
+    async def ado(self, key, coro_fn):
+        """await coro_fn() once for all concurrent callers with this key (threads and loops included)"""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    # shield: a follower being cancelled must not cancel the shared future
+                    return await asyncio.shield(asyncio.wrap_future(future))
+                except _LeaderGone:
+                    continue
+            try:
+                result = await coro_fn()
+            except Exception as e:
+                self._finish(key, future, error=e)
+                raise
+            except BaseException:
+                self._finish(key, future, error=_LeaderGone())
+                raise
+            self._finish(key, future, result)
+            return result
+
+    def streaming(self, key):
+        """Whether astream(key) would follow a stream already in flight on the running loop"""
+        return (id(asyncio.get_running_loop()), key) in self._streams
+
+    async def astream(self, key, start):
+        """
+        Iterate the chunks of start() (an async iterator), shared by concurrent callers with this key.
+        The upstream stream runs in its own task and is only cancelled when every subscriber has left.
+        """
+        loop = asyncio.get_running_loop()
+        stream_key = (id(loop), key)
+        broadcast = self._streams.get(stream_key)
+        if broadcast is None:
+            broadcast = self._streams[stream_key] = _Broadcast()
+            broadcast.pump = loop.create_task(self._pump(stream_key, broadcast, start))
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+        else:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="follower")
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(broadcast.chunks):
+                    yield broadcast.chunks[position]
+                    position += 1
+                if broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                async with broadcast.changed:
+                    await broadcast.changed.wait_for(lambda: position < len(broadcast.chunks) or broadcast.done)
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                # Nobody is listening any more: stop the upstream stream
+                broadcast.pump.cancel()
+                self._streams.pop(stream_key, None)
+
+    async def _pump(self, stream_key, broadcast, start):
+        try:
+            async for chunk in start():
+                async with broadcast.changed:
+                    broadcast.chunks.append(chunk)
+                    broadcast.changed.notify_all()
+        except asyncio.CancelledError:
+            broadcast.error = _LeaderGone()
+            raise
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            # Later callers start a fresh stream instead of replaying a finished one
+            if self._streams.get(stream_key) is broadcast:
+                self._streams.pop(stream_key, None)
+            broadcast.done = True
+            async with broadcast.changed:
+                broadcast.changed.notify_all()
+
+    def stats(self):
+        leaders = SINGLEFLIGHT_CALLS.value(flight=self.name, role="leader")
+        followers = SINGLEFLIGHT_CALLS.value(flight=self.name, role="follower")
+        total = leaders + followers
+        return {"calls": total, "upstream": leaders, "coalesced": followers,
+                "reduction": followers / total if total else 0.0}
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_singleflight(name):
+    """Process-wide SingleFlight per name"""
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = _flights[name] = SingleFlight(name)
+        return flight
@@ -0,0 +1,99 @@
+"""
+Data-driven topic router for the local knowledge base.
+Topics (frameworks, regulations and their aliases) live in app/data/topics.json. All aliases are
+compiled into ONE case-insensitive regex, factored as a trie so matching is a single left-to-right
+scan whose cost barely grows with the size of the table.
+"""
+
+import json
+import os
+import re
+import threading
+
+TOPICS_PATH = os.getenv("TOPICS_PATH", os.path.join(os.path.dirname(__file__), "data", "topics.json"))
+
+
+def _normalise(alias):
+    """Case, whitespace and hyphens do not matter ("Climate-related" == "climate  related")"""
+    return " ".join(alias.lower().replace("-", " ").split())
+
+
+def _trie_regex(aliases):
+    """Regex source matching any alias, with shared prefixes factored out (ESRS|ESG -> ES(?:RS|G))"""
+    trie = {}
+    for alias in aliases:
+        node = trie
+        for char in alias:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def render(node):
+        end = "" in node
+        branches = []
+        for char in sorted(c for c in node if c):
+            # Spaces in aliases also match runs of whitespace and hyphens ("climate-related")
+            head = r"[\s\-]+" if char == " " else re.escape(char)
+            branches.append(head + render(node[char]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Alternatives are longest-first, so "GRI Standards" wins over "GRI"
+        return f"(?:{body})?" if end else body
+
+    return render(trie)
+
+
+class TopicRouter:
+    """Maps a question to at most one confident topic from the topic table"""
+
+    def __init__(self, topics):
+        self.topics = {topic["id"]: topic for topic in topics}
+        self._alias_topic = {}
+        for topic in topics:
+            for alias in topic.get("aliases", []) + [topic.get("name", "")]:
+                if alias.strip():
+                    self._alias_topic.setdefault(_normalise(alias), topic["id"])
+        # Word boundaries on both sides: "gri" must not fire inside "agriculture"
+        self._pattern = re.compile(r"(?<!\w)(?:" + _trie_regex(self._alias_topic) + r")(?!\w)", re.IGNORECASE)
+
+    @classmethod
+    def from_file(cls, path=TOPICS_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["topics"])
+
+    def matches(self, text):
+        """{topic id: number of alias hits} for every topic mentioned in the text"""
+        hits = {}
+        for match in self._pattern.finditer(text):
+            topic_id = self._alias_topic[_normalise(match.group(0))]
+            hits[topic_id] = hits.get(topic_id, 0) + 1
+        return hits
+
+    def match(self, text):
+        """
+        The topic the text is about, or None. Generic topics (e.g. "ESG") only win when nothing
+        specific is mentioned; a tie between specific topics ("GRI vs ESRS") is not a confident match.
+        """
+        hits = self.matches(text)
+        if not hits:
+            return None
+        specific = {topic_id: n for topic_id, n in hits.items() if not self.topics[topic_id].get("generic")}
+        candidates = specific or hits
+        ranked = sorted(candidates.items(), key=lambda item: item[1], reverse=True)
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            return None
+        return self.topics[ranked[0][0]]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_topic_router():
+    """Process-wide router, compiled on first use"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = TopicRouter.from_file()
+    return _router
@@ -1,15 +1,125 @@
+import zlib
+from functools import lru_cache
+
 import tiktoken
 
-def chunk_text(text, max_tokens=512):
-    enc = tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=None)
+def get_encoding(name="cl100k_base"):
+    """tiktoken encodings are expensive to build - keep one per name per process"""
+    return tiktoken.get_encoding(name)
+
+
+def iter_chunks(text, max_tokens=512, overlap=0, encoding_name="cl100k_base"):
+    """
+    Yield whitespace-normalised chunks of at most max_tokens tokens, cut on word boundaries.
+
+    Single pass: the document is encoded once and each word's token count is read from the
+    token offsets. cl100k never merges a token across the space separating two words, so the
+    count of " ".join(words) is the sum of the per-word counts and the boundaries match the
+    old re-encode-per-word chunker exactly. `overlap` carries up to that many tokens of
+    trailing words into the next chunk.
+    """
     words = text.split()
-    chunks, current_chunk = [], []
-
-    for word in words:
-        current_chunk.append(word)
-        if len(enc.encode(" ".join(current_chunk))) > max_tokens:
-            chunks.append(" ".join(current_chunk[:-1]))
-            current_chunk = [word]
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-    return chunks
+    if not words:
+        return
+
+    enc = get_encoding(encoding_name)
+    tokens = enc.encode(" ".join(words), disallowed_special=())
+    _, offsets = enc.decode_with_offsets(tokens)
+
+    # spaced[i]: tokens of " " + words[i] (of words[0] alone for i == 0) inside the document
+    spaced = [0] * len(words)
+    boundary, next_boundary, w = 0, len(words[0]), 0
+    for offset in offsets:
+        while w + 1 < len(words) and offset >= next_boundary:
+            w += 1
+            boundary = next_boundary
+            next_boundary = boundary + 1 + len(words[w])
+        spaced[w] += 1
+
+    def bare(i):
+        # A word opening a chunk has no leading space
+        return spaced[0] if i == 0 else len(enc.encode_ordinary(words[i]))
+
+    start, total = 0, spaced[0]
+    for k in range(1, len(words)):
+        if total + spaced[k] <= max_tokens:
+            total += spaced[k]
+            continue
+
+        yield " ".join(words[start:k])
+
+        j, carried = k, 0
+        while overlap and j - 1 > start and carried + spaced[j - 1] <= overlap:
+            j -= 1
+            carried += spaced[j]
+        if j < k:
+            carried += bare(j) - spaced[j]
+        if j < k and carried + spaced[k] <= max_tokens:
+            start, total = j, carried + spaced[k]
+        else:
+            start, total = k, bare(k)
+
+    yield " ".join(words[start:])
+
+
+def chunk_text(text, max_tokens=512, overlap=0):
+    return list(iter_chunks(text, max_tokens=max_tokens, overlap=overlap))
+
+
+def iter_token_windows(text, chunk_size=1024, overlap=50, encoding_name="gpt2"):
+    """
+    Yield (chunk, start_byte, end_byte): the same fixed token windows as langchain's TokenTextSplitter
+    (chunk_size tokens, stepping chunk_size - overlap), plus where each window sits in the UTF-8
+    encoded text. The text is encoded once; offsets are byte lengths of decoded token runs, which
+    stay exact even when a window boundary falls inside a multi-byte character.
+    """
+    if overlap >= chunk_size:
+        raise ValueError(f"overlap ({overlap}) must be smaller than chunk_size ({chunk_size})")
+    enc = get_encoding(encoding_name)
+    tokens = enc.encode(text, disallowed_special=())
+    step = chunk_size - overlap
+    start, start_byte = 0, 0
+    while start < len(tokens):
+        end = min(start + chunk_size, len(tokens))
+        window = enc.decode_bytes(tokens[start:end])
+        yield window.decode("utf-8", errors="replace"), start_byte, start_byte + len(window)
+        if end == len(tokens):
+            return
+        start_byte += len(enc.decode_bytes(tokens[start:start + step]))
+        start += step
+
+
+def iter_anchored_windows(text, chunk_size=1024, min_size=None, anchor_every=4, encoding_name="gpt2"):
+    """
+    Yield (chunk, start_byte, end_byte) like iter_token_windows, but cut on content-defined anchors:
+    after a line once the chunk holds min_size tokens and the line's checksum selects it (blank lines
+    always do), or before a line that would overflow chunk_size. Boundaries depend only on nearby
+    text, so editing one passage changes the chunks around it and leaves every other chunk identical.
+    Lines longer than chunk_size are split into plain token windows.
+    """
+    min_size = chunk_size * 3 // 4 if min_size is None else min_size
+    enc = get_encoding(encoding_name)
+    lines = text.splitlines(keepends=True)
+    counts = [len(tokens) for tokens in enc.encode_ordinary_batch(lines)]
+    parts, tokens, start, position = [], 0, 0, 0
+    for line, count in zip(lines, counts):
+        size = len(line.encode("utf-8"))
+        if parts and (count > chunk_size or tokens + count > chunk_size):
+            yield "".join(parts), start, position
+            parts, tokens, start = [], 0, position
+        if count > chunk_size:
+            for chunk, chunk_start, chunk_end in iter_token_windows(line, chunk_size, 0, encoding_name):
+                yield chunk, position + chunk_start, position + chunk_end
+            position += size
+            start = position
+            continue
+        parts.append(line)
+        tokens += count
+        position += size
+        if tokens >= min_size and zlib.crc32(" ".join(line.split()).encode("utf-8")) % anchor_every == 0:
+            yield "".join(parts), start, position
+            parts, tokens, start = [], 0, position
+    if parts:
+        yield "".join(parts), start, position
@@ -0,0 +1,637 @@
+"""
+ON-DISK VECTOR STORE
+Replaces the pickled LangChain FAISS docstore with a layout that loads lazily:
+
+    vectors.faiss   FAISS index (inner product on L2-normalised vectors, type set by the index spec), memory-mapped on read
+    vectors.f32     raw float32 vectors, row i = vector id i (the index is built and trained from these)
+    chunks.bin      UTF-8 chunk text, one blob addressed by (offset, length)
+    store.sqlite    chunk table: id, source, text offset/length, metadata JSON; metadata postings
+                    (field, value) -> ids, packed into one int64 blob per value on save; plus store_info
+
+Only the top-k hits' text and metadata are ever read at query time.
+
+Index specs (FAISS_INDEX_SPEC or --index-spec), parameters optional:
+    flat                                  exact search (default)
+    hnsw:M=32,efConstruction=40,efSearch=64
+    ivf:nlist=256,nprobe=16
+    ivfpq:nlist=256,nprobe=16,m=48,nbits=8   PQ-compressed codes (m must divide the dimension)
+"""
+
+import itertools
+import json
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+import faiss
+import numpy as np
+
+from app.bm25 import DOCLEN_FILE, BM25Index
+
+INDEX_FILE = "vectors.faiss"
+VECTORS_FILE = "vectors.f32"
+TEXT_FILE = "chunks.bin"
+DB_FILE = "store.sqlite"
+LEGACY_INDEX_FILE = "index.pkl"  # LangChain FAISS.save_local docstore pickle
+
+FAISS_INDEX_SPEC = os.getenv("FAISS_INDEX_SPEC", "flat")
+INDEX_DEFAULTS = {
+    "flat": {},
+    "hnsw": {"M": 32, "efConstruction": 40, "efSearch": 64},
+    "ivf": {"nlist": 256, "nprobe": 16},
+    "ivfpq": {"nlist": 256, "nprobe": 16, "m": 48, "nbits": 8},
+}
+SEARCH_PARAMS = ("efSearch", "nprobe")
+
+# Filter name -> chunk metadata key; these get an inverted index (postings) at write time
+FILTER_FIELDS = {
+    "jurisdiction": "llm_jurisdiction",
+    "document_type": "llm_document_type",
+    "framework": "folder_framework",
+    "tags": "folder_tags",
+}
+# Candidate sets up to this size are scored exactly instead of walking the ANN index with a selector
+FILTER_BRUTE_FORCE_MAX = int(os.getenv("FILTER_BRUTE_FORCE_MAX", "4096"))
+FILTER_CACHE_SIZE = 64  # distinct filter combinations whose candidate sets are kept by a reader
+TRAIN_POINTS_PER_CENTROID = 64  # training sample = nlist (or 2^nbits PQ centroids) x this, capped at the corpus
+# HNSW cannot drop nodes: deleted ids stay in the graph (masked at query time) up to this share, then it is rebuilt
+HNSW_MAX_TOMBSTONES = float(os.getenv("HNSW_MAX_TOMBSTONES", "0.2"))
+ADD_BLOCK = 65536  # vectors copied out of the memmap per add_with_ids call
+
+
+def parse_index_spec(spec):
+    """"hnsw:M=16,efSearch=128" -> ("hnsw", {"M": 16, "efConstruction": 40, "efSearch": 128})"""
+    kind, _, args = (spec or "flat").strip().lower().partition(":")
+    if kind not in INDEX_DEFAULTS:
+        raise ValueError(f"Unknown index type '{kind}' (expected one of {', '.join(INDEX_DEFAULTS)})")
+    params = dict(INDEX_DEFAULTS[kind])
+    names = {name.lower(): name for name in params}
+    for arg in filter(None, args.split(",")):
+        key, _, value = arg.partition("=")
+        if key.strip() not in names:
+            raise ValueError(f"Unknown parameter '{key}' for {kind} index")
+        params[names[key.strip()]] = int(value)
+    return kind, params
+
+
+def filter_values(value):
+    """Normalised postings keys for a metadata value: lists and "EU, Germany" give one key per item"""
+    items = value if isinstance(value, (list, tuple, set)) else re.split(r"[,;]", str(value))
+    return sorted({str(item).strip().lower() for item in items if str(item).strip()})
+
+
+def _postings(vector_id, metadata):
+    return [(name, value, vector_id)
+            for name, key in FILTER_FIELDS.items() if key in metadata
+            for value in filter_values(metadata[key])]
+
+
+def format_index_spec(kind, params):
+    return kind + (":" + ",".join(f"{k}={v}" for k, v in params.items()) if params else "")
+
+
+def set_search_params(index, params):
+    """Apply query-time knobs (efSearch / nprobe) that the index type understands"""
+    space = faiss.ParameterSpace()
+    for name in SEARCH_PARAMS:
+        if name in params:
+            space.set_index_parameter(index, name, params[name])
+
+
+def build_faiss_index(spec, vectors, ids, seed=0, rows=None):
+    """
+    Build an index of the given spec over (already L2-normalised) vectors.
+    rows: the row of `vectors` holding each id (default: row i is ids[i]), so a memmap of every
+    stored vector can be indexed without copying the live ones out first.
+    IVF / PQ quantizers are trained on a random sample; if the corpus is too small for the
+    requested nlist it is scaled down rather than failing.
+    """
+    kind, params = parse_index_spec(spec)
+    ids = np.asarray(ids, dtype="int64")
+    n, dim = len(ids), vectors.shape[1]
+
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, params["M"], faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = params["efConstruction"]
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        if kind == "ivfpq" and n < 2 ** params["nbits"]:
+            print(f"⚠️ {n} vectors is too few to train {2 ** params['nbits']} PQ centroids, using uncompressed IVF")
+            kind = "ivf"
+        nlist = max(1, min(params["nlist"], n // 39))
+        if nlist != params["nlist"]:
+            print(f"⚠️ {n} vectors is too few for nlist={params['nlist']}, using nlist={nlist}")
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            centroids = nlist
+        else:
+            if dim % params["m"]:
+                raise ValueError(f"PQ m={params['m']} must divide the vector dimension {dim}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, params["m"], params["nbits"], faiss.METRIC_INNER_PRODUCT)
+            centroids = max(nlist, 2 ** params["nbits"])
+
+        train_size = min(n, centroids * TRAIN_POINTS_PER_CENTROID)
+        sample = np.sort(np.random.default_rng(seed).choice(n, size=train_size, replace=False))
+        index.train(np.ascontiguousarray(vectors[sample if rows is None else rows[sample]]))
+
+    set_search_params(index, params)
+    for start in range(0, n, ADD_BLOCK):  # bounded copies when vectors is a memmap
+        block = slice(start, start + ADD_BLOCK)
+        index.add_with_ids(np.ascontiguousarray(vectors[block if rows is None else rows[block]]), ids[block])
+    return index
+
+
+def _read_index_mmap(path):
+    """Memory-map the index codes where this FAISS build supports it"""
+    for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        flag = getattr(faiss, flag_name, None)
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+class VectorStore:
+    """
+    mode: "r" read-only (memory-mapped), "a" update in place, "w" create from scratch.
+    Writers only append to vectors.f32 / chunks.bin / store.sqlite. On save() the session's added and
+    deleted ids are applied to the saved FAISS index (HNSW keeps deleted ids as tombstones, masked at
+    query time); it is built from scratch for a new store, a changed index spec or save(rebuild=True).
+    """
+
+    def __init__(self, path, mode="r", index_spec=None):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._text = None
+        self._vectors = None
+        self._filter_cache = {}
+        self._deleted = None
+        self._tombstone_params = None
+        # ids added / deleted since the index was last written, applied to it incrementally on save()
+        self._added = []
+        self._removed = []
+
+        if mode == "w":
+            os.makedirs(path, exist_ok=True)
+            for name in (INDEX_FILE, VECTORS_FILE, TEXT_FILE, DB_FILE, DOCLEN_FILE):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+        elif not VectorStore.exists(path):
+            raise FileNotFoundError(f"No vector store at {path}")
+
+        self.db = sqlite3.connect(os.path.join(path, DB_FILE), check_same_thread=False)
+        self.db.executescript("""
+        CREATE TABLE IF NOT EXISTS chunks (
+            id INTEGER PRIMARY KEY,
+            source TEXT NOT NULL,
+            text_offset INTEGER NOT NULL,
+            text_length INTEGER NOT NULL,
+            metadata TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source);
+        CREATE TABLE IF NOT EXISTS postings (
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            PRIMARY KEY (field, value, id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_postings_id ON postings(id);
+        CREATE TABLE IF NOT EXISTS postings_packed (
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            ids BLOB NOT NULL,
+            PRIMARY KEY (field, value)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS store_info (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        """)
+        self.info = dict(self.db.execute("SELECT key, value FROM store_info").fetchall())
+        self.dim = int(self.info["dim"]) if "dim" in self.info else None
+        # An existing store keeps its index type unless a spec is passed explicitly
+        self.index_spec = index_spec or self.info.get("index_spec") or FAISS_INDEX_SPEC
+        parse_index_spec(self.index_spec)
+
+        row = self.db.execute("SELECT MAX(id) FROM chunks").fetchone()
+        self._next_id = 0 if row[0] is None else row[0] + 1
+        # Read-only opens never write: an old store is backfilled by the next "a" open (or save)
+        if self.info.get("postings") != "1" and mode != "r":
+            self._backfill_postings()
+        self._warned_postings = False
+
+        self.index = None
+        if mode == "r":
+            self.index = _read_index_mmap(os.path.join(path, INDEX_FILE))
+            set_search_params(self.index, parse_index_spec(self.index_spec)[1])
+        self._changed = False
+        self.stats = {}
+
+        self.lexical = BM25Index(path, self.db, self.info, self._lock)
+        if mode == "a" and not self.lexical.available and self._next_id:
+            self._backfill_lexical()
+
+    def _backfill_postings(self):
+        """One-off for stores written before the metadata postings existed"""
+        rows = []
+        for vector_id, metadata in self.db.execute("SELECT id, metadata FROM chunks WHERE deleted = 0"):
+            rows.extend(_postings(vector_id, json.loads(metadata)))
+        self.db.executemany("INSERT OR IGNORE INTO postings (field, value, id) VALUES (?, ?, ?)", rows)
+        self._pack_postings()
+        self.info["postings"] = "1"
+        self.db.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES ('postings', '1')")
+        self.db.commit()
+
+    def _backfill_lexical(self):
+        """One-off BM25 indexing of the chunks of a store written before the lexical index existed"""
+        print(f"🔤 Building the BM25 index for the existing chunks in {self.path}...")
+        rows = self.db.execute("SELECT id, text_offset, text_length FROM chunks WHERE deleted = 0 ORDER BY id").fetchall()
+        text = self._text_map()
+        for start in range(0, len(rows), 1024):
+            batch = rows[start:start + 1024]
+            self.lexical.add([row[0] for row in batch],
+                             [text[offset:offset + length].decode("utf-8") for _, offset, length in batch])
+        # chunks.bin grows from here on; remap on the next read
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text = None
+        self._changed = True
+
+    def _pack_postings(self):
+        """Rewrite the read-side inverted index: one sorted int64 id array per (field, value)"""
+        self.db.execute("DELETE FROM postings_packed")
+        rows = self.db.execute("SELECT field, value, id FROM postings ORDER BY field, value, id")
+        packed = (
+            (field, value, np.array([row[2] for row in group], dtype="int64").tobytes())
+            for (field, value), group in itertools.groupby(rows, key=lambda row: (row[0], row[1]))
+        )
+        self.db.executemany("INSERT INTO postings_packed (field, value, ids) VALUES (?, ?, ?)", list(packed))
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, DB_FILE)) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+    @property
+    def ntotal(self):
+        if self.index is not None:
+            return self.index.ntotal
+        return int(self.info.get("ntotal", 0))
+
+    @property
+    def version(self):
+        """Changes on every save - lets caches keyed on index content invalidate themselves"""
+        return self.info.get("build_id", "")
+
+    # ------------------------------------------------------------------ write side
+
+    def allocate_ids(self, n):
+        """Reserve the next n vector IDs (they must then be added in order)"""
+        ids = list(range(self._next_id, self._next_id + n))
+        self._next_id += n
+        return ids
+
+    def add(self, vectors, texts, metadatas, ids=None):
+        """Append chunks; returns their integer vector IDs (searchable after save())"""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        faiss.normalize_L2(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.info["dim"] = str(self.dim)
+
+        ids = np.array(ids if ids is not None else self.allocate_ids(len(texts)), dtype="int64")
+
+        # ids are never reused (deleted rows keep theirs), so row i of vectors.f32 is vector id i.
+        # Writing at the id's offset keeps that true even after an interrupted run left a partial tail.
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        row_bytes = self.dim * 4
+        with open(vectors_path, "r+b" if os.path.exists(vectors_path) else "wb") as f:
+            if np.array_equal(ids, np.arange(ids[0], ids[0] + len(ids))):
+                f.seek(int(ids[0]) * row_bytes)
+                f.write(vectors.tobytes())
+            else:
+                for vector_id, vector in zip(ids, vectors):
+                    f.seek(int(vector_id) * row_bytes)
+                    f.write(vector.tobytes())
+        self._vectors = None
+
+        rows, postings = [], []
+        with open(os.path.join(self.path, TEXT_FILE), "ab") as f:
+            offset = f.tell()
+            for vector_id, text, metadata in zip(ids, texts, metadatas):
+                data = text.encode("utf-8")
+                f.write(data)
+                rows.append((int(vector_id), metadata.get("source", ""), offset, len(data),
+                             json.dumps(metadata, ensure_ascii=False)))
+                postings.extend(_postings(int(vector_id), metadata))
+                offset += len(data)
+        self.db.executemany(
+            "INSERT INTO chunks (id, source, text_offset, text_length, metadata) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self.db.executemany("INSERT OR IGNORE INTO postings (field, value, id) VALUES (?, ?, ?)", postings)
+        self.lexical.add(ids, texts)
+        self._added.extend(int(i) for i in ids)
+        self._changed = True
+        return [int(i) for i in ids]
+
+    def delete(self, ids):
+        """Drop vectors from the next index build; their text stays in chunks.bin until a full rebuild"""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return
+        self.db.executemany("UPDATE chunks SET deleted = 1 WHERE id = ?", [(i,) for i in ids])
+        self.db.executemany("DELETE FROM postings WHERE id = ?", [(i,) for i in ids])
+        self._removed.extend(ids)
+        self._changed = True
+
+    def live_ids(self):
+        return np.array([row[0] for row in self.db.execute("SELECT id FROM chunks WHERE deleted = 0 ORDER BY id")],
+                        dtype="int64")
+
+    def build_index(self):
+        """Build the FAISS index of self.index_spec from scratch from the stored vectors"""
+        ids = self.live_ids()
+        vectors = self.vectors()
+        start = time.perf_counter()
+        # Row i of the memmap is id i: live rows are copied block by block, never all at once
+        self.index = build_faiss_index(self.index_spec, vectors, ids, rows=None if len(ids) == len(vectors) else ids)
+        self.stats["build_s"] = time.perf_counter() - start
+        self.info["tombstones"] = "0"
+        self._added, self._removed = [], []
+        return self.index
+
+    def _update_index(self):
+        """Apply the session's adds / deletes to the saved index; False when it needs a full build instead"""
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if self.index is None:
+            if self.mode == "w" or not os.path.exists(index_path):
+                return False
+            self.index = faiss.read_index(index_path)
+        removed = np.unique(np.array(self._removed, dtype="int64"))
+        added = np.setdiff1d(np.array(self._added, dtype="int64"), removed)
+        start = time.perf_counter()
+        if len(removed):
+            if parse_index_spec(self.index_spec)[0] == "hnsw":
+                tombstones = int(self.info.get("tombstones", 0)) + len(removed)
+                if tombstones > HNSW_MAX_TOMBSTONES * (self.index.ntotal + len(added)):
+                    print(f"🪦 {tombstones} deleted vectors in the HNSW graph - rebuilding it")
+                    return False
+                self.info["tombstones"] = str(tombstones)
+            else:
+                self.index.remove_ids(removed)
+        vectors = self.vectors()
+        for start_row in range(0, len(added), ADD_BLOCK):
+            block = added[start_row:start_row + ADD_BLOCK]
+            self.index.add_with_ids(np.ascontiguousarray(vectors[block]), block)
+        self.stats["update_s"] = time.perf_counter() - start
+        self.stats["updated"] = (len(added), len(removed))
+        self._added, self._removed = [], []
+        return True
+
+    def save(self, rebuild=False):
+        """
+        Persist; the index is updated with this session's changes, or built from scratch for a new
+        store, a changed index spec or rebuild=True. False when the store holds no vectors.
+        """
+        if self.dim is None:
+            return False
+        # Stores saved before index specs were recorded get one full build too
+        spec_changed = self.info.get("index_spec") != self.index_spec
+        if self._changed or self.index is None or spec_changed or rebuild:
+            self._pack_postings()
+            self.lexical.finalize(self.live_ids())
+            self.db.commit()
+            if rebuild or spec_changed or not self._update_index():
+                self.build_index()
+        self.info["build_id"] = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        self.info["ntotal"] = str(self.index.ntotal)
+        self.info["index_spec"] = self.index_spec
+        self.db.executemany("INSERT OR REPLACE INTO store_info (key, value) VALUES (?, ?)", self.info.items())
+        self.db.commit()
+
+        # Atomic swap so a concurrent reader never maps a half-written index
+        index_path = os.path.join(self.path, INDEX_FILE)
+        faiss.write_index(self.index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        self._changed = False
+        return True
+
+    # ------------------------------------------------------------------ read side
+
+    def _text_map(self):
+        if self._text is None:
+            with open(os.path.join(self.path, TEXT_FILE), "rb") as f:
+                # mmap refuses empty files (a store of empty chunks)
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        return self._text
+
+    def vectors(self):
+        """All stored vectors as a read-only memmap (row = vector id)"""
+        if self._vectors is None:
+            # Rows past the highest known id are the leftovers of an interrupted write
+            self._vectors = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype="float32", mode="r",
+                                      shape=(self._next_id, self.dim))
+        return self._vectors
+
+    def candidate_ids(self, filters):
+        """
+        Sorted vector IDs matching every filter, e.g. {"jurisdiction": "EU", "framework": ["ESRS", "GRI"]}.
+        Values of one field are OR-ed, fields are AND-ed; matching is case-insensitive.
+        """
+        candidates = None
+        for name, wanted in filters.items():
+            if name not in FILTER_FIELDS:
+                raise ValueError(f"Unknown filter '{name}' (expected one of {', '.join(FILTER_FIELDS)})")
+            values = filter_values(wanted)
+            with self._lock:
+                blobs = self.db.execute(
+                    f"SELECT ids FROM postings_packed WHERE field = ? AND value IN ({','.join('?' * len(values))})",
+                    [name, *values],
+                ).fetchall()
+            ids = [np.frombuffer(blob, dtype="int64") for (blob,) in blobs]
+            matched = ids[0] if len(ids) == 1 else np.unique(np.concatenate(ids)) if ids else np.empty(0, "int64")
+            candidates = matched if candidates is None else np.intersect1d(candidates, matched, assume_unique=True)
+        return candidates if candidates is not None else np.empty(0, "int64")
+
+    def _filtered(self, filters):
+        """(candidate ids, selector search params) for a filter set, cached while the store is read-only"""
+        key = tuple(sorted((name, tuple(filter_values(value))) for name, value in filters.items()))
+        with self._lock:
+            cached = self._filter_cache.get(key)
+        if cached is not None:
+            return cached
+
+        candidates = self.candidate_ids(filters)
+        params = self._selector_params(candidates) if len(candidates) > FILTER_BRUTE_FORCE_MAX else None
+        if self.mode == "r":
+            with self._lock:
+                if len(self._filter_cache) >= FILTER_CACHE_SIZE:
+                    self._filter_cache.pop(next(iter(self._filter_cache)))
+                self._filter_cache[key] = (candidates, params)
+        return candidates, params
+
+    def _selector_params(self, candidates):
+        """SearchParameters restricting the ANN search to the candidate IDs"""
+        selector = faiss.IDSelectorBatch(candidates)
+        kind, params = parse_index_spec(self.index_spec)
+        if kind == "hnsw":
+            search_params = faiss.SearchParametersHNSW(sel=selector, efSearch=params["efSearch"])
+        elif kind in ("ivf", "ivfpq"):
+            search_params = faiss.SearchParametersIVF(sel=selector, nprobe=params["nprobe"])
+        else:
+            search_params = faiss.SearchParameters(sel=selector)
+        search_params.selector_ref = selector  # keep the selector alive for the call
+        return search_params
+
+    def search(self, query_vector, k=5, filters=None):
+        """
+        Top-k (vector_id, cosine score) pairs. With filters, only matching chunks are candidates:
+        small candidate sets are scored exactly, larger ones searched through an ID selector.
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        query = np.array(query_vector, dtype="float32").reshape(1, -1)  # copy: normalised in place
+        faiss.normalize_L2(query)
+
+        filters = self._usable_filters(filters)
+        if not filters:
+            params = self._tombstone_search_params()
+            scores, ids = self.index.search(query, k) if params is None else self.index.search(query, k, params=params)
+        else:
+            candidates, params = self._filtered(filters)
+            if params is None:
+                scores = self.vectors()[candidates] @ query[0]
+                top = np.argsort(-scores)[:k]
+                return [(int(candidates[i]), float(scores[i])) for i in top]
+            scores, ids = self.index.search(query, k, params=params)
+        return [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i != -1]
+
+    def _usable_filters(self, filters):
+        """Filters, or None for a store opened read-only before its postings were backfilled"""
+        if not filters or self.info.get("postings") == "1":
+            return filters
+        if not self._warned_postings:
+            self._warned_postings = True
+            print(f"⚠️ {self.path} has no metadata postings yet - filters ignored until it is re-saved")
+        return None
+
+    def _tombstone_search_params(self):
+        """Search parameters masking the deleted ids still in an HNSW graph (None when there are none)"""
+        if int(self.info.get("tombstones", 0)) == 0:
+            return None
+        if self._tombstone_params is None or self.mode != "r":
+            deleted = faiss.IDSelectorBatch(self._deleted_ids())
+            selector = faiss.IDSelectorNot(deleted)
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=parse_index_spec(self.index_spec)[1]["efSearch"])
+            params.selector_ref = (deleted, selector)  # keep both selectors alive for the calls
+            self._tombstone_params = params
+        return self._tombstone_params
+
+    def _deleted_ids(self):
+        if self._deleted is None or self.mode != "r":
+            with self._lock:
+                rows = self.db.execute("SELECT id FROM chunks WHERE deleted = 1 ORDER BY id").fetchall()
+            self._deleted = np.array([row[0] for row in rows], dtype="int64")
+        return self._deleted
+
+    def search_lexical(self, query, k=20, filters=None):
+        """Top-k (vector_id, BM25 score) pairs for a text query, honouring the same filters as search()"""
+        filters = self._usable_filters(filters)
+        candidates = self._filtered(filters)[0] if filters else None
+        if candidates is not None and not len(candidates):
+            return []
+        return self.lexical.search(query, k, candidates=candidates, deleted=self._deleted_ids())
+
+    def facets(self, name):
+        """{value: chunk count} for one filter field, e.g. to list the jurisdictions in the corpus"""
+        with self._lock:
+            rows = self.db.execute("SELECT value, ids FROM postings_packed WHERE field = ? ORDER BY value",
+                                   (name,)).fetchall()
+        return {value: len(ids) // 8 for value, ids in rows}
+
+    def get(self, ids):
+        """(text, metadata) for the given ids, in the same order; text is read only for these rows"""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT id, text_offset, text_length, metadata FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        by_id = {row[0]: row for row in rows}
+        text = self._text_map()
+
+        results = []
+        for vector_id in ids:
+            row = by_id.get(vector_id)
+            if row is None:
+                continue
+            _, offset, length, metadata = row
+            results.append((text[offset:offset + length].decode("utf-8"), json.loads(metadata)))
+        return results
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self.db.close()
+
+
+def convert_langchain_index(path, embeddings=None):
+    """
+    One-off migration of a FAISS.save_local index (index.faiss + index.pkl) in `path` to this
+    layout without re-embedding. Manifest vector IDs are remapped to the new integer IDs.
+    """
+    from langchain_community.vectorstores import FAISS as LangChainFAISS
+    from app.manifest import IndexManifest
+
+    legacy = LangChainFAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    positions = sorted(legacy.index_to_docstore_id)
+    vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+    docs = [legacy.docstore.search(legacy.index_to_docstore_id[p]) for p in positions]
+
+    store = VectorStore(path, mode="w")
+    new_ids = store.add(vectors[positions], [d.page_content for d in docs], [d.metadata for d in docs])
+    store.save()
+    store.close()
+
+    id_map = {legacy.index_to_docstore_id[p]: new_id for p, new_id in zip(positions, new_ids)}
+    manifest = IndexManifest(path)
+    if manifest.files:
+        for entry in manifest.files.values():
+            entry["ids"] = [id_map[i] for i in entry["ids"] if i in id_map]
+        manifest.save()
+
+    for name in ("index.faiss", LEGACY_INDEX_FILE):
+        os.remove(os.path.join(path, name))
+    print(f"✅ Converted {len(new_ids)} chunks in {path} to the on-disk store layout")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vector store maintenance")
+    parser.add_argument("--convert", metavar="INDEX_PATH", help="migrate a pickled LangChain FAISS index in place")
+    parser.add_argument("--rebuild", metavar="INDEX_PATH", help="rebuild the FAISS index from the stored vectors")
+    parser.add_argument("--index-spec", default=None, help="index type for --rebuild, e.g. hnsw:M=32,efSearch=64")
+    args = parser.parse_args()
+
+    if args.convert:
+        convert_langchain_index(args.convert)
+    if args.rebuild:
+        store = VectorStore(args.rebuild, mode="a", index_spec=args.index_spec)
+        store.save(rebuild=True)
+        store.close()
+        print(f"✅ Rebuilt {store.ntotal} vectors in {args.rebuild} as {store.index_spec} "
+              f"({store.stats['build_s']:.1f}s, {os.path.getsize(os.path.join(args.rebuild, INDEX_FILE)) / 1e6:.1f}MB)")
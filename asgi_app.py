@@ -1,10 +1,14 @@
+import asyncio
 import os
 from fastapi import FastAPI, Request, Form, HTTPException, APIRouter
 from fastapi.staticfiles import StaticFiles
 from chainlit.server import app as chainlit_app
 from dotenv import load_dotenv
 from app.user_db import save_user, user_exists, init_db, list_users
-from fastapi.responses import HTMLResponse
+from app.chain_registry import warm_up
+from app.llm_client import aclose_http_clients
+from app.metrics import render_prometheus
+from fastapi.responses import HTMLResponse, PlainTextResponse
 import jwt
 from typing import Dict, Any
 
@@ -73,6 +77,21 @@ SUCCESS_HTML = """
 
 app = FastAPI()
 
+@app.on_event("startup")
+async def warm_chains():
+    """Build the shared RAG / gap-analysis chains before the first session arrives"""
+    await asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+@app.on_event("shutdown")
+async def close_llm_connections():
+    """Close the pooled keep-alive connections to the LLM provider"""
+    await aclose_http_clients()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint: latency, token, cost, cache and breaker metrics of this process"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # Mount directories
 DOCUMENTS_PATH = os.path.abspath("data/raw_docs")
 if os.path.exists(DOCUMENTS_PATH):
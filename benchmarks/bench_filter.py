@@ -0,0 +1,120 @@
+"""
+Benchmark filtered retrieval: pre-filtering through the metadata postings (exact scoring of small
+candidate sets, ID selector inside the ANN search for large ones) vs over-fetch + post-filter,
+and vs unfiltered search. Recall is measured against exact search over the filtered subset.
+
+Usage:
+    python -m benchmarks.bench_filter --index-path vector_store/faiss_index --filter jurisdiction=EU
+    python -m benchmarks.bench_filter --synthetic 100000 --index-spec hnsw --filter framework=esrs
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from app.vector_store import FILTER_FIELDS, VectorStore
+from benchmarks.bench_index import make_queries, synthetic_vectors
+
+# Skewed value distributions, like a corpus dominated by a few jurisdictions
+SYNTHETIC_VALUES = {
+    "llm_jurisdiction": (["EU", "US", "UK", "China", "Jordan", "Bangladesh", "Saudi Arabia", "Global"],
+                         [0.35, 0.2, 0.1, 0.1, 0.05, 0.05, 0.05, 0.1]),
+    "folder_framework": (["ESRS", "GRI", "SASB", "TCFD", "GHG"], [0.4, 0.3, 0.15, 0.1, 0.05]),
+    "llm_document_type": (["law", "standard", "report", "guidance"], [0.4, 0.3, 0.2, 0.1]),
+}
+
+
+def build_synthetic_store(path, n, dim, index_spec, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = synthetic_vectors(n, dim, seed=seed)
+    fields = {key: rng.choice(values, size=n, p=weights) for key, (values, weights) in SYNTHETIC_VALUES.items()}
+    metadatas = [{"source": f"doc_{i // 50}.pdf", **{key: str(col[i]) for key, col in fields.items()}}
+                 for i in range(n)]
+    store = VectorStore(path, mode="w", index_spec=index_spec)
+    for start in range(0, n, 10000):
+        store.add(vectors[start:start + 10000], [""] * len(metadatas[start:start + 10000]),
+                  metadatas[start:start + 10000])
+    store.save()
+    store.close()
+
+
+def timed_search(fn, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, [50, 95]), results
+
+
+def recall(results, truth, k):
+    return np.mean([len({i for i, _ in r} & t) / max(min(k, len(t)), 1) for r, t in zip(results, truth)])
+
+
+def parse_filters(items):
+    filters = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        filters.setdefault(name, []).extend(value.split("|"))
+    return filters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", help="benchmark an existing store")
+    parser.add_argument("--synthetic", type=int, default=50000, help="synthetic store size if no --index-path")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--index-spec", default="flat", help="index type of the synthetic store")
+    parser.add_argument("--filter", action="append", default=[], metavar="FIELD=VALUE[|VALUE]",
+                        help=f"filter(s) to test; fields: {', '.join(FILTER_FIELDS)}")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--overfetch", type=int, default=10, help="post-filter baseline fetches k x this")
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.index_path
+    if not path:
+        tmp = tempfile.TemporaryDirectory()
+        path = tmp.name
+        print(f"📦 Building a {args.synthetic}-vector synthetic store ({args.index_spec})...")
+        build_synthetic_store(path, args.synthetic, args.dim, args.index_spec)
+
+    store = VectorStore(path, mode="r")
+    vectors = store.vectors()
+    queries = make_queries(np.ascontiguousarray(vectors[store.live_ids()]), args.queries)
+    filter_sets = [parse_filters([f]) for f in args.filter] or [
+        {"jurisdiction": ["eu"]}, {"jurisdiction": ["jordan"]}, {"jurisdiction": ["eu"], "framework": ["esrs"]},
+    ]
+    print(f"📦 {store.ntotal} vectors, index {store.index_spec}, k={args.k}")
+
+    (p50, p95), _ = timed_search(lambda q: store.search(q, args.k), queries)
+    print(f"{'unfiltered':<44} p50 {p50:7.3f}ms  p95 {p95:7.3f}ms")
+
+    for filters in filter_sets:
+        candidates = store.candidate_ids(filters)
+        allowed = set(candidates.tolist())
+        label = ", ".join(f"{name}={'|'.join(values)}" for name, values in filters.items())
+        print(f"\n🔎 {label}: {len(candidates)} candidates ({len(candidates) / max(store.ntotal, 1):.1%})")
+        if not len(candidates):
+            continue
+
+        # Exact answer over the filtered subset
+        subset = vectors[candidates]
+        truth = [set(candidates[np.argsort(-(subset @ q))[:args.k]].tolist()) for q in queries]
+
+        (p50, p95), results = timed_search(lambda q: store.search(q, args.k, filters=filters), queries)
+        print(f"   {'pre-filter (postings)':<41} p50 {p50:7.3f}ms  p95 {p95:7.3f}ms  recall@{args.k} {recall(results, truth, args.k):.3f}")
+
+        def post_filter(q):
+            hits = store.search(q, args.k * args.overfetch)
+            return [hit for hit in hits if hit[0] in allowed][:args.k]
+
+        (p50, p95), results = timed_search(post_filter, queries)
+        print(f"   {f'over-fetch x{args.overfetch} + post-filter':<41} p50 {p50:7.3f}ms  p95 {p95:7.3f}ms  recall@{args.k} {recall(results, truth, args.k):.3f}")
+
+    store.close()
+    if tmp:
+        tmp.cleanup()
@@ -0,0 +1,121 @@
+"""
+Benchmark the hybrid retriever's legs: BM25 build overhead (chunks/s, size on disk) and per-query
+latency of the BM25 leg, the vector leg (ANN search only, embedding excluded) and the RRF fusion.
+
+Usage:
+    python -m benchmarks.bench_hybrid --index-path vector_store/faiss_index
+    python -m benchmarks.bench_hybrid --synthetic 50000
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from app.bm25 import DOCLEN_FILE, BM25Index
+from app.retriever import HYBRID_FETCH, reciprocal_rank_fusion
+from app.vector_store import VectorStore
+from benchmarks.bench_index import synthetic_vectors
+
+IDENTIFIERS = ["ESRS E1-6", "ESRS S1-14", "GRI 305-1", "GRI 2-7", "Article 19a", "Regulation (EU) 2020/852",
+               "CSDDD Article 7", "ISSB S2", "SASB EM-EP-110a.1", "ILO C138"]
+QUERIES = ["What does ESRS E1-6 require?", "GRI 305-1 scope 1 emissions", "Article 19a sustainability statement",
+           "due diligence obligations under CSDDD Article 7", "child labour ILO C138 minimum age",
+           "taxonomy alignment Regulation (EU) 2020/852", "board diversity disclosure", "water withdrawal in stressed areas"]
+
+
+def synthetic_texts(n, seed=0):
+    """Zipf-distributed filler words with an identifier in every tenth chunk"""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"w{i}" for i in range(20000)])
+    texts = []
+    for i in range(n):
+        words = vocabulary[np.minimum(rng.zipf(1.2, size=350), len(vocabulary)) - 1].tolist()
+        if i % 10 == 0:
+            words.insert(int(rng.integers(0, len(words))), IDENTIFIERS[int(rng.integers(0, len(IDENTIFIERS)))])
+        texts.append(" ".join(words))
+    return texts
+
+
+def bench_build(ids, texts):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = sqlite3.connect(os.path.join(tmp, "bm25.sqlite"))
+        index = BM25Index(tmp, db, {}, threading.Lock())
+        start = time.perf_counter()
+        for i in range(0, len(texts), 256):
+            index.add(ids[i:i + 256], texts[i:i + 256])
+        index.finalize(np.asarray(ids))
+        db.commit()
+        build_s = time.perf_counter() - start
+        size_mb = (os.path.getsize(os.path.join(tmp, "bm25.sqlite")) + os.path.getsize(os.path.join(tmp, DOCLEN_FILE))) / 1e6
+        db.close()
+    print(f"🔤 BM25 build: {len(texts)} chunks in {build_s:.2f}s ({len(texts) / build_s:,.0f} chunks/s), {size_mb:.1f}MB on disk")
+
+
+def percentiles(latencies):
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return f"p50 {p50:7.3f}ms  p95 {p95:7.3f}ms"
+
+
+def bench_queries(store, queries, rounds, k):
+    rng = np.random.default_rng(0)
+    lexical_ms, vector_ms, fusion_ms = [], [], []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            lexical = store.search_lexical(query, HYBRID_FETCH)
+            lexical_ms.append((time.perf_counter() - start) * 1000)
+
+            # Stand-in query vector: the embedding model is timed separately by the retriever
+            start = time.perf_counter()
+            vector = store.search(rng.standard_normal(store.dim).astype("float32"), HYBRID_FETCH)
+            vector_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            reciprocal_rank_fusion([vector, lexical], k)
+            fusion_ms.append((time.perf_counter() - start) * 1000)
+
+    print(f"   BM25 leg    {percentiles(lexical_ms)}")
+    print(f"   vector leg  {percentiles(vector_ms)}  ({store.index_spec}, embedding excluded)")
+    print(f"   RRF fusion  {percentiles(fusion_ms)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", help="benchmark an existing store")
+    parser.add_argument("--synthetic", type=int, default=20000, help="synthetic store size if no --index-path")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = None
+    path = args.index_path
+    if path:
+        store = VectorStore(path, mode="r")
+        ids = store.live_ids()
+        texts = [text for text, _ in store.get(ids)]
+        store.close()
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        path = tmp.name
+        texts = synthetic_texts(args.synthetic)
+        ids = list(range(len(texts)))
+        store = VectorStore(path, mode="w")
+        vectors = synthetic_vectors(len(texts))
+        for i in range(0, len(texts), 10000):
+            store.add(vectors[i:i + 10000], texts[i:i + 10000], [{"source": "synthetic"}] * len(texts[i:i + 10000]))
+        store.save()
+        store.close()
+
+    bench_build(list(ids), texts)
+
+    store = VectorStore(path, mode="r")
+    print(f"⏱️ {len(QUERIES)} queries x {args.rounds} rounds over {store.ntotal} chunks (fetch {HYBRID_FETCH} per leg)")
+    bench_queries(store, QUERIES, args.rounds, args.k)
+    store.close()
+    if tmp:
+        tmp.cleanup()
@@ -0,0 +1,104 @@
+"""
+Benchmark FAISS index types for the vector store: build time, size on disk, query latency
+and recall@k against exact (flat) search.
+
+Usage:
+    python -m benchmarks.bench_index --index-path vector_store/faiss_index
+    python -m benchmarks.bench_index --synthetic 200000 --specs flat hnsw:M=32,efSearch=64 ivf:nlist=1024,nprobe=16
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from app.vector_store import VectorStore, build_faiss_index
+
+DEFAULT_SPECS = [
+    "flat",
+    "hnsw:M=16,efSearch=32",
+    "hnsw:M=32,efSearch=64",
+    "ivf:nlist=256,nprobe=8",
+    "ivf:nlist=256,nprobe=32",
+    "ivfpq:nlist=256,nprobe=16,m=48,nbits=8",
+]
+
+
+def synthetic_vectors(n, dim=384, clusters=200, seed=0):
+    """Clustered unit vectors - closer to sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_queries(vectors, n, seed=1):
+    """Perturbed copies of stored vectors (questions land near, not on, indexed chunks)"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=n, replace=False)].copy()
+    queries += 0.3 * rng.standard_normal(queries.shape).astype("float32") / np.sqrt(queries.shape[1])
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def bench_spec(spec, vectors, ids, queries, truth, k):
+    start = time.perf_counter()
+    index = build_faiss_index(spec, vectors, ids)
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        faiss.write_index(index, path)
+        size_mb = os.path.getsize(path) / 1e6
+
+    # One query at a time on one thread, like the retriever
+    threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, result = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = result[0]
+    faiss.omp_set_num_threads(threads)
+
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{spec:<42} {build_s:>8.2f}s {size_mb:>9.1f}MB {p50:>8.3f}ms {p95:>8.3f}ms {recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", help="benchmark on the vectors of an existing store")
+    parser.add_argument("--synthetic", type=int, default=50000, help="number of synthetic vectors if no --index-path")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--specs", nargs="+", default=DEFAULT_SPECS)
+    args = parser.parse_args()
+
+    if args.index_path:
+        store = VectorStore(args.index_path, mode="a")
+        ids = store.live_ids()
+        vectors = np.ascontiguousarray(store.vectors()[ids])
+        store.close()
+        print(f"📦 {len(ids)} vectors (dim {vectors.shape[1]}) from {args.index_path}")
+    else:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+        ids = np.arange(len(vectors), dtype="int64")
+        print(f"📦 {len(ids)} synthetic vectors (dim {args.dim})")
+
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, positions = exact.search(queries, args.k)
+    truth = ids[positions]
+
+    print(f"{'spec':<42} {'build':>9} {'size':>11} {'p50':>10} {'p95':>10} {'recall@' + str(args.k):>9}")
+    for spec in args.specs:
+        bench_spec(spec, vectors, ids, queries, truth, args.k)
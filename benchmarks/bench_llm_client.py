@@ -0,0 +1,120 @@
+"""
+Benchmark N concurrent chat sessions against the local stub LLM server, comparing the old
+blocking call (requests.request inside the async handler, one new connection per call) with the
+pooled async client (FireworksAIAssistant.aenhance_answer / streamed answers).
+Reports throughput, per-call latency, event loop stall and connections opened. The stub runs in its
+own process so it does not compete with the client for the GIL.
+
+Usage:
+    python -m benchmarks.bench_llm_client --sessions 20 --requests 5 --ttft-ms 300 --tokens 100 --token-ms 5
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import numpy as np
+import requests
+
+from app.llm_client import aclose_http_clients
+from app.rag_chain import FireworksAIAssistant
+from benchmarks.stub_llm_server import PATH, spawn
+
+QUESTION = "What are the key ESRS disclosure requirements?"
+# Distinct prompts, so single-flight coalescing does not hide the connection behaviour under test
+_call_ids = itertools.count()
+
+
+def question():
+    return f"{QUESTION} (#{next(_call_ids)})"
+
+
+async def blocking_call(assistant):
+    """What enhance_answer used to do: a blocking POST on the event loop, fresh connection each time"""
+    payload = assistant._payload(question())
+    response = requests.request("POST", assistant.url, headers=assistant._headers(), data=json.dumps(payload), timeout=90)
+    return response.json()["choices"][0]["message"]["content"]
+
+
+async def async_call(assistant):
+    return await assistant.aenhance_answer(question())
+
+
+async def streamed_call(assistant, ttfts):
+    stream = assistant.stream_answer(question())
+    async for _ in stream:
+        pass
+    ttfts.append(stream.ttft_s * 1000)
+    return stream.answer
+
+
+async def loop_lag(stop, lags, interval=0.01):
+    """How late a 10ms timer fires - the stall every other session on this worker sees"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+_stats_session = requests.Session()
+
+
+def stub_stats(base):
+    # Keep-alive session, so reading the stats does not count as a new connection
+    return _stats_session.get(f"{base}/stats", timeout=5).json()
+
+
+async def run(label, call, sessions, per_session, base):
+    before = stub_stats(base)
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop, lags))
+
+    async def session():
+        for _ in range(per_session):
+            start = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await ticker
+
+    after = stub_stats(base)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{label:<22} {len(latencies) / wall:7.1f} req/s | latency p50 {p50:7.0f}ms  p95 {p95:7.0f}ms | "
+          f"loop stall max {max(lags, default=0):7.0f}ms | {after['connections'] - before['connections']} connections "
+          f"for {after['requests'] - before['requests']} requests")
+
+
+async def main(args):
+    process, base = spawn(args.ttft_ms, args.tokens, args.token_ms)
+    assistant = FireworksAIAssistant(api_key="stub")
+    assistant.url = base + PATH
+    print(f"🧪 {args.sessions} sessions x {args.requests} requests against {assistant.url} "
+          f"(TTFT {args.ttft_ms:.0f}ms, {args.tokens} tokens x {args.token_ms:.0f}ms)")
+
+    if not args.skip_blocking:
+        await run("blocking (old)", lambda: blocking_call(assistant), args.sessions, args.requests, base)
+    await run("async pooled", lambda: async_call(assistant), args.sessions, args.requests, base)
+    ttfts = []
+    await run("async pooled, stream", lambda: streamed_call(assistant, ttfts), args.sessions, args.requests, base)
+    print(f"   streamed TTFT p50 {np.percentile(ttfts, 50):.0f}ms  p95 {np.percentile(ttfts, 95):.0f}ms")
+
+    await aclose_http_clients()
+    process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent chat sessions")
+    parser.add_argument("--requests", type=int, default=5, help="questions per session")
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--skip-blocking", action="store_true", help="skip the (slow) blocking baseline")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Benchmark gap-analysis chunking with page tracking: the legacy substring search (`chunk[:20] in page`
+for every page) vs the offset-based app.file_analysis.chunk_with_page_tracking.
+Reports time, identical chunk text, and how often the legacy page is wrong or "?" against the exact
+start page. Runs on a synthetic report (running headers on every page, like real ones) or on PDFs.
+Also reports how many chunks (and so cached section analyses, app/gap_cache.py) survive an edit on one
+page with fixed token windows vs the default content-anchored boundaries.
+
+Usage:
+    python -m benchmarks.bench_page_tracking --pages 500
+    python -m benchmarks.bench_page_tracking path/to/report.pdf [more.pdf ...]
+"""
+
+import argparse
+import random
+import time
+
+from langchain.text_splitter import TokenTextSplitter
+
+from app.file_analysis import chunk_with_page_tracking
+
+WORDS = ("emissions scope governance board climate risk transition target baseline supplier disclosure "
+         "materiality water biodiversity workforce safety audit assurance taxonomy revenue capex opex "
+         "policy engagement human rights community energy renewable waste circular metric").split()
+
+
+def legacy_chunk_with_page_tracking(pages, chunk_size=1024, overlap=50):
+    """The original implementation, kept here as the reference"""
+    splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
+    page_chunks = [{"page": page_num, "text": text} for page_num, text in pages]
+
+    full_text = "\n\n".join([p["text"] for p in page_chunks])
+    chunks = splitter.split_text(full_text)
+
+    chunk_metadata = []
+    for chunk in chunks:
+        matched_page = None
+        for page_data in page_chunks:
+            if chunk[:20] in page_data["text"]:
+                matched_page = page_data["page"]
+                break
+
+        chunk_metadata.append({
+            "chunk": chunk,
+            "page": matched_page if matched_page is not None else "?",
+            "section_title": f"Section for Page {matched_page if matched_page is not None else '?'}"
+        })
+
+    return chunk_metadata
+
+
+def synthetic_report(n_pages, words_per_page=450, seed=7):
+    rng = random.Random(seed)
+    pages = []
+    for number in range(1, n_pages + 1):
+        sentences = []
+        for _ in range(words_per_page // 12):
+            sentence = " ".join(rng.choice(WORDS) for _ in range(11))
+            sentences.append(f"{sentence.capitalize()} {rng.randint(1, 999)}.")
+        # Running header and footer repeated on every page, as in real reports
+        pages.append((number, f"Sustainability Report 2024 | Acme Group\n{' '.join(sentences)}\nPage {number} of {n_pages}"))
+    return pages
+
+
+def pdf_pages(path):
+    from app.extraction import extract_text_by_page
+    return extract_text_by_page(path)
+
+
+def bench(label, pages, chunk_size, overlap):
+    print(f"📄 {label}: {len(pages)} pages, {sum(len(text) for _, text in pages):,} chars")
+
+    start = time.perf_counter()
+    new = chunk_with_page_tracking(pages, chunk_size, overlap, anchored=False)
+    new_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    old = legacy_chunk_with_page_tracking(pages, chunk_size, overlap)
+    old_s = time.perf_counter() - start
+
+    same_text = [c["chunk"] for c in old] == [c["chunk"] for c in new]
+    unknown = sum(c["page"] == "?" for c in old)
+    wrong = sum(o["page"] != "?" and o["page"] != n["start_page"] for o, n in zip(old, new))
+    spanning = sum(n["start_page"] != n["end_page"] for n in new)
+    print(f"   offset-based: {new_s:.3f}s | legacy: {old_s:.3f}s | speed-up {old_s / max(new_s, 1e-9):.1f}x")
+    print(f"   {len(new)} chunks, identical text: {'✅' if same_text else '❌'} | {spanning} cross a page break")
+    print(f"   legacy pages: {wrong} wrong, {unknown} '?' ({(wrong + unknown) / max(len(new), 1):.0%} of chunks)")
+
+    # A sentence inserted in the middle page, as in a revised upload
+    middle = len(pages) // 2
+    edited = list(pages)
+    edited[middle] = (pages[middle][0], pages[middle][1].replace(" ", " (revised) ", 1))
+    for label, anchored in (("fixed windows", False), ("anchored", True)):
+        start = time.perf_counter()
+        before = chunk_with_page_tracking(pages, chunk_size, overlap, anchored=anchored)
+        seconds = time.perf_counter() - start
+        after = chunk_with_page_tracking(edited, chunk_size, overlap, anchored=anchored)
+        known = {c["chunk"] for c in before}
+        kept = sum(c["chunk"] in known for c in after)
+        print(f"   {label}: {len(before)} chunks in {seconds:.3f}s; after an edit on page {pages[middle][0]}, "
+              f"{kept}/{len(after)} unchanged ({kept / max(len(after), 1):.0%} reusable from the gap cache)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--pages", type=int, default=500, help="pages of the synthetic report (without PDFs)")
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.pdfs:
+        for pdf_path in args.pdfs:
+            bench(pdf_path, pdf_pages(pdf_path), args.chunk_size, args.overlap)
+    else:
+        bench("synthetic report", synthetic_report(args.pages), args.chunk_size, args.overlap)
@@ -0,0 +1,254 @@
+"""
+Replay load benchmark: questions from logs/conversations_*.jsonl (or a synthetic set) through
+RAGChainWrapper (ainvoke / astream) and document sections through the gap-analysis path
+(file_analysis.run_gap), at a fixed concurrency, against the local stub LLM server.
+Reports p50 / p95 / p99 latency, throughput, error and fallback rates and upstream LLM requests per path.
+Save a run with --json and compare later runs with --baseline to catch regressions (exit code 1).
+
+Usage:
+    python -m benchmarks.bench_replay --concurrency 20 --requests 200 --ttft-ms 300 --token-ms 10
+    python -m benchmarks.bench_replay --paths invoke,stream --synthetic --json baseline.json
+    python -m benchmarks.bench_replay --baseline baseline.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import requests
+
+# The stub stands in for Fireworks; a real key must never be sent to it
+os.environ["FIREWORKS_API_KEY"] = "stub"
+# Stub answers must not land in the caches the live app serves from, and cache hits on repeated
+# questions would hide the latency being measured (set before app.answer_cache / app.gap_cache load)
+os.environ["ANSWER_CACHE"] = "0"
+os.environ["GAP_CACHE"] = "0"
+
+from app.file_analysis import run_gap
+from app.gap_scheduler import get_gap_scheduler
+from app.llm_client import aclose_http_clients
+from app.rag_chain import FALLBACK_MESSAGE, RAGChainWrapper
+from app.singleflight import get_singleflight
+from benchmarks.stub_llm_server import PATH, spawn
+
+SYNTHETIC_QUESTIONS = [
+    "Hi",
+    "Thanks!",
+    "What is CSRD?",
+    "What is ESRS E1?",
+    "Does SFDR apply to asset managers outside the EU?",
+    "What does GRI 305 cover?",
+    "What is double materiality?",
+    "When do CSRD reporting obligations start for listed SMEs?",
+    "Compare ESRS and ISSB climate disclosure requirements",
+    "How should we implement a Scope 3 emissions inventory step by step?",
+    "What are the differences between TCFD and ISSB S2?",
+    "Draft a checklist for a first CSRD double materiality assessment",
+    "What are best practices for board oversight of climate risk?",
+    "How do companies assess transition risk under ESRS E1?",
+]
+SYNTHETIC_SECTION = (
+    "The company reports Scope 1 and Scope 2 emissions for its European operations and has set a "
+    "target to reduce emissions by 30% by 2030 against a 2019 baseline. Governance of sustainability "
+    "topics sits with the audit committee, which reviews progress twice a year. Supplier engagement "
+    "covers the top 50 suppliers by spend; no Scope 3 inventory has been published yet. "
+)
+
+
+def load_questions(pattern, synthetic, limit, seed):
+    """Logged user queries in replay order, or a synthetic mix (with repeats, like real traffic)"""
+    questions = []
+    if not synthetic:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        query = json.loads(line).get("query")
+                    except json.JSONDecodeError:
+                        continue
+                    if query:
+                        questions.append(query)
+    source = f"{len(questions)} logged queries" if questions else "synthetic questions"
+    if not questions:
+        rng = random.Random(seed)
+        questions = [rng.choice(SYNTHETIC_QUESTIONS) for _ in range(limit)]
+    # Cycle the log when more requests are asked for than it holds
+    return [questions[i % len(questions)] for i in range(limit)], source
+
+
+def synthetic_sections(count):
+    return [{"chunk": f"{SYNTHETIC_SECTION * 6}(Section {i})", "page": i // 2 + 1, "section_title": f"Section {i}"}
+            for i in range(count)]
+
+
+async def ask_invoke(chain, question):
+    result = await chain.ainvoke(question)
+    return result["result"] == FALLBACK_MESSAGE, None
+
+
+async def ask_stream(chain, question):
+    result = await chain.astream(question)
+    stream = result["result"]
+    async for _ in stream:
+        pass
+    return stream.fell_back, stream.ttft_s
+
+
+async def replay(label, call, items, concurrency, base):
+    """Closed-loop replay: `concurrency` workers take the next item as soon as they finish one"""
+    before = stub_stats(base)
+    coalesced_before = get_singleflight("fireworks").stats()["coalesced"]
+    latencies, ttfts = [], []
+    errors = fallbacks = 0
+    queue = list(reversed(items))
+
+    async def worker():
+        nonlocal errors, fallbacks
+        while queue:
+            item = queue.pop()
+            start = time.perf_counter()
+            try:
+                fell_back, ttft = await call(item)
+            except Exception as e:
+                errors += 1
+                print(f"❌ {label}: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+            fallbacks += bool(fell_back)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    after = stub_stats(base)
+
+    total = len(items)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else (0.0, 0.0, 0.0)
+    return {
+        "path": label,
+        "requests": total,
+        "throughput_rps": total / wall,
+        "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+        "ttft_p50_ms": float(np.percentile(ttfts, 50) * 1000) if ttfts else None,
+        "error_rate": errors / total,
+        "fallback_rate": fallbacks / total,
+        "upstream_requests": after["requests"] - before["requests"],
+        "upstream_errors": after["errors"] - before["errors"],
+        "coalesced": int(get_singleflight("fireworks").stats()["coalesced"] - coalesced_before),
+    }
+
+
+_stats_session = requests.Session()
+
+
+def stub_stats(base):
+    return _stats_session.get(f"{base}/stats", timeout=5).json()
+
+
+def print_report(results):
+    print(f"\n{'path':<8} {'reqs':>5} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'TTFT p50':>9} "
+          f"{'errors':>7} {'fallback':>8} {'upstream':>8} {'coalesced':>9}")
+    for r in results:
+        ttft = f"{r['ttft_p50_ms']:.0f}ms" if r["ttft_p50_ms"] is not None else "-"
+        print(f"{r['path']:<8} {r['requests']:>5} {r['throughput_rps']:>7.1f} {r['p50_ms']:>6.0f}ms {r['p95_ms']:>6.0f}ms "
+              f"{r['p99_ms']:>6.0f}ms {ttft:>9} {r['error_rate']:>7.1%} {r['fallback_rate']:>8.1%} "
+              f"{r['upstream_requests']:>8} {r['coalesced']:>9}")
+
+
+def regressions(results, baseline, tolerance):
+    """Paths slower (p95), slower to serve (throughput) or failing more than the baseline allows"""
+    previous = {r["path"]: r for r in baseline["results"]}
+    found = []
+    for r in results:
+        old = previous.get(r["path"])
+        if old is None:
+            continue
+        if r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            found.append(f"{r['path']}: p95 {old['p95_ms']:.0f}ms -> {r['p95_ms']:.0f}ms")
+        if r["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            found.append(f"{r['path']}: throughput {old['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} req/s")
+        if r["error_rate"] + r["fallback_rate"] > old["error_rate"] + old["fallback_rate"] + tolerance / 10:
+            found.append(f"{r['path']}: error+fallback rate {old['error_rate'] + old['fallback_rate']:.1%} -> "
+                         f"{r['error_rate'] + r['fallback_rate']:.1%}")
+    return found
+
+
+async def run_paths(args, chain, questions, paths, base):
+    results = []
+    if "invoke" in paths:
+        results.append(await replay("invoke", lambda q: ask_invoke(chain, q), questions, args.concurrency, base))
+    if "stream" in paths:
+        results.append(await replay("stream", lambda q: ask_stream(chain, q), questions, args.concurrency, base))
+    if "gap" in paths:
+        # Sections of one upload through the fair scheduler, as in analyze_document_for_compliance
+        scheduler = get_gap_scheduler()
+
+        async def section(data):
+            slot = scheduler.slot("bench", "replay")
+            _, result, _, _ = await run_gap(data["chunk"], data["page"], chain, slot, data["page"], data["section_title"])
+            return result["result"] == FALLBACK_MESSAGE, None
+
+        results.append(await replay("gap", section, synthetic_sections(args.sections), args.sections, base))
+    return results
+
+
+async def main(args):
+    process, base = spawn(args.ttft_ms, args.tokens, args.token_ms, args.error_rate)
+    try:
+        chain = RAGChainWrapper(use_ai=True, use_retrieval=args.retrieval)
+        chain.chain.ai_assistant.url = base + PATH
+        questions, source = load_questions(args.logs, args.synthetic, args.requests, args.seed)
+        paths = args.paths.split(",")
+        print(f"🧪 Replaying {args.requests} requests ({source}) x {paths} at concurrency {args.concurrency} "
+              f"against {base} (TTFT {args.ttft_ms:.0f}ms, {args.tokens} tokens x {args.token_ms:.0f}ms, "
+              f"error rate {args.error_rate:.0%}, retrieval {'on' if args.retrieval else 'off'})")
+        # The chain's per-request log lines would drown the report
+        with open(os.devnull, "w") as devnull:
+            with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull):
+                results = await run_paths(args, chain, questions, paths, base)
+        await aclose_http_clients()
+    finally:
+        process.terminate()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"💾 Saved to {args.json}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"📉 Regression: {line}")
+        if found:
+            sys.exit(1)
+        print(f"✅ No regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", default="logs/conversations_*.jsonl", help="conversation logs to replay")
+    parser.add_argument("--synthetic", action="store_true", help="use the synthetic question set even if logs exist")
+    parser.add_argument("--paths", default="invoke,stream,gap", help="comma-separated: invoke, stream, gap")
+    parser.add_argument("--requests", type=int, default=200, help="questions replayed per path")
+    parser.add_argument("--sections", type=int, default=40, help="document sections for the gap path")
+    parser.add_argument("--concurrency", type=int, default=20, help="questions in flight at once")
+    parser.add_argument("--retrieval", action="store_true", help="retrieve from the local index (needs a built index)")
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub responses that are 503s")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--verbose", action="store_true", help="keep the chain's per-request log lines")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    asyncio.run(main(parser.parse_args()))
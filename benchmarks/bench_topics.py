@@ -0,0 +1,96 @@
+"""
+Benchmark the topic router on a large topic table: keyword scans over every topic (the old
+ESGKnowledgeBase approach, extended to N topics) vs one plain regex alternation vs the
+trie-factored regex used by app.topic_router.
+
+Usage:
+    python -m benchmarks.bench_topics --topics 2000 --aliases 5
+"""
+
+import argparse
+import json
+import random
+import re
+import string
+import time
+
+import numpy as np
+
+from app.topic_router import TOPICS_PATH, TopicRouter, _normalise
+
+QUESTIONS = [
+    "What is CSRD?",
+    "Explain the European Sustainability Reporting Standards for a textile company",
+    "How do I calculate scope 3 emissions under the GHG Protocol?",
+    "What are the working hours laws in Jordan?",
+    "Does Bangladesh mandate grievance redressal mechanisms?",
+    "Give maternity leave duration under Saudi ESG guidelines.",
+    "hello, who are you?",
+    "What audit disclosures are required by EU supply chain laws?",
+]
+
+
+def synthetic_topics(n, aliases_per_topic, seed=0):
+    """Regulation-like names, acronyms and article references"""
+    rng = random.Random(seed)
+    words = ["sustainability", "reporting", "disclosure", "directive", "regulation", "standard", "climate",
+             "labour", "supply", "chain", "due", "diligence", "emissions", "governance", "social", "water",
+             "biodiversity", "human", "rights", "transparency", "taxonomy", "finance", "energy", "waste"]
+    topics = []
+    for i in range(n):
+        aliases = [
+            "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 6))),
+            f"Regulation (EU) {rng.randint(2000, 2024)}/{rng.randint(100, 9999)}",
+        ]
+        while len(aliases) < aliases_per_topic:
+            aliases.append(" ".join(rng.choice(words) for _ in range(rng.randint(2, 5))) + f" {i}")
+        topics.append({"id": f"synthetic_{i}", "name": aliases[0], "aliases": aliases, "answer": ""})
+    return topics
+
+
+def keyword_scan(topics):
+    """The old approach: lowercase, then `any(alias in question)` topic by topic"""
+    table = [(topic["id"], [_normalise(a) for a in topic["aliases"]]) for topic in topics]
+
+    def match(question):
+        question_lower = question.lower()
+        for topic_id, aliases in table:
+            if any(alias in question_lower for alias in aliases):
+                return topic_id
+        return None
+    return match
+
+
+def plain_alternation(topics):
+    aliases = sorted({_normalise(a) for topic in topics for a in topic["aliases"]}, key=len, reverse=True)
+    pattern = re.compile(r"(?<!\w)(?:" + "|".join(re.escape(a) for a in aliases) + r")(?!\w)", re.IGNORECASE)
+    return lambda question: pattern.search(question)
+
+
+def bench(label, build):
+    start = time.perf_counter()
+    match = build()
+    build_ms = (time.perf_counter() - start) * 1000
+    latencies = []
+    for _ in range(200):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            match(question)
+            latencies.append((time.perf_counter() - start) * 1e6)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{label:<28} build {build_ms:8.1f}ms | per question p50 {p50:8.1f}µs  p95 {p95:8.1f}µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=2000, help="synthetic topics added to app/data/topics.json")
+    parser.add_argument("--aliases", type=int, default=5, help="aliases per synthetic topic")
+    args = parser.parse_args()
+
+    with open(TOPICS_PATH, "r", encoding="utf-8") as f:
+        topics = json.load(f)["topics"] + synthetic_topics(args.topics, args.aliases)
+    print(f"📚 {len(topics)} topics, {sum(len(t['aliases']) for t in topics)} aliases, {len(QUESTIONS)} questions")
+
+    bench("keyword scan (legacy)", lambda: keyword_scan(topics))
+    bench("plain regex alternation", lambda: plain_alternation(topics))
+    bench("trie regex (TopicRouter)", lambda: TopicRouter(topics).match)
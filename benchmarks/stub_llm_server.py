@@ -0,0 +1,162 @@
+"""
+Local stub of the Fireworks chat-completions API for offline benchmarks.
+Answers POST /inference/v1/chat/completions with canned text after a configurable delay, as one JSON
+body or as an SSE stream ("stream": true), over HTTP/1.1 keep-alive. Counts connections and requests (GET /stats).
+
+Usage:
+    python -m benchmarks.stub_llm_server --port 8765 --ttft-ms 300 --tokens 200 --token-ms 10
+    FIREWORKS_API_URL=http://127.0.0.1:8765/inference/v1/chat/completions FIREWORKS_API_KEY=stub chainlit run ...
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATH = "/inference/v1/chat/completions"
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many sessions connect at once; the default backlog of 5 would add SYN-retry delays
+    request_queue_size = 256
+
+    def __init__(self, port=0, ttft_ms=300, tokens=200, token_ms=10, error_rate=0.0, error_status=503):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.ttft_ms = ttft_ms
+        self.tokens = tokens
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stats = {"connections": 0, "requests": 0, "streams": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}{PATH}"
+
+    def count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def start(self):
+        """Serve in a daemon thread; returns self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def spawn(ttft_ms=300, tokens=200, token_ms=10, error_rate=0.0, error_status=503):
+    """
+    Run the stub in its own process (so it does not compete with the client under test for the GIL).
+    Returns (process, base URL) once it answers; terminate the process when done.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, "-m", "benchmarks.stub_llm_server", "--port", str(port),
+                                "--ttft-ms", str(ttft_ms), "--tokens", str(tokens), "--token-ms", str(token_ms),
+                                "--error-rate", str(error_rate), "--error-status", str(error_status)],
+                               stdout=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{base}/stats", timeout=1).close()
+            return process, base
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Stub LLM server did not start")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        data = data.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path != "/stats":
+            return self._send(404, json.dumps({"error": "not found"}))
+        with self.server._stats_lock:
+            return self._send(200, json.dumps(self.server.stats))
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server.count("requests")
+        if self.path != PATH:
+            return self._send(404, json.dumps({"error": "not found"}))
+        if server.error_rate and random.random() < server.error_rate:
+            server.count("errors")
+            return self._send(server.error_status, json.dumps({"error": "stub failure"}))
+
+        n_tokens = min(server.tokens, int(payload.get("max_tokens") or server.tokens))
+        words = [f"word{i} " for i in range(n_tokens)]
+        time.sleep(server.ttft_ms / 1000)
+        if not payload.get("stream"):
+            time.sleep(n_tokens * server.token_ms / 1000)
+            content = "".join(words)
+            return self._send(200, json.dumps({
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(json.dumps(payload)) // 4, "completion_tokens": n_tokens},
+            }))
+
+        server.count("streams")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for word in words:
+                event = {"choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                self._chunk(f"data: {json.dumps(event)}\n\n")
+                time.sleep(server.token_ms / 1000)
+            self._chunk("data: [DONE]\n\n")
+            self._chunk("")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            self.close_connection = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="delay before the first token")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per answer (capped by max_tokens)")
+    parser.add_argument("--token-ms", type=float, default=10, help="delay per token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.port, args.ttft_ms, args.tokens, args.token_ms, args.error_rate, args.error_status)
+    print(f"🧪 Stub LLM server on {server.url} (TTFT {args.ttft_ms:.0f}ms, {args.tokens} tokens x {args.token_ms:.0f}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"📊 {server.stats}")
@@ -6,15 +6,25 @@ from langchain_community.document_loaders import (
     CSVLoader
 )
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter  # Fixed import
 import glob
 
-def load_documents(data_dir="data/raw_docs"):
-    """Load all documents from the data directory."""
-    documents = []
-    
-    # Check if directory exists
+from app.index_writer import StreamingIndexWriter
+from app.manifest import IndexManifest
+from app.vector_store import VectorStore
+
+SOURCE_EXTENSIONS = ("pdf", "txt", "docx", "csv", "md")
+
+def list_source_files(data_dir="data/raw_docs"):
+    """All loadable files under data_dir."""
+    ensure_data_dir(data_dir)
+    files = []
+    for ext in SOURCE_EXTENSIONS:
+        files.extend(glob.glob(os.path.join(data_dir, f"**/*.{ext}"), recursive=True))
+    return sorted(files)
+
+def ensure_data_dir(data_dir="data/raw_docs"):
+    """Create the data directory with a sample document if it does not exist."""
     if not os.path.exists(data_dir):
         print(f"❌ Directory {data_dir} does not exist!")
         print(f"Creating directory and adding sample document...")
@@ -42,9 +52,18 @@ Governance:
 - Ethical business practices
 """)
         print(f"✅ Created sample document: {sample_file}")
+
+def load_documents(data_dir="data/raw_docs", only=None):
+    """Load all documents from the data directory (or just the files in `only`)."""
+    documents = []
+    
+    # Check if directory exists
+    ensure_data_dir(data_dir)
     
     # Load PDF files
     pdf_files = glob.glob(os.path.join(data_dir, "**/*.pdf"), recursive=True)
+    if only is not None:
+        pdf_files = [f for f in pdf_files if f in only]
     for pdf_file in pdf_files:
         try:
             loader = PyPDFLoader(pdf_file)
@@ -55,6 +74,8 @@ Governance:
     
     # Load text files
     txt_files = glob.glob(os.path.join(data_dir, "**/*.txt"), recursive=True)
+    if only is not None:
+        txt_files = [f for f in txt_files if f in only]
     for txt_file in txt_files:
         try:
             loader = TextLoader(txt_file, encoding="utf-8")
@@ -65,6 +86,8 @@ Governance:
     
     # Load Word documents
     doc_files = glob.glob(os.path.join(data_dir, "**/*.docx"), recursive=True)
+    if only is not None:
+        doc_files = [f for f in doc_files if f in only]
     for doc_file in doc_files:
         try:
             loader = UnstructuredWordDocumentLoader(doc_file)
@@ -75,6 +98,8 @@ Governance:
     
     # Load CSV files
     csv_files = glob.glob(os.path.join(data_dir, "**/*.csv"), recursive=True)
+    if only is not None:
+        csv_files = [f for f in csv_files if f in only]
     for csv_file in csv_files:
         try:
             loader = CSVLoader(csv_file, encoding="utf-8")
@@ -85,6 +110,8 @@ Governance:
     
     # Load Markdown files
     md_files = glob.glob(os.path.join(data_dir, "**/*.md"), recursive=True)
+    if only is not None:
+        md_files = [f for f in md_files if f in only]
     for md_file in md_files:
         try:
             loader = TextLoader(md_file, encoding="utf-8")
@@ -99,19 +126,34 @@ def build_vector_store(
     data_dir="data/raw_docs",
     output_dir="vector_store/faiss_index",
     chunk_size=1000,
-    chunk_overlap=200
+    chunk_overlap=200,
+    full_rebuild=False,
+    index_spec=None
 ):
-    """Build FAISS vector store from documents."""
+    """Build FAISS vector store from documents (incrementally, using the index manifest)."""
     
     print("\n" + "="*50)
     print("Building FAISS Vector Store")
     print("="*50 + "\n")
     
+    # Work out what changed since the last build
+    manifest = IndexManifest(output_dir)
+    if full_rebuild or not VectorStore.exists(output_dir):
+        manifest.reset()
+    source_files = list_source_files(data_dir)
+    to_index, unchanged, deleted = manifest.diff(source_files)
+    print(f"🗂️ Manifest: {len(to_index)} new/changed, {len(unchanged)} unchanged, {len(deleted)} deleted")
+    
+    if not to_index and not deleted and source_files:
+        print("✅ Vector store is up to date - nothing to rebuild.")
+        manifest.save()
+        return
+    
     # Load documents
     print("📂 Loading documents...")
-    documents = load_documents(data_dir)
+    documents = load_documents(data_dir, only=set(to_index))
     
-    if not documents:
+    if not documents and not deleted:
         print("❌ No documents found! Please add documents to the data/raw_docs directory.")
         return
     
@@ -136,20 +178,41 @@ def build_vector_store(
     print("\n🔢 Creating embeddings (this may take a while)...")
     embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
     
-    # Create FAISS vector store
+    # Create / update the vector store
     print("🏗️ Building FAISS index...")
-    vectorstore = FAISS.from_documents(texts, embedding_model)
+    writer = StreamingIndexWriter(embedding_model, output_dir, append=bool(manifest.files), index_spec=index_spec)
+    stale_ids = manifest.ids_for(to_index + deleted)
+    if stale_ids:
+        writer.delete(stale_ids)
+        print(f"🧹 Removed {len(stale_ids)} stale vectors")
+    ids = writer.add_documents(texts)
+    
+    # Record which vectors each source file produced
+    ids_by_source = {}
+    for text, vector_id in zip(texts, ids):
+        ids_by_source.setdefault(text.metadata.get("source"), []).append(vector_id)
+    # Files whose loader failed are left out of the manifest, so the next build retries them
+    loaded = {doc.metadata.get("source") for doc in documents}
+    for filepath in deleted:
+        manifest.forget(filepath)
+    for filepath in to_index:
+        if filepath in loaded:
+            manifest.record(filepath, ids_by_source.get(filepath, []))
+        else:
+            manifest.forget(filepath)
+            print(f"⚠️ {filepath} could not be loaded - it will be retried on the next build")
     
     # Save to disk
     print(f"\n💾 Saving vector store to {output_dir}...")
-    os.makedirs(output_dir, exist_ok=True)
-    vectorstore.save_local(output_dir)
+    writer.save()
+    total = writer.store.ntotal
+    manifest.save()
     
     print("\n" + "="*50)
     print("✅ Vector store built successfully!")
     print("="*50)
     print(f"\nLocation: {os.path.abspath(output_dir)}")
-    print(f"Total chunks indexed: {len(texts)}")
+    print(f"Chunks indexed this run: {len(texts)} (total in store: {total})")
     print("\nYou can now run your application with: python asgi_app.py")
 
 if __name__ == "__main__":
@@ -1,6 +1,10 @@
 import chainlit as cl
-from app.rag_chain import load_rag_chain, load_gap_analysis_chain
+from app.chain_registry import get_rag_chain, get_gap_chain
+from app.rag_chain import STREAM_ANSWERS
+from app.metrics import histogram
+import asyncio
 import os
+import time
 from collections import defaultdict
 from typing import Dict, Optional
 import json
@@ -10,6 +14,12 @@ from urllib.parse import quote
 import re
 
 MAX_CHARS = 2000
+# Post each section's gap findings as it completes (PROGRESSIVE_GAP_ANALYSIS=0 waits for the full report)
+PROGRESSIVE_GAP_ANALYSIS = os.getenv("PROGRESSIVE_GAP_ANALYSIS", "1") == "1"
+# Minimum seconds between two progress message updates
+PROGRESS_UPDATE_S = 0.5
+
+MESSAGE_LATENCY = histogram("chat_message_seconds", "End-to-end on_message latency by mode (stream / invoke / file) and outcome")
 
 def split_text(text, max_chars=MAX_CHARS):
     return [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
@@ -32,6 +42,85 @@ def log_conversation(query: str, response: str, sources: list, user_name: str, e
     with open(log_file, "a", encoding="utf-8") as f:
         f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
 
+def clean_answer(answer: str) -> str:
+    pattern = r"(?:\*\*why this is correct\*\*|why this is correct):?"
+    answer = re.sub(pattern, " ", answer, flags=re.IGNORECASE)
+
+    pattern = r"(?:\*\*follow-up questions\*\*|follow-up questions):?"
+    return re.sub(pattern, " ", answer, flags=re.IGNORECASE)
+
+async def stream_to_message(answer_stream, msg: cl.Message) -> str:
+    """Relay an AnswerStream into msg token by token"""
+    tokens = answer_stream.__aiter__()
+    try:
+        async for token in tokens:
+            await msg.stream_token(token)
+    finally:
+        # Stop button / disconnect cancels this task: close the upstream stream instead of reading it to the end
+        await tokens.aclose()
+
+    # The final text replaces what was streamed: cleaned up, or the fallback after a failed stream
+    answer = clean_answer(answer_stream.answer).strip()
+    msg.content = answer
+    await msg.send()
+    return answer
+
+def progress_bar(done, total, width=10):
+    filled = round(width * done / total) if total else width
+    return "▓" * filled + "░" * (width - filled)
+
+async def analyze_with_progress(file_path, file_name, gap_chain, user=""):
+    """Gap analysis posting each section's findings as soon as it completes, under a live progress message"""
+    from app.file_analysis import analyze_document_for_compliance, clean_output, extract_confidence
+
+    progress = cl.Message(content=f"📄 Received file: `{file_name}`. Analyzing...")
+    await progress.send()
+    found = reused = 0
+    last_update = 0.0
+    from_cache = False
+
+    async def on_section(finding, done, total):
+        nonlocal found, reused, last_update
+        reused += finding.get("cached", False)
+        if finding["analysis"]:
+            found += 1
+            await cl.Message(
+                content=f"**📄 Page {finding['page']} — {finding['section_title']}** "
+                        f"(confidence: {extract_confidence(finding['analysis'])})\n\n{clean_output(finding['analysis'])}"
+            ).send()
+        # Throttled: a 300-page upload would otherwise update the message hundreds of times
+        if done == total or time.perf_counter() - last_update >= PROGRESS_UPDATE_S:
+            last_update = time.perf_counter()
+            progress.content = (f"📄 Analyzing `{file_name}`: {progress_bar(done, total)} {done}/{total} sections "
+                                f"({found} with findings" + (f", {reused} unchanged since an earlier upload" if reused else "") + ")")
+            await progress.update()
+
+    async def on_stage(stage, sections):
+        nonlocal from_cache
+        if stage == "cached":
+            from_cache = True
+            return
+        if stage == "summaries":
+            progress.content = f"🧾 All sections of `{file_name}` analysed ({sections} with findings). Consolidating..."
+        else:
+            progress.content = f"🧾 Writing the consolidated report for `{file_name}`..."
+        await progress.update()
+
+    result = await analyze_document_for_compliance(file_path, gap_chain, on_section, on_stage, user)
+    if from_cache:
+        progress.content = f"♻️ `{file_name}` is identical to an earlier upload. Its consolidated report is below."
+    else:
+        progress.content = (f"✅ Analysis of `{file_name}` complete: {found} sections with findings"
+                            + (f" ({reused} reused from earlier uploads)" if reused else "") + ". Consolidated report below.")
+    await progress.update()
+    return result
+
+def cancel_active_stream():
+    answer_stream = cl.user_session.get("answer_stream")
+    if answer_stream is not None:
+        answer_stream.cancel()
+        cl.user_session.set("answer_stream", None)
+
 @cl.oauth_callback
 def oauth_callback(
   provider_id: str,
@@ -77,9 +166,8 @@ def oauth_callback(
 
 @cl.on_chat_resume
 async def on_chat_resume(thread: cl.types.ThreadDict):
+    # Only per-session state here; chains are shared via app.chain_registry
     cl.user_session.set("chat_history", [])
-    cl.user_session.set("rag_chain", load_rag_chain())
-    cl.user_session.set("gap_chain", load_gap_analysis_chain())
 
     # Load previous conversation history if it exists
     conversation_history = cl.user_session.get("conversation_history", [])
@@ -111,11 +199,9 @@ async def on_chat_start():
     user_email = app_user.identifier.lower().strip()
     print(f"👤 User email: {user_email}")
     
-    # Initialize chains with AI enabled
+    # Per-session state only - the AI chains are process-wide (app.chain_registry)
     cl.user_session.set("chat_history", [])
     cl.user_session.set("conversation_history", [])
-    cl.user_session.set("rag_chain", load_rag_chain(use_ai=True))  # ✅ AI enabled
-    cl.user_session.set("gap_chain", load_gap_analysis_chain(use_ai=True))
 
     # Check profile
     profile_exists = user_exists(user_email)
@@ -196,8 +282,19 @@ Your profile for **{org_name}** is ready.
     print("=" * 50)
 
 
+@cl.on_stop
+async def on_stop():
+    cancel_active_stream()
+
+@cl.on_chat_end
+async def on_chat_end():
+    # The user disconnected - don't keep reading an answer nobody will see
+    cancel_active_stream()
+
+
 @cl.on_message
 async def on_message(message: cl.Message):
+    start = time.perf_counter()
     user = cl.user_session.get("user")
     
     # Handle profile completion flow
@@ -250,39 +347,68 @@ async def on_message(message: cl.Message):
     # Handle normal messages
     chat_history = cl.user_session.get("chat_history")
     conversation_history = cl.user_session.get("conversation_history", [])
-    qa = cl.user_session.get("rag_chain")
-    gap_chain = cl.user_session.get("gap_chain")
-    
-    if qa is None:
-        qa = load_rag_chain(use_ai=True)
-        cl.user_session.set("rag_chain", qa)
-    
-    if gap_chain is None:
-        gap_chain = load_gap_analysis_chain(use_ai=True)
-        cl.user_session.set("gap_chain", gap_chain)
+    qa = get_rag_chain()
+    gap_chain = get_gap_chain()
 
     # Handle file uploads
     if message.elements:
+        # Gap analysis slots are shared fairly between users
+        uploader = user.identifier if user else ""
         for element in message.elements:
             if element.type == "file":
                 file_path = element.path
                 file_name = element.name
-                await cl.Message(content=f"📄 Received file: `{file_name}`. Analyzing...").send()
+                if PROGRESSIVE_GAP_ANALYSIS:
+                    result = await analyze_with_progress(file_path, file_name, gap_chain, uploader)
+                else:
+                    await cl.Message(content=f"📄 Received file: `{file_name}`. Analyzing...").send()
 
-                from app.file_analysis import analyze_document_for_compliance
-                result = await analyze_document_for_compliance(file_path, gap_chain)
+                    from app.file_analysis import analyze_document_for_compliance
+                    result = await analyze_document_for_compliance(file_path, gap_chain, user=uploader)
                 await cl.Message(content=result).send()
+                MESSAGE_LATENCY.observe(time.perf_counter() - start, mode="file", outcome="ok")
                 return
 
     conversation_history.append(f"User: {message.content}")
     chat_history.append({"role": "user", "content": message.content})
 
+    mode = "stream" if STREAM_ANSWERS and hasattr(qa, 'astream') else "invoke"
+    outcome = "error"
     try:
         print(f"🔍 Processing query: {message.content}")
         
-        # Get response from RAG chain
-        if hasattr(qa, 'invoke'):
-            result = qa.invoke(message.content)
+        if mode == "stream":
+            # Tokens are shown as they are generated instead of after the full answer
+            result = await qa.astream(message.content)
+            sources = result.get("source_documents", [])
+            answer_stream = result["result"]
+            cl.user_session.set("answer_stream", answer_stream)
+            try:
+                answer = await stream_to_message(answer_stream, cl.Message(content=""))
+            finally:
+                cl.user_session.set("answer_stream", None)
+            if answer_stream.cancelled:
+                outcome = "cancelled"
+                return
+
+            chat_history.append({"role": "assistant", "content": answer})
+            conversation_history.append(f"Assistant: {answer}")
+            if user:
+                log_conversation(
+                    query=message.content,
+                    response=answer,
+                    sources=[getattr(s, 'metadata', {}).get("source", "") for s in sources],
+                    user_name=user.display_name,
+                    email=user.identifier
+                )
+            outcome = "ok"
+            return
+
+        # Get response from RAG chain (without blocking the event loop for other sessions)
+        if hasattr(qa, 'ainvoke'):
+            result = await qa.ainvoke(message.content)
+        elif hasattr(qa, 'invoke'):
+            result = await cl.make_async(qa.invoke)(message.content)
         else:
             result = qa(message.content)
         
@@ -297,11 +423,7 @@ async def on_message(message: cl.Message):
             sources = []
         
         # Clean up response
-        pattern = r"(?:\*\*why this is correct\*\*|why this is correct):?"
-        answer = re.sub(pattern, " ", answer, flags=re.IGNORECASE)
-
-        pattern = r"(?:\*\*follow-up questions\*\*|follow-up questions):?"
-        answer = re.sub(pattern, " ", answer, flags=re.IGNORECASE)
+        answer = clean_answer(answer)
 
         chat_history.append({"role": "assistant", "content": answer})
         conversation_history.append(f"Assistant: {answer}")
@@ -318,9 +440,16 @@ async def on_message(message: cl.Message):
                 user_name=user.display_name,
                 email=user.identifier
             )
+        outcome = "ok"
 
+    except asyncio.CancelledError:
+        # Stop button / disconnect
+        outcome = "cancelled"
+        raise
     except Exception as e:
         print(f"❌ Error processing message: {e}")
         import traceback
         traceback.print_exc()
-        await cl.Message(content=f"❌ Sorry, I encountered an error. Please try again or rephrase your question.").send()
\ No newline at end of file
+        await cl.Message(content=f"❌ Sorry, I encountered an error. Please try again or rephrase your question.").send()
+    finally:
+        MESSAGE_LATENCY.observe(time.perf_counter() - start, mode=mode, outcome=outcome)
\ No newline at end of file